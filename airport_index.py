@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Offline airport search by location (replaces the AeroDataBox location search).
+
+Usage:
+    find_airports(latitude, longitude, radius_km=RADIUS_KM, limit=LIMIT)
+        -> Airports with scheduled service within radius_km, nearest first.
+           Same columns as the API-search (iata, name, location.lat,
+           location.lon) plus distance_km. Empty if there is none.
+
+    build_reference(source)
+        -> Rebuilds data/airports.csv.gz from the airports.csv of OurAirports,
+           e.g. build_reference('https://davidmegginson.github.io/ourairports-data/airports.csv')
+
+Notes:
+    data/airports.csv.gz holds all airports of OurAirports (public domain) with
+    an IATA-code and scheduled service (about 4000 airports).
+    The index is built once per instance: airports as points on the unit
+    sphere in a KD-tree, so a radius query on the great circle becomes a
+    query on the chord length (2*sin(d/2R)). Distances are haversine.
+    Cities without an airport in the reference are searched with the API
+    (see get_flightsdata.get_airports).
+
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+# ---
+import app_context as ctx
+
+
+# Bundled reference data
+REFERENCE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'data', 'airports.csv.gz')
+# Search radius and max. airports per city (as in the API-search)
+RADIUS_KM = 75
+LIMIT = 1
+# Mean earth radius
+EARTH_RADIUS_KM = 6371.0088
+
+
+# =============================================================================
+# HAVERSINE DISTANCE IN KM
+# =============================================================================
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2-lat1)/2)**2
+         + np.cos(lat1)*np.cos(lat2)*np.sin((lon2-lon1)/2)**2)
+    return 2*EARTH_RADIUS_KM*np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def to_unit_vectors(latitude, longitude):
+    lat, lon = np.radians(latitude), np.radians(longitude)
+    return np.column_stack([np.cos(lat)*np.cos(lon),
+                            np.cos(lat)*np.sin(lon),
+                            np.sin(lat)])
+
+
+# =============================================================================
+# LOAD REFERENCE AND BUILD INDEX (ONCE PER INSTANCE)
+# =============================================================================
+def load_index():
+    airports = pd.read_csv(REFERENCE, keep_default_na=False, na_values=[''])
+    tree = cKDTree(to_unit_vectors(airports['latitude'].to_numpy(),
+                                   airports['longitude'].to_numpy()))
+    print(f"Airport index built ({airports.shape[0]} airports).")
+    return airports, tree
+
+
+# =============================================================================
+# AIRPORTS WITHIN RADIUS
+# =============================================================================
+def find_airports(latitude, longitude, radius_km=RADIUS_KM, limit=LIMIT):
+    airports, tree = ctx.get_reference('airport_index', load_index)
+    chord = 2*np.sin(radius_km/(2*EARTH_RADIUS_KM))
+    found = np.asarray(tree.query_ball_point(
+        to_unit_vectors(float(latitude), float(longitude))[0], chord), dtype=int)
+    lat = airports['latitude'].to_numpy()[found]
+    lon = airports['longitude'].to_numpy()[found]
+    iata = airports['iata'].to_numpy()[found]
+    distance = haversine_km(float(latitude), float(longitude), lat, lon)
+    # Nearest first (IATA-code on equal distance)
+    order = np.lexsort((iata, distance))[:limit]
+    return pd.DataFrame({'iata':iata[order],
+                         'name':airports['name'].to_numpy()[found][order],
+                         'location.lat':lat[order],
+                         'location.lon':lon[order],
+                         'distance_km':distance[order]})
+
+
+# =============================================================================
+# REBUILD REFERENCE FROM OURAIRPORTS
+# =============================================================================
+def build_reference(source, path=REFERENCE):
+    df = pd.read_csv(source, keep_default_na=False, na_values=[''])
+    df = df[df['iata_code'].notna() & (df['scheduled_service']=='yes')
+            & (df['type']!='closed')]
+    # Codes used twice: keep the larger airport
+    rank = df['type'].map({'large_airport':0,'medium_airport':1,'small_airport':2})
+    df = (df.assign(rank=rank.fillna(3))
+          .sort_values(['iata_code','rank'])
+          .drop_duplicates('iata_code'))
+    df = (df.rename(columns={'iata_code':'iata',
+                             'iso_country':'country',
+                             'latitude_deg':'latitude',
+                             'longitude_deg':'longitude'})
+          [['iata','name','municipality','country','type','latitude','longitude']])
+    df.to_csv(path, index=False, compression={'method':'gzip','mtime':0})
+    ctx.invalidate('airport_index')
+    print(f"Airport reference written: {df.shape[0]} airports.")
+    return df
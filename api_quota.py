@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Usage-ledger and call-planner for metered APIs (AeroDataBox).
+
+Usage:
+    record_call(api, endpoint, response, error=False)
+        -> Count a request (call after every requests.get to the API).
+           A 429-response marks the API as exhausted for the rest of the run.
+           error=True counts a request that failed without response.
+    allow_call(api)
+        -> False once the budget of the current run is spent (or exhausted).
+    reset()
+        -> Starts a run: drops budget and exhaustion of the last run. Call at
+           the beginning of every run (update_database, backfill), a warm
+           instance keeps the module state between invocations.
+    flush_ledger(con)
+        -> Add counted calls to table api_usage (calls per endpoint per day).
+
+    get_run_budget(con, api)
+        -> Calls this run may spend: remaining quota of the month spread
+           evenly over the remaining days (minus calls already made today).
+    get_month_remaining(con, api)
+        -> Calls left in the current month (budget of backfills).
+    plan_flight_windows(airports, coverage, windows, budget)
+        -> Set of (iata, window) to fetch. Uncovered near-term windows of
+           high-priority airports first, refreshes of covered windows last.
+
+Notes:
+    Quotas per API are set in QUOTAS and can be overridden by an environment
+    variable (e.g. AERODATABOX_MONTHLY_QUOTA=1200).
+
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+
+# =============================================================================
+# QUOTAS (CALLS PER MONTH OF THE SUBSCRIBED PLAN)
+# =============================================================================
+QUOTAS = {
+    'aerodatabox': int(os.environ.get('AERODATABOX_MONTHLY_QUOTA', 3000)),
+}
+
+# Scheduled runs per day (Cloud Scheduler, hourly: stages that are due by
+# their refresh policy run, see db_refresh.py)
+RUNS_PER_DAY = 24
+
+# --- IN-RUN STATE (reset() at the start of every run)
+# Calls not yet written to the ledger {(api, endpoint): [calls, errors]}
+_pending = {}
+# Calls left in this run {api: calls} (no entry = unlimited)
+_budget = {}
+# APIs that answered with "quota exceeded" in this run
+_exhausted = set()
+
+
+# =============================================================================
+# COUNT A REQUEST
+# =============================================================================
+def record_call(api, endpoint, response=None, error=False):
+    counts = _pending.setdefault((api, endpoint), [0, 0])
+    counts[0] += 1
+    if api in _budget:
+        _budget[api] -= 1
+    if error:
+        counts[1] += 1
+    elif response is not None and response.status_code!=200:
+        counts[1] += 1
+        # Quota exceeded -> no further calls in this run
+        if response.status_code==429:
+            print(f"---! {api}: quota exceeded, skipping further calls !---")
+            _exhausted.add(api)
+
+
+# =============================================================================
+# MAY THE API BE CALLED (ONE MORE TIME) IN THIS RUN?
+# =============================================================================
+def allow_call(api):
+    if api in _exhausted:
+        return False
+    return _budget.get(api, 1)>0
+
+
+# =============================================================================
+# SET / RESET BUDGET OF THE CURRENT RUN
+# =============================================================================
+def set_budget(api, calls):
+    _budget[api] = calls
+    print(f"Budget for {api} in this run: {calls} calls.")
+
+
+def reset():
+    # Calls not flushed by an aborted run are kept for the ledger
+    _budget.clear()
+    _exhausted.clear()
+
+
+# =============================================================================
+# WRITE COUNTED CALLS TO THE LEDGER
+# =============================================================================
+def flush_ledger(con, day=None):
+    if len(_pending)==0:
+        return
+    day = day or pd.Timestamp.utcnow().date()
+    rows = [{'api':api, 'endpoint':endpoint, 'uday':day,
+             'calls':calls, 'errors':errors}
+            for (api, endpoint), (calls, errors) in _pending.items()]
+    with con.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO api_usage (api, endpoint, uday, calls, errors)
+            VALUES (:api, :endpoint, :uday, :calls, :errors)
+            ON DUPLICATE KEY UPDATE
+                calls = calls + VALUES(calls), errors = errors + VALUES(errors)
+            """), rows)
+    _pending.clear()
+
+
+# =============================================================================
+# CALLS LEFT FOR THIS RUN
+# =============================================================================
+def get_run_budget(con, api, now=None):
+    now = now or pd.Timestamp.utcnow().tz_localize(None)
+    month = now.to_period('M')
+    usage = pd.read_sql(text("""
+        SELECT uday, SUM(calls) AS calls FROM api_usage
+        WHERE api = :api AND uday >= :t0
+        GROUP BY uday
+        """), con=con, params={'api':api, 't0':month.start_time.date()})
+    used_month = int(usage['calls'].sum())
+    used_today = int(usage.loc[pd.to_datetime(usage['uday'])==now.normalize(),
+                               'calls'].sum())
+    # --- SPREAD REMAINING QUOTA EVENLY OVER THE REMAINING DAYS
+    days_left = month.days_in_month - now.day + 1
+    remaining = QUOTAS[api] - used_month + used_today
+    per_day = remaining/days_left
+    # Share of today's calls up to (and including) the current run
+    runs_done = 1 + (now.hour*RUNS_PER_DAY)//24
+    budget = int(np.floor(per_day/RUNS_PER_DAY*runs_done) - used_today)
+    print(f"{api}: {used_month}/{QUOTAS[api]} calls used this month, "
+          f"{used_today} today.")
+    return max(budget, 0)
+
+
+# =============================================================================
+# CALLS LEFT IN THE CURRENT MONTH
+# =============================================================================
+def get_month_remaining(con, api, now=None):
+    now = now or pd.Timestamp.utcnow().tz_localize(None)
+    used = pd.read_sql(text("""
+        SELECT COALESCE(SUM(calls), 0) AS calls FROM api_usage
+        WHERE api = :api AND uday >= :t0
+        """), con=con, params={'api':api,
+                                't0':now.to_period('M').start_time.date()})
+    remaining = QUOTAS[api] - int(used['calls'].iloc[0])
+    print(f"{api}: {remaining} of {QUOTAS[api]} calls left this month.")
+    return max(remaining, 0)
+
+
+# =============================================================================
+# STORED FLIGHTS PER AIRPORT (FRESHNESS AND PRIORITY FOR THE PLANNER)
+# covered: latest stored scheduled_time
+# recent:  flights of the last 7 days (busy airports first)
+# =============================================================================
+def get_flight_coverage(con, now=None):
+    now = now or pd.Timestamp.utcnow().tz_localize(None)
+    return pd.read_sql(text("""
+        SELECT iata, MAX(scheduled_time) AS covered,
+               SUM(scheduled_time >= :since) AS recent
+        FROM flights_fact
+        GROUP BY iata
+        """), con=con, params={'since':now-pd.Timedelta(days=7)},
+        parse_dates=['covered'])
+
+
+# =============================================================================
+# PLAN FLIGHT REQUESTS (ONE REQUEST = ONE AIRPORT AND ONE 12h-WINDOW)
+# airports: DataFrame with column 'iata' (optional 'priority', higher first)
+# coverage: DataFrame iata, covered (latest stored scheduled_time)
+# windows:  list of (t0, t1) of this run
+# Returns set of (iata, window-index)
+# =============================================================================
+def plan_flight_windows(airports, coverage, windows, budget):
+    units = (airports.drop_duplicates('iata')
+             .assign(priority=lambda df: df.get('priority', 1))
+             [['iata','priority']]
+             .merge(coverage[['iata','covered']], on='iata', how='left'))
+    units = units.merge(pd.DataFrame({'window':range(len(windows)),
+                                      't1':[w[1] for w in windows]}),
+                        how='cross')
+    # Window is fresh if flights up to its end are stored already
+    units['fresh'] = units['covered'].notna() & (units['covered']>=units['t1'])
+    # --- ORDER: UNCOVERED FIRST, NEAR-TERM FIRST, HIGH PRIORITY FIRST
+    units = units.sort_values(['fresh','window','priority','iata'],
+                              ascending=[True,True,False,True])
+    plan = units.head(max(budget,0))
+    skipped = units.shape[0]-plan.shape[0]
+    if skipped>0:
+        print(f"Budget allows {plan.shape[0]} of {units.shape[0]} flight-requests, "
+              f"skipping {skipped} ({int(units.tail(skipped)['fresh'].sum())} "
+              f"of them refreshes of stored windows).")
+    return set(zip(plan['iata'], plan['window']))
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Application context that lives as long as the Cloud Function instance.
+
+Usage:
+    get_secret(name)       -> API-key/password (get_keys is only asked once)
+    get_engine()           -> SQLAlchemy engine incl. connection pool
+    get_session(api)       -> requests.Session per API (keep-alive)
+    get_reference(name, loader)
+        -> Reference data (aircraft table, geocodes, airport searches).
+           loader() is only called if the entry is missing or older than
+           REFERENCE_TTL.
+
+    invalidate(part=None)
+        -> Drops cached objects, e.g. after a key rotation
+           (invalidate('secrets')) or manual changes to reference data
+           (invalidate('aircraftinfo')). Without argument everything is reset.
+    on_invalidate(part, func)
+        -> Registers a function that is called when part is invalidated
+           (e.g. the cache of db_dimensions).
+
+Notes:
+    Warm invocations of update_database reuse everything in here, so secrets,
+    engine, TLS-sessions and reference data are only set up on cold starts.
+
+"""
+
+import time
+import requests
+import sqlalchemy
+# ---
+from get_keys import get_keys
+
+
+# Max. age of reference data in seconds (can change, but rarely does)
+REFERENCE_TTL = 24*3600
+
+# Parts that can be invalidated
+PARTS = ['secrets','engine','sessions','reference']
+
+# --- INSTANCE STATE
+_secrets = {}
+_engine = {}
+_sessions = {}
+# {name: (loaded, value)}
+_reference = {}
+# {part: [func, ...]}
+_hooks = {}
+
+
+# =============================================================================
+# SECRETS
+# =============================================================================
+def get_secret(name):
+    if name not in _secrets:
+        _secrets[name] = get_keys(name)
+    return _secrets[name]
+
+
+# =============================================================================
+# DATABASE ENGINE (ONE CONNECTION POOL PER INSTANCE)
+# =============================================================================
+def get_engine():
+    if 'gans' not in _engine:
+        print("Connecting to SQL...")
+        connection_name = get_secret('mysql_gcp_con')
+        # db_user = "root"
+        db_user = get_secret('mysql_gcp_user')
+        db_password = get_secret('mysql_gcp')
+        schema_name = "gans"
+
+        driver_name = 'mysql+pymysql'
+        query_string = {"unix_socket": f"/cloudsql/{connection_name}"}
+
+        _engine['gans'] = sqlalchemy.create_engine(
+            sqlalchemy.engine.url.URL(
+                drivername = driver_name,
+                username = db_user,
+                password = db_password,
+                database = schema_name,
+                query = query_string,
+            ),
+            # Connections of an idle instance may be closed by Cloud SQL
+            pool_pre_ping = True,
+            # Bulk-load path of db_bulk.py (LOAD DATA LOCAL INFILE)
+            connect_args = {'local_infile':True},
+        )
+    return _engine['gans']
+
+
+# =============================================================================
+# HTTP-SESSIONS (REUSE TCP/TLS-CONNECTIONS PER API)
+# =============================================================================
+def get_session(api):
+    if api not in _sessions:
+        _sessions[api] = requests.Session()
+    return _sessions[api]
+
+
+# =============================================================================
+# REFERENCE DATA
+# =============================================================================
+def get_reference(name, loader):
+    entry = _reference.get(name)
+    if entry is None or time.time()-entry[0]>REFERENCE_TTL:
+        _reference[name] = (time.time(), loader())
+    return _reference[name][1]
+
+
+# =============================================================================
+# INVALIDATION
+# part: one of PARTS, a name of the reference data or None (everything)
+# =============================================================================
+def on_invalidate(part, func):
+    _hooks.setdefault(part, []).append(func)
+
+
+def invalidate(part=None):
+    parts = PARTS if part is None else [part]
+    for p in parts:
+        if p=='secrets':
+            _secrets.clear()
+        elif p=='engine':
+            for engine in _engine.values():
+                engine.dispose()
+            _engine.clear()
+        elif p=='sessions':
+            for session in _sessions.values():
+                session.close()
+            _sessions.clear()
+        elif p=='reference':
+            _reference.clear()
+        else:
+            _reference.pop(p, None)
+        for func in _hooks.get(p, []):
+            func()
+    print(f"Invalidated application context: {', '.join(parts)}")
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+Historical backfill for a date range and a set of cities/airports.
+
+Usage:
+    python backfill.py flights 2026-09-01 2026-10-01 Cologne Paris
+        -> Fetches past flights of all airports of the cities in 12h-windows
+    python backfill.py load 2026-09-01 2026-10-01
+        -> Recomputes customerload (e.g. after a model change) for all cities
+    python backfill.py flights 2026-09-01 2026-09-08 --iata CGN DUS --workers 2
+
+    run_backfill(con, stage, t0, t1, cities=None, iata=None, workers=WORKERS)
+        -> Same from Python (e.g. a Cloud Run job).
+
+Notes:
+    Work is split into tasks (one airport and 12h-window for flights, LOAD_DAYS
+    days for load) that run in a thread pool. Requests to the APIs are spaced
+    by RATE_LIMITS (calls per second) over all threads, AeroDataBox-calls
+    count against the monthly quota (see api_quota.py).
+    Results are written in bulk every BATCH_TASKS tasks: flights by row-hash
+    (only new/changed rows, see db_changes.py), load as multi-row upserts.
+    Windows that already contain flights are skipped (--refetch to disable).
+    A backfill holds the lease of its stage (see db_leases.py), so the
+    scheduled update_database skips that stage meanwhile. It waits up to
+    LEASE_WAIT_SECONDS for a running stage of update_database.
+    Weather has no history in the OpenWeatherMap forecast-API, load for past
+    days uses the weather stored in the database (weatherfac NaN otherwise).
+
+"""
+
+import sys
+import time
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from sqlalchemy import text, bindparam
+# ---
+import get_flightsdata as fd
+import get_loaddata as ld
+import db_schema as dbs
+import db_dimensions as dim
+import db_rollups as rollups
+import db_changes as chg
+import api_quota as quota
+import app_context as ctx
+import read_api as api
+import db_leases as lease
+
+
+# Parallel tasks
+WORKERS = 4
+# Max. calls per second per API (over all threads)
+RATE_LIMITS = {'aerodatabox':1.0}
+# Tasks per bulk write
+BATCH_TASKS = 50
+# Days per load-task
+LOAD_DAYS = 7
+# Seconds to wait for the stage-lease
+LEASE_WAIT_SECONDS = 600
+
+# --- RATE LIMITER STATE
+_lock = threading.Lock()
+_next_call = {}
+# The load model re-seeds the global random generator -> one thread at a time
+_model_lock = threading.Lock()
+
+
+# =============================================================================
+# WAIT FOR THE NEXT FREE SLOT OF AN API (THREAD-SAFE)
+# =============================================================================
+def throttle(api):
+    if api not in RATE_LIMITS:
+        return
+    with _lock:
+        now = time.monotonic()
+        slot = max(now, _next_call.get(api, now))
+        _next_call[api] = slot + 1/RATE_LIMITS[api]
+    time.sleep(max(slot-now, 0))
+
+
+# =============================================================================
+# PROGRESS AND THROUGHPUT
+# =============================================================================
+def report(done, total, rows, t_start):
+    elapsed = time.perf_counter()-t_start
+    rate = done/elapsed if elapsed>0 else 0
+    eta = (total-done)/rate if rate>0 else np.nan
+    print(f"[backfill] {done}/{total} tasks ({100*done/max(total,1):.0f}%), "
+          f"{rows} rows, {rate:.2f} tasks/s, {rows/max(elapsed,1e-9):.0f} rows/s, "
+          f"ETA {eta:.0f} s")
+
+
+# =============================================================================
+# RUN TASKS IN THE POOL, WRITE RESULTS IN BATCHES
+# task(args) returns a DataFrame, write(df) stores it and returns rows
+# =============================================================================
+def run_tasks(task, args, write, workers=WORKERS):
+    total = len(args)
+    print(f"[backfill] {total} tasks on {workers} workers...")
+    t_start = time.perf_counter()
+    done, rows, failed, batch = 0, 0, [], []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(task, a):a for a in args}
+        for future in as_completed(futures):
+            done += 1
+            try:
+                batch.append(future.result())
+            except Exception as e:
+                print(f"---! Task {futures[future]} failed: {e} !---")
+                failed.append(futures[future])
+            # Write every BATCH_TASKS tasks (and at the end)
+            if len(batch)>=BATCH_TASKS or done==total:
+                batch = [df for df in batch if df.shape[0]>0]
+                if len(batch)>0:
+                    rows += write(pd.concat(batch, ignore_index=True))
+                batch = []
+                report(done, total, rows, t_start)
+    if len(failed)>0:
+        print(f"[backfill] {len(failed)} task(s) failed: {failed}")
+    return rows, failed
+
+
+# =============================================================================
+# AIRPORTS OF THE SELECTED CITIES (OR GIVEN IATA-CODES)
+# =============================================================================
+def select_airports(con, cities=None, iata=None):
+    if iata:
+        return sorted(set(iata))
+    airports = dbs.read_table("airports", con=con)
+    if cities:
+        city_ids = dbs.read_table("cities", con=con).query("city in @cities")['city_id']
+        airports = airports[airports['city_id'].isin(city_ids)]
+    return sorted(airports['iata'].astype(object).unique())
+
+
+# =============================================================================
+# 12h-WINDOWS THAT ALREADY CONTAIN FLIGHTS
+# =============================================================================
+def get_covered_windows(con, airports, t0, t1):
+    query = (text("""
+        SELECT iata, FLOOR(TIMESTAMPDIFF(MINUTE, :t0, scheduled_time)/720) AS w
+        FROM flights_fact
+        WHERE scheduled_time >= :t0 AND scheduled_time < :t1 AND iata IN :iata
+        GROUP BY iata, w
+        """).bindparams(bindparam('iata', expanding=True)))
+    res = pd.read_sql(query, con=con,
+                      params={'t0':t0, 't1':t1, 'iata':list(airports)})
+    return set(zip(res['iata'], res['w'].astype(int)))
+
+
+# =============================================================================
+# FLIGHTS
+# =============================================================================
+def backfill_flights(con, t0, t1, cities=None, iata=None, workers=WORKERS,
+                     refetch=False):
+    airports = select_airports(con, cities, iata)
+    windows = fd.get_time_windows((t1-t0)/pd.Timedelta(hours=1), now=t0)
+    args = [(a, i) for a in airports for i in range(len(windows))]
+    if not refetch and len(args)>0:
+        covered = get_covered_windows(con, airports, t0, t1)
+        args = [a for a in args if a not in covered]
+    print(f"[backfill] Flights {t0} - {t1}: {len(airports)} airport(s), "
+          f"{len(windows)} window(s), {len(args)} request(s).")
+
+    # --- QUOTA: NEVER SPEND MORE THAN THE REST OF THE MONTH
+    quota.set_budget('aerodatabox', quota.get_month_remaining(con, 'aerodatabox'))
+    # Scrape aircraft table once before the threads start
+    ctx.get_reference('aircraftinfo', fd.get_aircraftinfo)
+
+    def task(arg):
+        IATA_code, i = arg
+        w0, w1 = windows[i]
+        throttle('aerodatabox')
+        return fd.get_flights(w0.strftime("%Y-%m-%dT%H:%M"),
+                              w1.strftime("%Y-%m-%dT%H:%M"), IATA_code)
+
+    def write(flights):
+        flights = (flights
+                   .rename(columns={'number':'fnumber',
+                                    'type':'ftype',
+                                    'typ. config.':'typ_config'})
+                   .drop_duplicates(['iata','fnumber','scheduled_time']))
+        flights = dim.encode_flights(flights, con=con)
+        flights = chg.write_changes(con, 'flights_fact', flights)
+        rollups.refresh_affected(con, 'flights_fact', flights)
+        return flights.shape[0]
+
+    try:
+        return run_tasks(task, args, write, workers)
+    finally:
+        quota.flush_ledger(con)
+
+
+# =============================================================================
+# CUSTOMERLOAD (RECOMPUTE FROM STORED FLIGHTS AND WEATHER)
+# =============================================================================
+def backfill_load(con, t0, t1, cities=None, workers=WORKERS):
+    cities_db = dbs.read_table("cities", con=con)
+    if cities:
+        cities_db = cities_db[cities_db['city'].isin(cities)]
+    population = dbs.read_table("population", con=con)
+    airports = dbs.read_table("airports", con=con)
+    # Tasks of LOAD_DAYS days
+    starts = pd.date_range(t0, t1, freq=f"{LOAD_DAYS}D", inclusive='left')
+    args = [(s, min(s+pd.Timedelta(days=LOAD_DAYS), t1)) for s in starts]
+    print(f"[backfill] Load {t0} - {t1}: {cities_db.shape[0]} city(s), "
+          f"{len(args)} task(s).")
+
+    def task(arg):
+        s0, s1 = arg
+        # Aggregation in MySQL, only weather of the task-range
+        flightload_city = ld.query_flightload_per_city(con, cities_db, s0, s1)
+        weather = dbs.apply_schema(pd.read_sql(
+            text("SELECT * FROM weather WHERE wtime >= :t0 AND wtime < :t1"),
+            con=con, params={'t0':s0, 't1':s1}), 'weather')
+        with _model_lock:
+            return ld.format_load_total(cities_db, population, weather, airports,
+                                        None, flightload_city)
+
+    def write(customerload):
+        rows = chg.upsert(con, 'customerload', customerload,
+                      ['flightload','baseload','weatherfac'])
+        rollups.refresh_affected(con, 'customerload', customerload)
+        api.bump_version(con)
+        return rows
+
+    return run_tasks(task, args, write, workers)
+
+
+# =============================================================================
+# RUN
+# =============================================================================
+STAGES = ['flights','load']
+
+def run_backfill(con, stage, t0, t1, cities=None, iata=None, workers=WORKERS,
+                 refetch=False):
+    t0, t1 = pd.Timestamp(t0), pd.Timestamp(t1)
+    if not lease.acquire(con, stage, LEASE_WAIT_SECONDS):
+        raise RuntimeError(f"Stage {stage} is leased by another process.")
+    # Budget and exhaustion of the APIs are per run (see api_quota.py)
+    quota.reset()
+    try:
+        if stage=='flights':
+            return backfill_flights(con, t0, t1, cities, iata, workers, refetch)
+        return backfill_load(con, t0, t1, cities, workers)
+    finally:
+        lease.release(stage)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Historical backfill")
+    parser.add_argument('stage', choices=STAGES)
+    parser.add_argument('t0', help="Start (inclusive), e.g. 2026-09-01")
+    parser.add_argument('t1', help="End (exclusive), e.g. 2026-10-01")
+    parser.add_argument('cities', nargs='*', help="Cities (default: all)")
+    parser.add_argument('--iata', nargs='+', help="IATA-codes instead of cities")
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--refetch', action='store_true',
+                        help="Also fetch windows that contain flights already")
+    a = parser.parse_args(sys.argv[1:])
+    rows, failed = run_backfill(ctx.get_engine(), a.stage, a.t0, a.t1,
+                                a.cities, a.iata, a.workers, a.refetch)
+    sys.exit(1 if failed else 0)
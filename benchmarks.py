@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+"""
+Offline benchmarks for the pipeline (no API-keys or database needed).
+
+Usage:
+    python benchmarks.py                -> run all benchmarks
+    python benchmarks.py schema_memory  -> run single benchmark
+
+    All benchmarks work on synthetic data shaped like the database tables.
+    bulk_load writes into a scratch table of a local MySQL given by
+    BENCH_MYSQL_URL (e.g. mysql+pymysql://root:pw@localhost/bench), it is
+    skipped without. The server needs local_infile=ON, every write is
+    checked by counting the rows of the table.
+    html_tables uses saved pages from BENCH_HTML_DIR (population.html,
+    aircraft.html) if given, synthetic pages of the same shape otherwise.
+
+"""
+
+import io
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+# ---
+import db_schema as dbs
+import get_loaddata as ld
+import db_bulk as bulk
+import html_tables as ht
+
+
+# =============================================================================
+# SYNTHETIC DATA SHAPED LIKE THE DATABASE TABLES
+# =============================================================================
+IATA_CODES = ['CGN','DUS','BLR','CDG','ORY','BVA','MAD','LAX','BUR','LGB',
+              'SNA','ONT','PVG','SHA']
+AIRLINES = [f"Airline {i}" for i in range(120)]
+AIRCRAFT = [f"Aircraft {i}" for i in range(80)]
+
+
+def make_cities(n_cities=6):
+    return pd.DataFrame({'city_id':np.arange(1,n_cities+1),
+                         'city':[f"City {i}" for i in range(1,n_cities+1)],
+                         'country':'XX',
+                         'latitude':np.linspace(-40,60,n_cities),
+                         'longitude':np.linspace(-120,120,n_cities)})
+
+
+def make_airports(cities):
+    # Distribute IATA-codes round robin over cities
+    city_ids = cities['city_id'].to_numpy()
+    return pd.DataFrame({'city_id':city_ids[np.arange(len(IATA_CODES))%len(city_ids)],
+                         'iata':IATA_CODES,
+                         'latitude':0.0,
+                         'longitude':0.0})
+
+
+def make_flights(n_flights, hours=48, seed=0):
+    rng = np.random.default_rng(seed)
+    t0 = pd.Timestamp.now().floor('H')
+    return pd.DataFrame({
+        'iata':rng.choice(IATA_CODES,n_flights),
+        'ftype':rng.choice(['arrivals','departures'],n_flights),
+        'fnumber':[f"XX {i}" for i in rng.integers(1,9999,n_flights)],
+        'scheduled_time':t0 + pd.to_timedelta(rng.integers(0,hours*60,n_flights),unit='min'),
+        'revised_time':pd.NaT,
+        'terminal':rng.choice(['1','2','3',None],n_flights),
+        'aircraft':rng.choice(AIRCRAFT,n_flights),
+        'airline':rng.choice(AIRLINES,n_flights),
+        'typ_config':np.where(rng.random(n_flights)<0.1,np.nan,
+                              rng.integers(50,400,n_flights).astype(float))
+        })
+
+
+def make_weather(cities, hours=48, seed=0):
+    rng = np.random.default_rng(seed)
+    t0 = pd.Timestamp.now().floor('3H')
+    wtime = pd.date_range(t0, periods=int(hours/3)+1, freq='3H')
+    df = (pd.MultiIndex.from_product([cities['city_id'],wtime],names=['city_id','wtime'])
+          .to_frame(index=False))
+    n = df.shape[0]
+    df['weather_id'] = rng.choice([500,800,801,802],n)
+    df['rain'] = rng.random(n)*5
+    df['rain_prob'] = rng.random(n)
+    df['windspeed'] = rng.random(n)*10
+    df['temp'] = rng.random(n)*30
+    df['temp_feel'] = df['temp']-1
+    df['temp_min'] = df['temp']-2
+    df['temp_max'] = df['temp']+2
+    df['vis'] = 10000.0
+    return df
+
+
+def make_population(cities, year=None):
+    year = year or pd.Timestamp.now().year
+    return pd.DataFrame({'city_id':cities['city_id'],
+                         'pyear':year,
+                         'population':1000000+100000*cities['city_id']})
+
+
+# =============================================================================
+# HELPERS
+# =============================================================================
+def memory_mb(df):
+    return df.memory_usage(deep=True).sum()/1e6
+
+
+def timeit(func, *args, repeat=3, **kwargs):
+    # Best-of-N wallclock time in seconds
+    best = np.inf
+    for _ in range(repeat):
+        t = time.perf_counter()
+        res = func(*args, **kwargs)
+        best = min(best, time.perf_counter()-t)
+    return best, res
+
+
+# =============================================================================
+# SCHEMA DTYPES: MEMORY FOOTPRINT OF UNTYPED VS. TYPED FRAMES
+# =============================================================================
+def bench_schema_memory(n_flights=1000000):
+    print(f"--- Schema memory ({n_flights} flights) ---")
+    flights = make_flights(n_flights).astype({'typ_config':float})
+    cities = make_cities()
+    weather = make_weather(cities, hours=24*365).astype(
+        {col:float for col in ['rain','rain_prob','windspeed','temp',
+                               'temp_feel','temp_min','temp_max','vis']})
+    for table, df in [('flights',flights),('weather',weather)]:
+        before = memory_mb(df)
+        after = memory_mb(dbs.apply_schema(df.copy(),table))
+        print(f"{table:>10}: {before:8.1f} MB -> {after:8.1f} MB "
+              f"({100*(1-after/before):.0f}% less)")
+
+
+# =============================================================================
+# FLIGHTLOAD: 3H-BUCKETING KERNEL VS. GROUPBY/RESAMPLE
+# =============================================================================
+def flightload_resample(flights, airports, cities, ratio):
+    # Former implementation (groupby/resample + merges) as reference
+    res = flights[['scheduled_time','iata']].copy()
+    res['flightload'] = round(flights['typ_config'].fillna(150)*ratio)
+    res = (res.set_index('scheduled_time').groupby('iata')
+           .resample('3H').sum('flightload').reset_index())
+    res = (res.merge(airports[['iata','city_id']],on='iata',how='left')
+           .merge(cities[['city','city_id']],on='city_id',how='left')
+           .drop(columns=['iata','city_id']))
+    return (res.set_index('scheduled_time').groupby('city')
+            .resample('3H').sum('flightload').reset_index())
+
+
+def flightload_kernel(flights, airports, cities, seed):
+    res = ld.get_flightload_per_airport(flights.copy(), seed)
+    return ld.get_flightload_per_city(res, airports, cities)
+
+
+def bench_flightload(n_flights=1000000, hours=24*30):
+    print(f"--- Flightload bucketing ({n_flights} flights, {hours}h) ---")
+    cities = make_cities()
+    airports = make_airports(cities)
+    flights = make_flights(n_flights, hours=hours)
+    # Same random ratio as get_flightload_per_airport for seed 1
+    ld.rnd.seed(1)
+    ratio = ld.rnd.uniform(0.005,0.05)*0.826
+    t_old, old = timeit(flightload_resample, flights, airports, cities, ratio, repeat=1)
+    t_new, new = timeit(flightload_kernel, flights, airports, cities, 1, repeat=1)
+    same = np.allclose(old['flightload'].to_numpy(), new['flightload'].to_numpy())
+    same = same and (old['city'].tolist()==new['city'].tolist())
+    same = same and (old['scheduled_time'].tolist()==new['scheduled_time'].tolist())
+    print(f"groupby/resample: {t_old:7.3f} s")
+    print(f"bincount kernel:  {t_new:7.3f} s ({t_old/t_new:.0f}x), identical: {same}")
+
+
+# =============================================================================
+# LOAD MODEL: SINGLE PROCESS VS. PARTITIONS IN A PROCESS POOL
+# =============================================================================
+def bench_load_sharded(n_cities=96, n_flights=200000, workers=(2,4,8)):
+    print(f"--- Load model sharded by city_id ({n_cities} cities, {n_flights} flights) ---")
+    cities = dbs.apply_schema(make_cities(n_cities),'cities')
+    # One airport per city
+    codes = [f"A{i:03d}" for i in range(n_cities)]
+    airports = pd.DataFrame({'city_id':cities['city_id'],'iata':codes,
+                             'latitude':0.0,'longitude':0.0})
+    flights = make_flights(n_flights)
+    flights['iata'] = np.random.default_rng(0).choice(codes,n_flights)
+    flights = dbs.apply_schema(flights,'flights')
+    weather = dbs.apply_schema(make_weather(cities),'weather')
+    population = make_population(cities)
+    args = (cities, population, weather, airports)
+    t_one, ref = timeit(lambda: ld.get_load_total(*args, flights.copy()), repeat=1)
+    print(f"1 process:    {t_one:7.3f} s")
+    # Fork-server is started once per instance (not part of a warm run)
+    t, res = timeit(lambda: ld.get_load_total_sharded(*args, flights.copy(),
+                                                      workers=1), repeat=1)
+    print(f"1 partition:  {t:7.3f} s (incl. start of the fork-server)")
+    for n in workers:
+        t, res = timeit(lambda: ld.get_load_total_sharded(*args, flights.copy(),
+                                                          workers=n), repeat=1)
+        same = np.allclose(ref['total_load'].to_numpy(float),
+                           res['total_load'].to_numpy(float), equal_nan=True)
+        print(f"{n} processes: {t:7.3f} s ({t_one/t:.1f}x), identical: {same}")
+    # --- CRITICAL PATH: PARTITIONS ONE AFTER ANOTHER IN THIS PROCESS
+    # With one core per worker the pool takes at least the sharing plus the
+    # slowest partition (measurable without several cores)
+    frames = {'cities':cities,'population':population,'weather':weather,
+              'airports':airports,'flights':flights,'flightload_city':None}
+    city_ids = np.sort(cities['city_id'].to_numpy())
+    for n in workers:
+        buffers = []
+        try:
+            t_share, specs = timeit(lambda: {
+                name:(None if df is None else ld.share_frame(df.reset_index(drop=True), buffers))
+                for name, df in frames.items()}, repeat=1)
+            t_shards = [timeit(ld._load_shard, specs, city_ids[i::n], repeat=1)[0]
+                        for i in range(n)]
+        finally:
+            for shm in buffers:
+                shm.close()
+                shm.unlink()
+        t_path = t_share+max(t_shards)
+        print(f"{n} partitions: sharing {t_share:.3f} s, slowest partition "
+              f"{max(t_shards):.3f} s -> at most {t_one/t_path:.1f}x on {n} cores")
+
+
+# =============================================================================
+# LOAD MODEL: SCENARIOS FOR UNCERTAINTY BANDS
+# =============================================================================
+def bench_load_scenarios(n_cities=96, n_flights=200000, scenarios=(100,200,500,1000)):
+    print(f"--- Load scenarios ({n_cities} cities, {n_flights} flights, 48h) ---")
+    cities = dbs.apply_schema(make_cities(n_cities),'cities')
+    codes = [f"A{i:03d}" for i in range(n_cities)]
+    airports = pd.DataFrame({'city_id':cities['city_id'],'iata':codes})
+    flights = make_flights(n_flights)
+    flights['iata'] = np.random.default_rng(0).choice(codes,n_flights)
+    flights = dbs.apply_schema(flights,'flights')
+    weather = dbs.apply_schema(make_weather(cities),'weather')
+    population = make_population(cities)
+    t_counts, seat_counts = timeit(ld.get_seat_counts, flights, airports, repeat=1)
+    t_one, _ = timeit(lambda: ld.get_load_total(cities, population, weather,
+                                                airports, flights.copy()), repeat=1)
+    print(f"single realization (get_load_total): {t_one:7.3f} s")
+    print(f"seat counts:                         {t_counts:7.3f} s")
+    for n in scenarios:
+        t, res = timeit(ld.simulate_load, cities, population, weather,
+                        seat_counts, n, seed=0, repeat=1)
+        print(f"{n:>5} scenarios: {t:7.3f} s, {res.shape[0]} rows")
+
+
+# =============================================================================
+# SCRAPERS: FULL BeautifulSoup-TREE VS. STREAMED SINGLE TABLE
+# =============================================================================
+def make_page(n_tables=8, n_rows=600, n_cols=12, cls='wikitable', seed=0):
+    # Page with navigation, text and several tables (like Wikipedia)
+    rng = np.random.default_rng(seed)
+    parts = ["<html><head><title>Page</title></head><body>",
+             "<div class='nav'>" + "".join(f"<a href='/l{i}'>Link {i}</a>"
+                                           for i in range(2000)) + "</div>"]
+    for t in range(n_tables):
+        parts.append(f"<p>{'Text ' * 200}</p><table class='{cls}'><tbody>")
+        parts.append("<tr>" + "".join(f"<th>Col {c}</th>" for c in range(n_cols)) + "</tr>")
+        for r in range(n_rows):
+            cells = [f"<a href='/c{r}'>Name {t}-{r}</a><sup>[{r}]</sup>\n",
+                     f"<span>{rng.integers(1,99)}</span>"]
+            cells += [f"{rng.integers(1000,30000000):,}\n<small>(2020)</small>"
+                      for _ in range(n_cols-2)]
+            parts.append("<tr>" + "".join(f"<td>{c}</td>" for c in cells) + "</tr>")
+        parts.append("</tbody></table>")
+    parts.append("</body></html>")
+    return "".join(parts).encode('utf-8')
+
+
+def table_soup(html, index, cls):
+    # Former implementation of the scrapers as reference
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    tables = soup.find_all('table', class_=cls) if cls else soup.find_all('table')
+    return [[td.text for td in tr.find_all('td')] for tr in tables[index].find_all('tr')]
+
+
+def peak_mb(func, *args):
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]/2**20
+    finally:
+        tracemalloc.stop()
+
+
+def bench_html_tables():
+    print("--- HTML tables: BeautifulSoup tree vs. streamed table ---")
+    folder = os.environ.get('BENCH_HTML_DIR')
+    pages = {'population':(1, None), 'aircraft':(0, 'data-grid')}
+    for name, (index, cls) in pages.items():
+        path = os.path.join(folder, f"{name}.html") if folder else None
+        if path and os.path.exists(path):
+            with open(path, 'rb') as f:
+                html = f.read()
+        else:
+            html = make_page(cls=cls or 'wikitable')
+        t_old, old = timeit(table_soup, html, index, cls)
+        t_new, new = timeit(ht.get_rows, html, index, cls)
+        m_old, m_new = peak_mb(table_soup, html, index, cls), peak_mb(ht.get_rows, html, index, cls)
+        print(f"{name:>10} ({len(html)/1e6:.1f} MB page, {len(new)} rows): "
+              f"soup {t_old:6.3f} s / {m_old:6.1f} MB, "
+              f"streamed {t_new:6.3f} s / {m_new:6.1f} MB "
+              f"({t_old/t_new:.0f}x faster), identical: {old==new}")
+
+
+# =============================================================================
+# WRITES: to_sql VS. LOAD DATA LOCAL INFILE (LOCAL MYSQL)
+# =============================================================================
+def bench_bulk_load(n_rows=(10000,100000,500000)):
+    print("--- Bulk load into customerload-shaped table ---")
+    rng = np.random.default_rng(0)
+    frames = {}
+    for n in n_rows:
+        n_cities = max(n//1000, 1)
+        frames[n] = pd.DataFrame({
+            'city_id':np.repeat(np.arange(1,n_cities+1), 1000)[:n],
+            'ltime':np.tile(pd.date_range('2026-01-01', periods=1000, freq='3H'),
+                            n_cities)[:n],
+            'flightload':rng.integers(0,5000,n),
+            'baseload':rng.integers(0,50000,n),
+            'weatherfac':np.where(rng.random(n)<0.05, np.nan, rng.random(n))})
+        # Client side of the bulk path (runs in the function)
+        t, _ = timeit(lambda: bulk.to_tsv(frames[n], io.StringIO()), repeat=1)
+        print(f"{n:>7} rows: TSV {t:6.2f} s ({n/t:8.0f} rows/s)")
+    url = os.environ.get('BENCH_MYSQL_URL')
+    if not url:
+        print("BENCH_MYSQL_URL not set, writes skipped.")
+        return
+    import sqlalchemy
+    con = sqlalchemy.create_engine(url, connect_args={'local_infile':True})
+    create = """
+        CREATE TABLE bench_customerload (
+            city_id INT NOT NULL, ltime DATETIME NOT NULL,
+            flightload INT NOT NULL, baseload INT NOT NULL, weatherfac FLOAT,
+            PRIMARY KEY (city_id, ltime))"""
+    def reset():
+        with con.begin() as conn:
+            conn.execute(sqlalchemy.text("DROP TABLE IF EXISTS bench_customerload"))
+            conn.execute(sqlalchemy.text(create))
+    writers = {
+        'to_sql':lambda df: df.to_sql('bench_customerload', con=con,
+                                      if_exists='append', index=False),
+        'to_sql multi':lambda df: df.to_sql('bench_customerload', con=con,
+                                            if_exists='append', index=False,
+                                            method='multi', chunksize=1000),
+        'LOAD DATA':lambda df: bulk.load_data(con, 'bench_customerload', df),
+        }
+    def count():
+        with con.connect() as conn:
+            return conn.execute(sqlalchemy.text(
+                "SELECT COUNT(*) FROM bench_customerload")).scalar()
+    for n, df in frames.items():
+        times = {}
+        for name, write in writers.items():
+            reset()
+            t = time.perf_counter()
+            if write(df) is None and name=='LOAD DATA':
+                print("LOAD DATA LOCAL refused by the server (local_infile=OFF?).")
+                continue
+            times[name] = time.perf_counter()-t
+            # Skipped rows (e.g. warnings of LOAD DATA) would fake the speed
+            if count()!=n:
+                print(f"---! {name} wrote {count()} of {n} rows !---")
+        print(f"{n:>7} rows: " + ', '.join(
+            f"{name} {t:6.2f} s ({n/t:8.0f} rows/s)" for name, t in times.items()))
+    with con.begin() as conn:
+        conn.execute(sqlalchemy.text("DROP TABLE bench_customerload"))
+
+
+# =============================================================================
+# RUN
+# =============================================================================
+BENCHMARKS = {
+    'schema_memory':bench_schema_memory,
+    'flightload':bench_flightload,
+    'load_sharded':bench_load_sharded,
+    'load_scenarios':bench_load_scenarios,
+    'html_tables':bench_html_tables,
+    'bulk_load':bench_bulk_load,
+    }
+
+if __name__ == '__main__':
+    selected = sys.argv[1:] or list(BENCHMARKS.keys())
+    for name in selected:
+        BENCHMARKS[name]()
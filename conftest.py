@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""
+Setup of the tests (pytest, run from the repository folder).
+
+Notes:
+    get_keys.py holds the API-keys and passwords and is not part of the
+    repository. Tests don't call any API, so without it a module returning
+    dummy keys is used.
+
+"""
+
+import sys
+import types
+
+
+try:
+    import get_keys
+except ImportError:
+    get_keys = types.ModuleType('get_keys')
+    get_keys.get_keys = lambda name: f"test-{name}"
+    sys.modules['get_keys'] = get_keys
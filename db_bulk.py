@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk-load path for high-volume tables (flights_fact, customerload).
+
+Usage:
+    load_data(con, table, rows, update_cols=None)
+        -> Writes rows as a TSV-file into a temporary staging table with
+           LOAD DATA LOCAL INFILE and merges it into the target with one
+           INSERT ... SELECT (ON DUPLICATE KEY UPDATE update_cols, if given).
+           Returns the number of rows, None if the server refuses LOAD DATA
+           LOCAL (caller falls back to multi-row INSERTs).
+    use_bulk(rows)
+        -> True if rows are large enough for the bulk path (BULK_MIN_ROWS).
+
+    db_changes.append() and db_changes.upsert() pick the writer themselves,
+    so callers don't have to.
+
+Notes:
+    The TSV is written to the temporary directory of the instance (in memory
+    on Cloud Functions). Text is escaped in the default format of LOAD DATA
+    (backslash, tab, newline), NULL is written as \\N.
+    The staging table is a TEMPORARY copy of the target's columns without keys
+    and partitions, so it only lives on the connection of the write.
+    LOAD DATA LOCAL needs local_infile on the server and the client (see
+    app_context.get_engine). A refusal switches the bulk path off for
+    RETRY_SECONDS (multi-row INSERTs meanwhile, printed for every write), then
+    it is tried again.
+
+"""
+
+import os
+import time
+import tempfile
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+
+# Min. rows for the bulk path (below, multi-row INSERTs are faster)
+BULK_MIN_ROWS = 20000
+# Switch off the bulk path completely
+BULK_ENABLED = os.environ.get('BULK_LOAD', '1')=='1'
+# MySQL errors of a refused LOAD DATA LOCAL
+# 1148: not allowed with this MySQL version, 2068/3948: local_infile disabled
+REFUSED = (1148, 2068, 3948)
+
+# Seconds without bulk path after a refusal (server setting may change)
+RETRY_SECONDS = 3600
+
+# --- INSTANCE STATE
+# Time of the last refusal of LOAD DATA LOCAL (None: not refused)
+_refused = {'at':None}
+
+
+def use_bulk(rows):
+    if not BULK_ENABLED or rows.shape[0]<BULK_MIN_ROWS:
+        return False
+    if _refused['at'] is not None:
+        since = time.time()-_refused['at']
+        if since<RETRY_SECONDS:
+            print(f"LOAD DATA LOCAL refused {since/60:.0f} min ago, "
+                  f"writing {rows.shape[0]} rows with multi-row INSERTs.")
+            return False
+    return True
+
+
+# =============================================================================
+# FRAME -> TSV IN THE DEFAULT FORMAT OF LOAD DATA
+# =============================================================================
+def to_field(s):
+    if pd.api.types.is_datetime64_any_dtype(s):
+        values = s.dt.strftime('%Y-%m-%d %H:%M:%S')
+    elif pd.api.types.is_bool_dtype(s):
+        values = s.astype('Int8').astype(str)
+    elif pd.api.types.is_numeric_dtype(s):
+        values = s.astype(object).astype(str)
+    else:
+        values = (s.astype(object).astype(str)
+                  .str.replace('\\', '\\\\', regex=False)
+                  .str.replace('\t', '\\t', regex=False)
+                  .str.replace('\n', '\\n', regex=False)
+                  .str.replace('\r', '\\r', regex=False))
+    return values.where(s.notna(), '\\N')
+
+
+def to_tsv(rows, f):
+    lines = None
+    for col in rows.columns:
+        field = to_field(rows[col])
+        lines = field if lines is None else lines + '\t' + field
+    f.write('\n'.join(lines))
+    f.write('\n')
+
+
+# =============================================================================
+# LOAD INTO STAGING TABLE, MERGE INTO TARGET
+# =============================================================================
+def load_data(con, table, rows, update_cols=None):
+    if rows.shape[0]==0:
+        return 0
+    cols = ', '.join(rows.columns)
+    staging = f"staging_{table}"
+    merge = f"INSERT INTO {table} ({cols}) SELECT {cols} FROM {staging}"
+    if update_cols:
+        merge += (" ON DUPLICATE KEY UPDATE "
+                  + ', '.join(f"{c} = VALUES({c})" for c in update_cols))
+
+    with tempfile.NamedTemporaryFile('w', suffix='.tsv', encoding='utf-8',
+                                     newline='\n', delete=False) as f:
+        to_tsv(rows, f)
+    try:
+        with con.connect() as conn:
+            conn.execute(text(f"DROP TEMPORARY TABLE IF EXISTS {staging}"))
+            conn.execute(text(f"CREATE TEMPORARY TABLE {staging} "
+                              f"SELECT {cols} FROM {table} LIMIT 0"))
+            try:
+                with conn.begin():
+                    conn.execute(text(f"""
+                        LOAD DATA LOCAL INFILE :path INTO TABLE {staging}
+                        CHARACTER SET utf8mb4
+                        FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+                        LINES TERMINATED BY '\\n'
+                        ({cols})
+                        """), {'path':f.name})
+                    conn.execute(text(merge))
+            finally:
+                conn.execute(text(f"DROP TEMPORARY TABLE IF EXISTS {staging}"))
+    except DBAPIError as e:
+        code = e.orig.args[0] if e.orig is not None and e.orig.args else None
+        if code not in REFUSED:
+            raise
+        print(f"---! LOAD DATA LOCAL refused ({e.orig}), bulk path switched "
+              f"off for {RETRY_SECONDS/60:.0f} min !---")
+        _refused['at'] = time.time()
+        return None
+    finally:
+        os.remove(f.name)
+    print(f"{table}: {rows.shape[0]} rows bulk-loaded.")
+    return rows.shape[0]
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Row-hash change detection for tables that are refetched (flights_fact).
+
+Usage:
+    write_changes(con, table, rows)
+        -> Compares rows with the stored rows of the same keys by a 64-bit
+           content hash (column row_hash). New rows are appended, rows whose
+           hash differs (e.g. revised_time or terminal changed) are updated,
+           unchanged rows are not written at all.
+           Returns the rows that were written (for db_rollups).
+
+    row_hash(rows, table)  -> Content hash per row (int64)
+    upsert(con, table, rows, update_cols)
+                           -> Bulk INSERT ... ON DUPLICATE KEY UPDATE
+    append(con, table, rows)
+                           -> Bulk INSERT
+    Both use LOAD DATA LOCAL INFILE for large frames (see db_bulk.py).
+
+Notes:
+    Only keys and hashes of the affected airports and time range are read
+    (one query), not the whole table. Rows stored before row_hash existed
+    have NULL and are rewritten once.
+
+"""
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text, bindparam
+# ---
+import db_bulk as bulk
+
+
+# =============================================================================
+# TABLES WITH ROW-HASH
+# keys:    primary key
+# group:   key column used to select stored rows (IN-list)
+# time:    key column used to select stored rows (range)
+# columns: content columns that are hashed (and updated on change)
+# =============================================================================
+HASHED = {
+    'flights_fact': {'keys':['iata','fnumber','scheduled_time'],
+                     'group':'iata',
+                     'time':'scheduled_time',
+                     'columns':['ftype','revised_time','terminal','aircraft_id',
+                                'airline_id','codeshares']},
+}
+
+
+# =============================================================================
+# CONTENT HASH PER ROW
+# Values are normalized first, so rows read from MySQL and rows built from
+# the API give the same hash (categories vs. strings, NaN vs. None, ...)
+# =============================================================================
+def normalize(s):
+    if pd.api.types.is_datetime64_any_dtype(s) or s.name.endswith('_time'):
+        s = pd.to_datetime(s)
+    elif s.name.endswith('_id'):
+        s = pd.to_numeric(s).astype('Int64')
+    s = s.astype(object)
+    return s.where(s.notna(), '').astype(str)
+
+
+def row_hash(rows, table):
+    columns = HASHED[table]['columns']
+    values = pd.concat([normalize(rows[col]) for col in columns], axis=1)
+    # uint64 -> int64 (BIGINT in MySQL)
+    return (pd.util.hash_pandas_object(values, index=False)
+            .to_numpy().view(np.int64))
+
+
+# =============================================================================
+# STORED HASHES OF THE KEYS IN ROWS
+# =============================================================================
+def get_stored_hashes(con, table, rows):
+    config = HASHED[table]
+    query = (text(f"""
+        SELECT {', '.join(config['keys'])}, COALESCE(row_hash, 0) AS row_hash
+        FROM {table}
+        WHERE {config['group']} IN :groups
+              AND {config['time']} >= :t0 AND {config['time']} < :t1
+        """).bindparams(bindparam('groups', expanding=True)))
+    times = pd.to_datetime(rows[config['time']])
+    return pd.read_sql(query, con=con, params={
+        'groups':list(pd.unique(rows[config['group']].astype(object))),
+        't0':times.min().to_pydatetime(),
+        't1':(times.max()+pd.Timedelta(seconds=1)).to_pydatetime()})
+
+
+# =============================================================================
+# BULK UPSERT (ONE MULTI-ROW INSERT PER CHUNK, LOAD DATA FOR LARGE FRAMES)
+# =============================================================================
+def upsert(con, table, rows, update_cols, chunksize=1000):
+    if rows.shape[0]==0:
+        return 0
+    if bulk.use_bulk(rows):
+        n = bulk.load_data(con, table, rows, update_cols)
+        if n is not None:
+            return n
+    cols = list(rows.columns)
+    query = text(f"INSERT INTO {table} ({', '.join(cols)}) "
+                 f"VALUES ({', '.join(':'+c for c in cols)}) "
+                 f"ON DUPLICATE KEY UPDATE "
+                 + ', '.join(f"{c} = VALUES({c})" for c in update_cols))
+    # Python-objects for the driver (NaN/NaT/<NA> -> NULL, plain datetimes)
+    values = rows.astype(object)
+    for col in rows.columns:
+        if pd.api.types.is_datetime64_any_dtype(rows[col]):
+            values[col] = pd.Series(rows[col].dt.to_pydatetime(), dtype=object,
+                                    index=rows.index)
+    records = values.where(rows.notna(), None).to_dict('records')
+    with con.begin() as conn:
+        for i in range(0, len(records), chunksize):
+            conn.execute(query, records[i:i+chunksize])
+    return len(records)
+
+
+# =============================================================================
+# BULK APPEND (to_sql, LOAD DATA FOR LARGE FRAMES)
+# =============================================================================
+def append(con, table, rows):
+    if rows.shape[0]==0:
+        return 0
+    if bulk.use_bulk(rows):
+        n = bulk.load_data(con, table, rows)
+        if n is not None:
+            return n
+    rows.to_sql(table,
+                if_exists='append',
+                con=con,
+                index=False)
+    return rows.shape[0]
+
+
+# =============================================================================
+# WRITE NEW AND CHANGED ROWS ONLY
+# =============================================================================
+def write_changes(con, table, rows):
+    config = HASHED[table]
+    if rows.shape[0]==0:
+        return rows
+    rows = rows.copy()
+    rows['row_hash'] = row_hash(rows, table)
+
+    # --- COMPARE WITH STORED HASHES (SAME KEY)
+    stored = get_stored_hashes(con, table, rows)
+    keys = config['keys']
+    # Same dtypes on both sides of the merge
+    left = rows[keys].astype(object).assign(_pos=np.arange(rows.shape[0]))
+    left[config['time']] = pd.to_datetime(left[config['time']])
+    # Nullable integer -> no float-rounding of the hashes in the merge
+    stored = stored.astype({**{k:object for k in keys}, 'row_hash':'Int64'})
+    stored[config['time']] = pd.to_datetime(stored[config['time']])
+    match = (left.merge(stored.rename(columns={'row_hash':'_stored'}),
+                        on=keys, how='left')
+             .drop_duplicates('_pos').sort_values('_pos'))
+    is_new = match['_stored'].isna().to_numpy()
+    # Stored hash 0 = row from before row_hash existed -> rewrite once
+    is_changed = (~is_new) & (match['_stored'].fillna(0).to_numpy(dtype=np.int64)
+                              !=rows['row_hash'].to_numpy())
+    new, changed = rows[is_new], rows[is_changed]
+    print(f"{table}: {new.shape[0]} new, {changed.shape[0]} changed, "
+          f"{rows.shape[0]-new.shape[0]-changed.shape[0]} unchanged rows.")
+
+    # --- WRITE
+    append(con, table, new)
+    upsert(con, table, changed, config['columns']+['row_hash'])
+    return pd.concat([new, changed])
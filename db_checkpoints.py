@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Checkpoints for resumable pipeline runs (table run_state).
+
+Usage:
+    start_run(con)
+        -> Determines the current run window and loads its checkpoints.
+           Call once at the beginning of update_database.
+    run_stage(con, stage, func, *args)
+        -> Runs a stage (e.g. update_weather) unless it is already done in
+           this run window. Records 'done' or 'failed' (errors don't stop the
+           following stages).
+           Returns 'done' (ran now), 'skipped' (done before in this run
+           window) or 'failed'.
+    is_done(stage, unit) / mark(con, stage, unit, status)
+        -> Checkpoints of single units within a stage (city, airport, ...).
+           Units are written to the database one by one and marked 'done'
+           right after, so a rerun only retries the failed/missing ones.
+
+Notes:
+    A run window is RUN_WINDOW_HOURS long (one scheduled invocation, which
+    runs the stages that are due, see db_refresh.py). Reruns within
+    the same window (e.g. after a timeout) resume, the next window starts over.
+    Checkpoints older than KEEP_DAYS are deleted by start_run().
+
+"""
+
+import pandas as pd
+from sqlalchemy import text
+
+
+# Length of a run window in hours (1 = one scheduled invocation per hour)
+RUN_WINDOW_HOURS = 1
+# Days to keep old checkpoints
+KEEP_DAYS = 14
+# Stage-level checkpoints use this unit
+STAGE = '*'
+
+# --- IN-RUN STATE
+# Current run window (start time)
+_window = None
+# Checkpoints of the current window {(stage, unit): status}
+_state = {}
+
+
+# =============================================================================
+# CURRENT RUN WINDOW
+# =============================================================================
+def get_run_window(now=None):
+    now = now or pd.Timestamp.utcnow().tz_localize(None)
+    return pd.Timestamp(now).floor(f"{RUN_WINDOW_HOURS}H")
+
+
+# =============================================================================
+# START (OR RESUME) A RUN
+# =============================================================================
+def start_run(con, now=None):
+    global _window
+    _window = get_run_window(now)
+    with con.begin() as conn:
+        conn.execute(text("DELETE FROM run_state WHERE run_window < :t"),
+                     {'t':_window-pd.Timedelta(days=KEEP_DAYS)})
+    res = pd.read_sql(text("""
+        SELECT stage, unit, status FROM run_state WHERE run_window = :w
+        """), con=con, params={'w':_window})
+    _state.clear()
+    _state.update({(s, u): status for s, u, status
+                   in zip(res['stage'], res['unit'], res['status'])})
+    done = sum(status=='done' for status in _state.values())
+    failed = len(_state)-done
+    if len(_state)>0:
+        print(f"Resuming run {_window}: {done} checkpoint(s) done, "
+              f"{failed} failed.")
+    else:
+        print(f"Starting run {_window}.")
+    return _window
+
+
+# =============================================================================
+# CHECK / RECORD A CHECKPOINT
+# =============================================================================
+def is_done(stage, unit=STAGE):
+    return _state.get((stage, str(unit)))=='done'
+
+
+def mark(con, stage, unit=STAGE, status='done', message=None):
+    # Without start_run() (e.g. single stage called manually) nothing is stored
+    if _window is None:
+        return
+    unit = str(unit)
+    with con.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO run_state (run_window, stage, unit, status, message, updated)
+            VALUES (:w, :stage, :unit, :status, :message, UTC_TIMESTAMP())
+            ON DUPLICATE KEY UPDATE
+                status = VALUES(status), message = VALUES(message),
+                updated = VALUES(updated)
+            """), {'w':_window, 'stage':stage, 'unit':unit, 'status':status,
+                   'message':None if message is None else str(message)[:255]})
+    _state[(stage, unit)] = status
+
+
+# =============================================================================
+# RUN A STAGE UNLESS IT IS DONE IN THIS RUN WINDOW
+# Returns 'done' (ran now), 'skipped' (done before) or 'failed'
+# =============================================================================
+def run_stage(con, stage, func, *args, **kwargs):
+    if is_done(stage):
+        print(f">>>>>Skipping {stage} (done in this run).")
+        return 'skipped'
+    try:
+        func(*args, **kwargs)
+    except Exception as e:
+        print(f"---! {stage} failed: {e} !---")
+        mark(con, stage, status='failed', message=e)
+        return 'failed'
+    mark(con, stage)
+    return 'done'
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Dictionary-encoding of airline- and aircraft-names for the flights-table.
+
+Usage:
+    flights_fact only stores integer keys (airline_id, aircraft_id).
+    The names live once in the dimension tables 'airlines' and
+    'aircraft_types' (the latter also holds typ_config per aircraft).
+
+    encode_flights(flights, con)
+        -> Replaces airline/aircraft/typ_config of a flights-DataFrame by
+           airline_id/aircraft_id. Unknown names are inserted in bulk.
+
+    The view 'flights' joins everything back together, so reading "flights"
+    still returns the old columns.
+
+Notes:
+    Name -> ID mappings are kept in an in-memory dictionary per dimension.
+    The database is only queried for names that are missing in the cache.
+
+"""
+
+import pandas as pd
+from sqlalchemy import text, bindparam
+
+
+# =============================================================================
+# DIMENSION TABLES
+# key:   integer ID (AUTO_INCREMENT)
+# value: name stored in flights before encoding
+# attrs: further columns that belong to the name (stored once)
+# =============================================================================
+DIMENSIONS = {
+    'airlines': {'key':'airline_id',
+                 'value':'airline',
+                 'attrs':[]},
+    'aircraft_types': {'key':'aircraft_id',
+                       'value':'aircraft',
+                       'attrs':['typ_config']},
+}
+
+# --- IN-MEMORY CACHE {dimension: {name: id}}
+_cache = {dim: {} for dim in DIMENSIONS}
+
+
+# =============================================================================
+# CLEAR CACHE (E.G. AFTER MANUAL CHANGES TO THE DIMENSION TABLES)
+# =============================================================================
+def clear_cache(dim=None):
+    for d in ([dim] if dim else DIMENSIONS):
+        _cache[d].clear()
+
+
+# =============================================================================
+# LOAD IDs FOR GIVEN NAMES FROM DATABASE INTO CACHE
+# =============================================================================
+def fetch_keys(dim, names, con):
+    key, value = DIMENSIONS[dim]['key'], DIMENSIONS[dim]['value']
+    if len(names)==0:
+        return
+    # One query for all names
+    query = (text(f"SELECT {key}, {value} FROM {dim} WHERE {value} IN :names")
+             .bindparams(bindparam('names', expanding=True)))
+    res = pd.read_sql(query, con=con, params={'names':list(names)})
+    _cache[dim].update(dict(zip(res[value], res[key].astype(int))))
+
+
+# =============================================================================
+# RESOLVE NAMES TO IDs (INSERTS UNKNOWN NAMES)
+# df must contain the value-column and all attrs of the dimension
+# Returns Series of IDs (nullable integer, NaN-names give <NA>)
+# =============================================================================
+def resolve_keys(df, dim, con):
+    value, attrs = DIMENSIONS[dim]['value'], DIMENSIONS[dim]['attrs']
+    names = df[value].astype(object)
+    uniques = names.dropna().unique()
+
+    # --- 1. CACHE MISSES -> ASK DATABASE
+    missing = [n for n in uniques if n not in _cache[dim]]
+    fetch_keys(dim, missing, con)
+
+    # --- 2. STILL MISSING -> INSERT AS NEW ROWS (ONE BULK INSERT)
+    missing = [n for n in missing if n not in _cache[dim]]
+    if len(missing)>0:
+        print(f"Adding {len(missing)} new entries to {dim}...")
+        new = df.loc[names.isin(missing),[value]+attrs].astype({value:object})
+        if len(attrs)>0:
+            # Prefer rows with known attributes (NaN sorts last)
+            new = new.sort_values(attrs)
+        # One row per name
+        new = new.drop_duplicates(value)
+        new.to_sql(dim,
+                   if_exists='append',
+                   con=con,
+                   index=False)
+        # Get IDs generated by MySQL
+        fetch_keys(dim, missing, con)
+
+    # --- 3. MAP NAMES TO IDs
+    return names.map(_cache[dim]).astype('Int32')
+
+
+# =============================================================================
+# ENCODE FLIGHTS-DATAFRAME FOR THE flights_fact-TABLE
+# =============================================================================
+def encode_flights(flights, con):
+    print("Encoding airlines and aircraft types...")
+    flights = flights.copy()
+    flights['airline_id'] = resolve_keys(flights, 'airlines', con).values
+    flights['aircraft_id'] = resolve_keys(flights, 'aircraft_types', con).values
+    # Names and typ_config are now stored in the dimension tables
+    return flights.drop(columns=['airline','aircraft','typ_config'])
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Run- and stage-leases (MySQL advisory locks), so overlapping invocations
+don't fetch, compute and insert the same data twice.
+
+Usage:
+    acquire(con, name, wait=0)
+        -> True if the lease was taken (within wait seconds), False if another
+           process or thread holds it. Leases are re-entrant within the thread
+           that holds them (release as often as acquired).
+    release(name)
+        -> Gives the lease back (only the thread holding it).
+    holder(con, name)
+        -> Connection-ID of the process holding the lease (None if free).
+
+    update_database holds the lease 'run' for the whole invocation (a second
+    invocation skips after RUN_WAIT_SECONDS) and a lease per stage, which is
+    also taken by backfill.py. A stage that is leased by another process is
+    skipped and stays due for the next invocation.
+
+Notes:
+    A lease is a GET_LOCK on its own connection, held until release(). If the
+    process dies (e.g. timeout of the Cloud Function) its connection is closed
+    by MySQL and the lease is free again, so there are no stale leases and no
+    heartbeat is needed.
+    Concurrent requests of one instance run in different threads: each asks
+    MySQL on its own connection, like a different process.
+
+"""
+
+import threading
+from sqlalchemy import text
+
+
+# Prefix of the lock names (locks are server-wide)
+PREFIX = 'gans'
+# Seconds a second invocation waits for the running one
+RUN_WAIT_SECONDS = 0
+# Seconds a stage waits for a stage leased by another process
+STAGE_WAIT_SECONDS = 0
+
+# --- INSTANCE STATE
+# {name: [thread holding the lease, its connection, depth of acquire]}
+_held = {}
+_lock = threading.Lock()
+
+
+def lock_name(name):
+    # Lock names are limited to 64 characters
+    return f"{PREFIX}.{name}"[:64]
+
+
+# =============================================================================
+# TAKE A LEASE
+# =============================================================================
+def acquire(con, name, wait=0):
+    owner = threading.get_ident()
+    with _lock:
+        entry = _held.get(name)
+        if entry is not None and entry[0]==owner:
+            entry[2] += 1
+            return True
+    # Not held by this thread -> MySQL decides
+    conn = con.connect()
+    try:
+        got = conn.execute(text("SELECT GET_LOCK(:name, :wait)"),
+                           {'name':lock_name(name), 'wait':wait}).scalar()
+    except Exception:
+        conn.close()
+        raise
+    if got!=1:
+        conn.close()
+        print(f"Lease {name} is held by connection {holder(con, name)}.")
+        return False
+    with _lock:
+        _held[name] = [owner, conn, 1]
+    return True
+
+
+# =============================================================================
+# GIVE A LEASE BACK
+# =============================================================================
+def release(name):
+    with _lock:
+        entry = _held.get(name)
+        if entry is None or entry[0]!=threading.get_ident():
+            return
+        entry[2] -= 1
+        if entry[2]>0:
+            return
+        del _held[name]
+    conn = entry[1]
+    try:
+        conn.execute(text("SELECT RELEASE_LOCK(:name)"), {'name':lock_name(name)})
+    finally:
+        # Lock is also released if the connection is closed for good
+        conn.close()
+
+
+# =============================================================================
+# WHO HOLDS A LEASE
+# =============================================================================
+def holder(con, name):
+    with con.connect() as conn:
+        return conn.execute(text("SELECT IS_USED_LOCK(:name)"),
+                            {'name':lock_name(name)}).scalar()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Refresh policies per stage: only stages that are due run in an invocation.
+
+Usage:
+    get_due(con, stages, new_cities=False, force=None, now=None)
+        -> Stages (in the given order) whose policy says they are due.
+           force: list of stages to run anyway ('all' = every stage).
+    mark_success(con, stage, now=None)
+        -> Stores the time of the last successful refresh (table
+           stage_refresh). Call after the stage succeeded.
+    now: start of the run window (db_checkpoints.start_run), default utcnow
+
+    update_database?force=population,airports   -> run these stages anyway
+    update_database?force=all                   -> run every stage
+
+Notes:
+    A stage is due if one of its conditions holds:
+        ttl_hours:  last success is older than ttl_hours
+        cadence:    last success is before the start of the current period
+                    ('Y' year, 'M' month, 'D' day, '3H' 3h-slot, ...)
+        new_cities: the list of cities contains cities not in the database
+        after:      one of these stages is due in this invocation
+    Stages that never succeeded are always due.
+    The policies only pay off if update_database is invoked more often than
+    the shortest TTL (e.g. hourly), see db_checkpoints.RUN_WINDOW_HOURS.
+    Refresh times are the start of the run window, not the end of the stage:
+    stamped at 10:04 after a 4 minute stage, the next run (11:00) would find
+    the 1h-stage not due and run it only every second hour.
+
+"""
+
+import pandas as pd
+from sqlalchemy import text
+
+
+# =============================================================================
+# POLICIES
+# =============================================================================
+POLICIES = {
+    # Cities only change with the list of cities in main.py
+    'cities':{'new_cities':True},
+    'population':{'cadence':'Y', 'new_cities':True},
+    'airports':{'ttl_hours':30*24, 'new_cities':True},
+    # 5d/3h-forecasts, new forecasts from the API every
+    # get_weatherdata.WEATHER_TTL_HOURS (served from the cache in between)
+    'weather':{'ttl_hours':3, 'new_cities':True},
+    # Number of requests is limited by the quota of the run (api_quota.py)
+    'flights':{'ttl_hours':1, 'new_cities':True},
+    # Recomputed whenever its inputs changed
+    'load':{'ttl_hours':24, 'after':['weather','flights']},
+    'retention':{'cadence':'D'},
+}
+
+
+# =============================================================================
+# LAST SUCCESSFUL REFRESH PER STAGE
+# =============================================================================
+def get_last_success(con):
+    res = pd.read_sql(text("SELECT stage, last_success FROM stage_refresh"),
+                      con=con, parse_dates=['last_success'])
+    return dict(zip(res['stage'], res['last_success']))
+
+
+def mark_success(con, stage, now=None):
+    now = now or pd.Timestamp.utcnow().tz_localize(None)
+    with con.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO stage_refresh (stage, last_success)
+            VALUES (:stage, :t)
+            ON DUPLICATE KEY UPDATE last_success = VALUES(last_success)
+            """), {'stage':stage, 't':now.to_pydatetime()})
+
+
+# =============================================================================
+# START OF THE CURRENT PERIOD OF A CADENCE
+# =============================================================================
+def period_start(now, cadence):
+    if cadence in ('Y','M'):
+        return now.to_period(cadence).start_time
+    return now.floor(cadence)
+
+
+# =============================================================================
+# DUE STAGES
+# =============================================================================
+def is_due(policy, last, now, new_cities, due):
+    if last is None or pd.isna(last):
+        return "never refreshed"
+    if policy.get('new_cities') and new_cities:
+        return "new cities"
+    if 'ttl_hours' in policy and now-last>=pd.Timedelta(hours=policy['ttl_hours']):
+        return f"older than {policy['ttl_hours']}h"
+    if 'cadence' in policy and last<period_start(now, policy['cadence']):
+        return f"new period ({policy['cadence']})"
+    after = [s for s in policy.get('after', []) if s in due]
+    if len(after)>0:
+        return f"after {', '.join(after)}"
+    return None
+
+
+def get_due(con, stages, new_cities=False, force=None, now=None):
+    now = now or pd.Timestamp.utcnow().tz_localize(None)
+    force = stages if force in ('all',['all']) else (force or [])
+    last = get_last_success(con)
+    due = []
+    for stage in stages:
+        if stage in force:
+            reason = "forced"
+        elif stage not in POLICIES:
+            reason = "no policy"
+        else:
+            reason = is_due(POLICIES[stage], last.get(stage), now, new_cities, due)
+        if reason is None:
+            print(f">>>>>Skipping {stage} (last refresh {last[stage]}).")
+        else:
+            print(f"{stage} is due: {reason}.")
+            due.append(stage)
+    return due
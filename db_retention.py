@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Retention for the time-series tables weather, flights_fact and customerload.
+
+Usage:
+    run_retention(con)
+        1. Makes sure monthly partitions exist for the next months
+        2. Rolls detail-rows of expired months up into the summary tables
+           of db_rollups (weather_daily, flights_daily, passengers_hourly,
+           customerload_daily)
+        3. Drops the expired monthly partitions (no row-DELETEs)
+
+    Retention (in months) per table is set in RETENTION and can be overridden
+    per call, e.g. run_retention(con, {'weather':6}).
+
+Notes:
+    Partitions are named pYYYYMM and contain the month YYYY-MM
+    (VALUES LESS THAN first day of next month). pmax catches everything else
+    and is split up by add_partitions().
+    Only the rows of the expired partitions are rolled up (up to the upper
+    bound of the last one, MySQL prunes the other partitions), nothing is
+    scanned if no partition expired.
+    Tables that are not partitioned yet only get the rollup of the last
+    expired month, nothing is deleted (see gans_migrate_partitions.sql).
+
+"""
+
+import pandas as pd
+from sqlalchemy import text
+# ---
+import db_rollups as rollups
+
+
+# =============================================================================
+# RETENTION PER TABLE
+# column: partitioning column
+# months: full months of detail-rows to keep (besides the current month)
+# Expired data is kept in the summary tables of db_rollups
+# =============================================================================
+RETENTION = {
+    'weather': {'column':'wtime',
+                'months':3},
+    'flights_fact': {'column':'scheduled_time',
+                     'months':6},
+    'customerload': {'column':'ltime',
+                     'months':24},
+}
+
+# Months to create partitions for in advance
+MONTHS_AHEAD = 3
+
+
+# =============================================================================
+# MONTH HELPERS
+# =============================================================================
+def month_start(t):
+    return pd.Timestamp(t).to_period('M').to_timestamp()
+
+
+def partition_name(month):
+    return 'p' + month.strftime('%Y%m')
+
+
+# =============================================================================
+# GET EXISTING PARTITIONS OF A TABLE
+# Returns DataFrame: name, upper (exclusive upper bound, NaT for MAXVALUE)
+# Empty DataFrame if table is not partitioned
+# =============================================================================
+def get_partitions(con, table):
+    parts = pd.read_sql(text("""
+        SELECT PARTITION_NAME AS name, PARTITION_DESCRIPTION AS upper
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table
+              AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+        """), con=con, params={'table':table})
+    # RANGE COLUMNS bounds come quoted, e.g. '2026-11-01 00:00:00'
+    upper = parts['upper'].astype(str).str.strip("'")
+    parts['upper'] = pd.to_datetime(upper.where(upper!='MAXVALUE'))
+    return parts
+
+
+# =============================================================================
+# ADD MONTHLY PARTITIONS UP TO MONTHS_AHEAD (SPLITS pmax)
+# =============================================================================
+def add_partitions(con, table, now=None, months_ahead=MONTHS_AHEAD):
+    parts = get_partitions(con, table)
+    if parts.empty:
+        print(f"{table} is not partitioned, skipping partition maintenance.")
+        return []
+    current = month_start(now or pd.Timestamp.utcnow().tz_localize(None))
+    target = current + pd.DateOffset(months=months_ahead+1)
+    # First month not covered by a bounded partition yet
+    month = parts['upper'].max()
+    if pd.isna(month):
+        month = current
+    new = []
+    while month < target:
+        new.append(month)
+        month = month + pd.DateOffset(months=1)
+    if len(new)==0:
+        return []
+    print(f"Adding partitions to {table}: {[partition_name(m) for m in new]}")
+    defs = [f"PARTITION {partition_name(m)} VALUES LESS THAN "
+            f"('{(m + pd.DateOffset(months=1)).strftime('%Y-%m-%d')}')"
+            for m in new]
+    defs.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+    with con.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table} REORGANIZE PARTITION pmax "
+                          f"INTO ({', '.join(defs)})"))
+    return [partition_name(m) for m in new]
+
+
+# =============================================================================
+# ROLL EXPIRED ROWS UP AND DROP THEIR PARTITIONS
+# =============================================================================
+def expire_table(con, table, months, now=None):
+    # Everything before cutoff is expired
+    cutoff = month_start(now or pd.Timestamp.utcnow().tz_localize(None))
+    cutoff = cutoff - pd.DateOffset(months=months)
+    print(f"Expiring {table} before {cutoff.date()} (keep {months} months)...")
+
+    parts = get_partitions(con, table)
+    if parts.empty:
+        print(f"{table} is not partitioned, detail rows are kept.")
+        rollups.refresh_all(con, table, cutoff, cutoff-pd.DateOffset(months=1))
+        return []
+    # Partitions that lie completely before the cutoff
+    expired = parts[parts['upper'].notna() & (parts['upper']<=cutoff)]
+    if expired.empty:
+        print(f"No expired partitions of {table}.")
+        return []
+
+    # --- 1. ROLLUP OF THE EXPIRED ROWS INTO SUMMARY TABLES
+    # Expired partitions are the first ones: no rows lie below them (older
+    # partitions are dropped, the first one of the migration holds all older
+    # rows), so up to the upper bound of the last one covers exactly them
+    rollups.refresh_all(con, table, expired['upper'].max())
+
+    # --- 2. DROP EXPIRED PARTITIONS
+    names = list(expired['name'])
+    print(f"Dropping partitions of {table}: {names}")
+    with con.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table} DROP PARTITION {', '.join(names)}"))
+    return names
+
+
+# =============================================================================
+# RUN RETENTION FOR ALL TABLES
+# retention: optional overrides {table: months}
+# =============================================================================
+def run_retention(con, retention=None, now=None):
+    print("Running retention...")
+    retention = retention or {}
+    for table, config in RETENTION.items():
+        add_partitions(con, table, now)
+        expire_table(con, table, retention.get(table, config['months']), now)
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Summary tables for the dashboard, maintained incrementally by the pipeline.
+
+Usage:
+    refresh_affected(con, source, rows)
+        -> Recomputes all summary tables of a source table (e.g. 'flights_fact')
+           for the keys and days that appear in the newly written rows.
+           Called at the end of update_flights / update_load.
+
+    refresh(con, rollup, t0, t1, keys=None)
+        -> Recomputes one summary table for [t0, t1) (optionally only for
+           some keys). Also used by db_retention before partitions are dropped.
+
+    Summary tables (see gans_database.sql):
+        - customerload_daily: load per city and day
+        - flights_daily:      flights and seats per airport, day and ftype
+        - passengers_hourly:  flights, seats and passengers per city and hour
+
+Notes:
+    Summaries are always recomputed from the detail rows of whole days/hours
+    (INSERT ... SELECT ... ON DUPLICATE KEY UPDATE), so refreshing the same
+    range twice gives the same result.
+
+"""
+
+import pandas as pd
+from datetime import datetime
+from sqlalchemy import text, bindparam
+
+
+# =============================================================================
+# SUMMARY TABLES
+# source: detail table the summary is computed from
+# key:    column of the detail rows that identifies affected entries
+# time:   time column of the detail rows
+# query:  recompute-statement; {keys} is replaced by the key-filter
+# =============================================================================
+ROLLUPS = {
+    'weather_daily': {
+        'source':'weather',
+        'key':'city_id',
+        'time':'wtime',
+        'query':"""
+            INSERT INTO weather_daily
+                (city_id, wday, temp_avg, temp_min, temp_max, rain_sum,
+                 rain_prob_max, windspeed_max, samples)
+            SELECT city_id, DATE(wtime), AVG(temp), MIN(temp_min), MAX(temp_max),
+                   SUM(rain), MAX(rain_prob), MAX(windspeed), COUNT(*)
+            FROM weather
+            WHERE wtime >= :t0 AND wtime < :t1 {keys}
+            GROUP BY city_id, DATE(wtime)
+            ON DUPLICATE KEY UPDATE
+                temp_avg = VALUES(temp_avg), temp_min = VALUES(temp_min),
+                temp_max = VALUES(temp_max), rain_sum = VALUES(rain_sum),
+                rain_prob_max = VALUES(rain_prob_max),
+                windspeed_max = VALUES(windspeed_max), samples = VALUES(samples)
+            """,
+        'keyfilter':"AND city_id IN :keys"},
+    'flights_daily': {
+        'source':'flights_fact',
+        'key':'iata',
+        'time':'scheduled_time',
+        'query':"""
+            INSERT INTO flights_daily (iata, fday, ftype, flights, seats)
+            SELECT f.iata, DATE(f.scheduled_time), f.ftype, COUNT(*),
+                   SUM(COALESCE(ac.typ_config, 150))
+            FROM flights_fact f
+            LEFT JOIN aircraft_types ac ON ac.aircraft_id = f.aircraft_id
+            WHERE f.scheduled_time >= :t0 AND f.scheduled_time < :t1 {keys}
+            GROUP BY f.iata, DATE(f.scheduled_time), f.ftype
+            ON DUPLICATE KEY UPDATE
+                flights = VALUES(flights), seats = VALUES(seats)
+            """,
+        'keyfilter':"AND f.iata IN :keys"},
+    'passengers_hourly': {
+        'source':'flights_fact',
+        'key':'iata',
+        'time':'scheduled_time',
+        # All airports of a city are recomputed, not only the affected one
+        'query':"""
+            INSERT INTO passengers_hourly (city_id, phour, flights, seats, passengers)
+            SELECT a.city_id,
+                   DATE_FORMAT(f.scheduled_time, '%Y-%m-%d %H:00:00') AS phour,
+                   COUNT(*), SUM(COALESCE(ac.typ_config, 150)),
+                   ROUND(SUM(COALESCE(ac.typ_config, 150)) * :loadfac)
+            FROM flights_fact f
+            JOIN airports a ON a.iata = f.iata
+            LEFT JOIN aircraft_types ac ON ac.aircraft_id = f.aircraft_id
+            WHERE f.scheduled_time >= :t0 AND f.scheduled_time < :t1 {keys}
+            GROUP BY a.city_id, phour
+            ON DUPLICATE KEY UPDATE
+                flights = VALUES(flights), seats = VALUES(seats),
+                passengers = VALUES(passengers)
+            """,
+        'keyfilter':"""AND a.city_id IN (SELECT city_id FROM airports
+                                          WHERE iata IN :keys)"""},
+    'customerload_daily': {
+        'source':'customerload',
+        'key':'city_id',
+        'time':'ltime',
+        'query':"""
+            INSERT INTO customerload_daily
+                (city_id, lday, flightload, baseload, weatherfac_avg, slots)
+            SELECT city_id, DATE(ltime), SUM(flightload), SUM(baseload),
+                   AVG(weatherfac), COUNT(*)
+            FROM customerload
+            WHERE ltime >= :t0 AND ltime < :t1 {keys}
+            GROUP BY city_id, DATE(ltime)
+            ON DUPLICATE KEY UPDATE
+                flightload = VALUES(flightload), baseload = VALUES(baseload),
+                weatherfac_avg = VALUES(weatherfac_avg), slots = VALUES(slots)
+            """,
+        'keyfilter':"AND city_id IN :keys"},
+}
+
+# Passenger load factor (see get_loaddata.get_flightload_ratio)
+LOADFAC = 0.826
+
+
+# =============================================================================
+# GET SUMMARY TABLES OF A DETAIL TABLE
+# =============================================================================
+def get_rollups(source):
+    return [name for name, r in ROLLUPS.items() if r['source']==source]
+
+
+# =============================================================================
+# RECOMPUTE ONE SUMMARY TABLE FOR [t0, t1) (AND OPTIONALLY SOME KEYS)
+# =============================================================================
+def refresh(con, rollup, t0, t1, keys=None):
+    config = ROLLUPS[rollup]
+    params = {'t0':t0 if isinstance(t0, datetime) else pd.Timestamp(t0),
+              't1':t1 if isinstance(t1, datetime) else pd.Timestamp(t1),
+              'loadfac':LOADFAC}
+    query = config['query']
+    if keys is None:
+        query = text(query.format(keys=''))
+    else:
+        query = text(query.format(keys=config['keyfilter']))
+        query = query.bindparams(bindparam('keys', expanding=True))
+        params['keys'] = [k.item() if hasattr(k, 'item') else k for k in keys]
+    with con.begin() as conn:
+        res = conn.execute(query, params)
+    return res.rowcount
+
+
+# =============================================================================
+# RECOMPUTE SUMMARY TABLES FOR NEWLY WRITTEN DETAIL ROWS
+# rows: DataFrame that was just appended to the source table
+# =============================================================================
+def refresh_affected(con, source, rows):
+    if rows.shape[0]==0:
+        return
+    for rollup in get_rollups(source):
+        config = ROLLUPS[rollup]
+        times = pd.to_datetime(rows[config['time']])
+        # Whole days around the new rows
+        t0 = times.min().floor('D')
+        t1 = times.max().floor('D') + pd.Timedelta(days=1)
+        keys = list(pd.unique(rows[config['key']].dropna().astype(object)))
+        print(f"Refreshing {rollup} for {len(keys)} key(s), "
+              f"{t0.date()} - {(t1-pd.Timedelta(days=1)).date()}...")
+        refresh(con, rollup, t0, t1, keys)
+
+
+# =============================================================================
+# RECOMPUTE ALL SUMMARY TABLES OF A SOURCE (E.G. BEFORE DROPPING PARTITIONS)
+# =============================================================================
+def refresh_all(con, source, t1, t0=datetime(1000,1,1)):
+    for rollup in get_rollups(source):
+        rows = refresh(con, rollup, t0, t1)
+        print(f"Rolled up {source} into {rollup} ({rows} rows affected).")
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Central dtype-registry for all DataFrames of the pipeline.
+
+Usage:
+    Every table of gans_database.sql has an entry in TABLES that maps its
+    columns to a compact pandas dtype:
+        - IDs and counters -> int32 / int16 / int8
+        - Repetitive strings (IATA-codes, flight-type, airline, aircraft)
+          -> category
+        - Measurements (weather, coordinates) -> float32
+          (MySQL stores them as 4-byte FLOAT anyway)
+        - Times -> datetime64[ns]
+
+    empty_frame(table)       -> Empty, typed DataFrame (replaces pd.DataFrame({'col':[]}))
+    apply_schema(df, table)  -> Cast all known columns of df to their dtype
+    read_table(table, con)   -> pd.read_sql with dtypes applied
+    read_query(query, con, table, params, chunksize)
+                             -> Same for a query. With chunksize the rows are
+                                streamed (server-side cursor) and typed chunk
+                                by chunk, so the untyped result never exists
+                                in memory as a whole (the typed one does).
+    iter_query(query, con, table, params, chunksize)
+                             -> Typed chunks of a streamed query one at a time,
+                                for callers that can drop each chunk before
+                                the next one is fetched.
+
+    Frames that still use API column-names (e.g. 'number' instead of 'fnumber')
+    pass a rename-dict {db_column: frame_column}.
+
+Notes:
+    Integer columns that contain NaN are cast to the nullable pandas-type
+    (e.g. 'Int32') instead of failing.
+
+"""
+
+import pandas as pd
+
+
+# =============================================================================
+# DTYPES WITH FIXED CATEGORIES
+# Fixed categories survive pd.concat, dynamic ones fall back to object
+# =============================================================================
+FTYPE = pd.CategoricalDtype(['arrivals', 'departures'])
+
+
+# =============================================================================
+# SCHEMA REGISTRY
+# Mirrors gans_database.sql (+ auxiliary frames that never hit the database)
+# =============================================================================
+TABLES = {
+    'cities': {
+        'city_id': 'int32',
+        'city': 'object',
+        'country': 'category',
+        'latitude': 'float32',
+        'longitude': 'float32',
+    },
+    'population': {
+        'city_id': 'int32',
+        'pyear': 'int16',
+        'population': 'int32',
+    },
+    'weather': {
+        'city_id': 'int32',
+        'wtime': 'datetime64[ns]',
+        'weather_id': 'int16',
+        'rain': 'float32',
+        'rain_prob': 'float32',
+        'windspeed': 'float32',
+        'temp': 'float32',
+        'temp_feel': 'float32',
+        'temp_min': 'float32',
+        'temp_max': 'float32',
+        'vis': 'float32',
+    },
+    'airports': {
+        'city_id': 'int32',
+        'iata': 'category',
+        'latitude': 'float32',
+        'longitude': 'float32',
+    },
+    'airlines': {
+        'airline_id': 'int32',
+        'airline': 'object',
+    },
+    'aircraft_types': {
+        'aircraft_id': 'int32',
+        'aircraft': 'object',
+        'typ_config': 'float32',
+    },
+    'flights_fact': {
+        'iata': 'category',
+        'ftype': FTYPE,
+        'fnumber': 'object',
+        'scheduled_time': 'datetime64[ns]',
+        'revised_time': 'datetime64[ns]',
+        'terminal': 'category',
+        'aircraft_id': 'int32',
+        'airline_id': 'int32',
+        # Flight numbers of collapsed codeshare-duplicates
+        'codeshares': 'object',
+        # Content hash (see db_changes.py)
+        'row_hash': 'int64',
+    },
+    # --- VIEW: flights_fact joined with airlines and aircraft_types
+    'flights': {
+        'iata': 'category',
+        'ftype': FTYPE,
+        'fnumber': 'object',
+        'scheduled_time': 'datetime64[ns]',
+        'revised_time': 'datetime64[ns]',
+        'terminal': 'category',
+        'aircraft': 'category',
+        'airline': 'category',
+        # Seat-count, but nullable (unknown aircraft) -> float32
+        'typ_config': 'float32',
+        'codeshares': 'object',
+    },
+    'customerload': {
+        'city_id': 'int32',
+        'ltime': 'datetime64[ns]',
+        'flightload': 'int32',
+        'baseload': 'int32',
+        'weatherfac': 'float32',
+    },
+    'customerload_bands': {
+        'city_id': 'int32',
+        'ltime': 'datetime64[ns]',
+        'scenarios': 'int16',
+        'p10': 'float32',
+        'p50': 'float32',
+        'p90': 'float32',
+    },
+    # --- AUXILIARY: scraped aircraft reference list
+    'aircraftinfo': {
+        'name': 'object',
+        'max. config.': 'float32',
+        'typ. config.': 'float32',
+        'no. engines': 'int8',
+        'prim. operators': 'object',
+    },
+}
+
+
+# =============================================================================
+# GET DTYPES OF A TABLE (OPTIONALLY WITH FRAME-SPECIFIC COLUMN-NAMES)
+# =============================================================================
+def get_dtypes(table, rename=None):
+    rename = rename or {}
+    return {rename.get(col, col): dtype for col, dtype in TABLES[table].items()}
+
+
+# =============================================================================
+# CAST SINGLE COLUMN
+# =============================================================================
+def cast_column(s, dtype):
+    # Nothing to do if dtype already matches
+    if s.dtype == dtype:
+        return s
+    if isinstance(dtype, str) and dtype.startswith('int') and s.isna().any():
+        # Integers with missing values -> nullable integer-type ('Int32')
+        dtype = dtype.capitalize()
+    if dtype == 'datetime64[ns]':
+        return pd.to_datetime(s)
+    return s.astype(dtype)
+
+
+# =============================================================================
+# APPLY SCHEMA TO DATAFRAME
+# Columns that are not part of the schema are left untouched
+# =============================================================================
+def apply_schema(df, table, rename=None):
+    dtypes = get_dtypes(table, rename)
+    for col in df.columns:
+        if col in dtypes:
+            df[col] = cast_column(df[col], dtypes[col])
+    return df
+
+
+# =============================================================================
+# EMPTY DATAFRAME WITH SCHEMA-DTYPES
+# =============================================================================
+def empty_frame(table, rename=None, columns=None):
+    dtypes = get_dtypes(table, rename)
+    # Optionally restrict to (and order by) given columns
+    if columns is None:
+        columns = list(dtypes.keys())
+    return pd.DataFrame({col: pd.Series([], dtype=dtypes.get(col, 'object'))
+                         for col in columns})
+
+
+# =============================================================================
+# READ TABLE FROM DATABASE WITH SCHEMA-DTYPES
+# =============================================================================
+def read_table(table, con):
+    return apply_schema(pd.read_sql(table, con=con), table)
+
+
+# =============================================================================
+# READ QUERY FROM DATABASE WITH SCHEMA-DTYPES (STREAMED CHUNK BY CHUNK)
+# =============================================================================
+def iter_query(query, con, table, params=None, chunksize=50000):
+    with con.connect() as conn:
+        # Server-side cursor: rows are fetched in chunks, not all at once
+        conn = conn.execution_options(stream_results=True)
+        for chunk in pd.read_sql(query, con=conn, params=params, chunksize=chunksize):
+            yield apply_schema(chunk, table)
+
+
+# =============================================================================
+# READ QUERY FROM DATABASE WITH SCHEMA-DTYPES (OPTIONALLY STREAMED)
+# =============================================================================
+def read_query(query, con, table, params=None, chunksize=None):
+    if chunksize is None:
+        return apply_schema(pd.read_sql(query, con=con, params=params), table)
+    chunks = list(iter_query(query, con, table, params, chunksize))
+    if len(chunks)==0:
+        return empty_frame(table)
+    # Dynamic categories of the chunks differ -> cast again after concat
+    return apply_schema(pd.concat(chunks, ignore_index=True), table)
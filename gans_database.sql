@@ -29,6 +29,7 @@ CREATE TABLE population (
 
 -- WEATHER
 -- Stores 5d/3h weather forecasts per city
+-- Monthly partitions on wtime (no foreign keys: not supported on partitioned tables)
 CREATE TABLE weather (
     city_id INT NOT NULL,
     wtime DATETIME NOT NULL,
@@ -41,8 +42,11 @@ CREATE TABLE weather (
     temp_min FLOAT NOT NULL,
     temp_max FLOAT NOT NULL,
     vis FLOAT NOT NULL,
-    PRIMARY KEY(city_id, wtime),
-    FOREIGN KEY (city_id) REFERENCES cities(city_id) -- Primary key to uniquely identify each city
+    PRIMARY KEY(city_id, wtime)
+)
+PARTITION BY RANGE COLUMNS(wtime) (
+    PARTITION p202610 VALUES LESS THAN ('2026-11-01'), -- Everything up to the first month
+    PARTITION pmax VALUES LESS THAN (MAXVALUE) -- Split into monthly partitions by db_retention.py
 );
 
 -- AIRPORTS
@@ -57,30 +61,186 @@ CREATE TABLE airports (
 	INDEX iata_index (iata)  -- Add an index on the 'iata' column
 );
 
--- FLIGHTS
--- Stores flight information
-CREATE TABLE flights (
+-- AIRLINES
+-- Dimension table: every airline name is stored once
+CREATE TABLE airlines (
+    airline_id INT AUTO_INCREMENT,
+    airline VARCHAR(64) NOT NULL,
+    PRIMARY KEY (airline_id),
+    UNIQUE KEY (airline)
+);
+
+-- AIRCRAFT TYPES
+-- Dimension table: every aircraft model is stored once, including its seat-configuration
+CREATE TABLE aircraft_types (
+    aircraft_id INT AUTO_INCREMENT,
+    aircraft VARCHAR(64) NOT NULL,
+    typ_config INT, -- Typical seat-configuration (NULL if aircraft is not in reference list)
+    PRIMARY KEY (aircraft_id),
+    UNIQUE KEY (aircraft)
+);
+
+-- FLIGHTS_FACT
+-- Stores flight information (airline and aircraft as integer keys)
+-- Monthly partitions on scheduled_time (no foreign keys: not supported on partitioned tables)
+CREATE TABLE flights_fact (
     iata CHAR(3) NOT NULL,
-    ftype VARCHAR(16) NOT NULL,
+    ftype ENUM('arrivals', 'departures') NOT NULL,
     fnumber VARCHAR(8) NOT NULL,
     scheduled_time DATETIME NOT NULL,
     revised_time DATETIME,
     terminal VARCHAR(8),
-    aircraft VARCHAR(64),
-    airline VARCHAR(64),
-    typ_config INT DEFAULT 200, -- Median value of aircraft-config. in reference list
+    aircraft_id INT,
+    airline_id INT,
+    codeshares VARCHAR(255), -- Other flight numbers of the same movement (comma-separated)
+    row_hash BIGINT, -- Hash of the content columns, only changed rows are rewritten (see db_changes.py)
     PRIMARY KEY(iata, fnumber, scheduled_time),
-    FOREIGN KEY(iata) REFERENCES airports(iata)
+    INDEX scheduled_time_index (scheduled_time) -- Time-range queries (flightload aggregation in MySQL)
+)
+PARTITION BY RANGE COLUMNS(scheduled_time) (
+    PARTITION p202610 VALUES LESS THAN ('2026-11-01'), -- Everything up to the first month
+    PARTITION pmax VALUES LESS THAN (MAXVALUE) -- Split into monthly partitions by db_retention.py
 );
 
+-- FLIGHTS
+-- Compatibility view: same columns as the former flights-table (used by the dashboard)
+CREATE VIEW flights AS
+SELECT f.iata,
+       f.ftype,
+       f.fnumber,
+       f.scheduled_time,
+       f.revised_time,
+       f.terminal,
+       ac.aircraft,
+       al.airline,
+       ac.typ_config,
+       f.codeshares
+FROM flights_fact f
+LEFT JOIN aircraft_types ac ON ac.aircraft_id = f.aircraft_id
+LEFT JOIN airlines al ON al.airline_id = f.airline_id;
+
 -- CUSTOMERLOAD
 -- Stores modeled customerload
+-- Monthly partitions on ltime (no foreign keys: not supported on partitioned tables)
 CREATE TABLE customerload (
 	city_id INT NOT NULL,
     ltime DATETIME NOT NULL,
     flightload INT NOT NULL,
     baseload INT NOT NULL,
     weatherfac FLOAT,
-    PRIMARY KEY (city_id, ltime),
-    FOREIGN KEY (city_id) REFERENCES cities(city_id) -- Primary key to uniquely identify each city
-);
\ No newline at end of file
+    PRIMARY KEY (city_id, ltime)
+)
+PARTITION BY RANGE COLUMNS(ltime) (
+    PARTITION p202610 VALUES LESS THAN ('2026-11-01'), -- Everything up to the first month
+    PARTITION pmax VALUES LESS THAN (MAXVALUE) -- Split into monthly partitions by db_retention.py
+);
+
+-- CUSTOMERLOAD_BANDS
+-- Quantiles of the total load ((baseload + flightload) * weatherfac) over the
+-- scenarios of the load model (see get_loaddata.simulate_load)
+-- Refreshed for the forecast timeframe on every run
+CREATE TABLE customerload_bands (
+	city_id INT NOT NULL,
+    ltime DATETIME NOT NULL,
+    scenarios SMALLINT NOT NULL,
+    p10 FLOAT,
+    p50 FLOAT,
+    p90 FLOAT,
+    PRIMARY KEY (city_id, ltime)
+);
+
+-- SUMMARY TABLES
+-- Updated incrementally by the pipeline (see db_rollups.py) for cheap dashboard queries.
+-- They also keep the history after partitions of the detail tables were dropped (see db_retention.py)
+CREATE TABLE weather_daily (
+    city_id INT NOT NULL,
+    wday DATE NOT NULL,
+    temp_avg FLOAT,
+    temp_min FLOAT,
+    temp_max FLOAT,
+    rain_sum FLOAT,
+    rain_prob_max FLOAT,
+    windspeed_max FLOAT,
+    samples INT NOT NULL, -- Number of 3h-forecasts aggregated
+    PRIMARY KEY (city_id, wday),
+    FOREIGN KEY (city_id) REFERENCES cities(city_id)
+);
+
+CREATE TABLE flights_daily (
+    iata CHAR(3) NOT NULL,
+    fday DATE NOT NULL,
+    ftype ENUM('arrivals', 'departures') NOT NULL,
+    flights INT NOT NULL,
+    seats INT NOT NULL, -- Sum of typ_config (150 if unknown)
+    PRIMARY KEY (iata, fday, ftype)
+);
+
+CREATE TABLE passengers_hourly (
+    city_id INT NOT NULL,
+    phour DATETIME NOT NULL, -- Start of the hour
+    flights INT NOT NULL,
+    seats INT NOT NULL, -- Sum of typ_config (150 if unknown)
+    passengers INT NOT NULL, -- seats * passenger load factor (82.6%)
+    PRIMARY KEY (city_id, phour),
+    FOREIGN KEY (city_id) REFERENCES cities(city_id)
+);
+
+CREATE TABLE customerload_daily (
+    city_id INT NOT NULL,
+    lday DATE NOT NULL,
+    flightload INT NOT NULL,
+    baseload INT NOT NULL,
+    weatherfac_avg FLOAT,
+    slots INT NOT NULL, -- Number of 3h-slots aggregated
+    PRIMARY KEY (city_id, lday),
+    FOREIGN KEY (city_id) REFERENCES cities(city_id)
+);
+
+-- API_USAGE
+-- Ledger of metered API-calls per endpoint and day (see api_quota.py)
+CREATE TABLE api_usage (
+    api VARCHAR(32) NOT NULL,
+    endpoint VARCHAR(64) NOT NULL,
+    uday DATE NOT NULL,
+    calls INT NOT NULL DEFAULT 0,
+    errors INT NOT NULL DEFAULT 0, -- Responses other than 200 (e.g. 429 = quota exceeded)
+    PRIMARY KEY (api, endpoint, uday)
+);
+
+-- Checkpoints of pipeline runs (see db_checkpoints.py)
+-- unit '*' = whole stage, otherwise city/airport within the stage
+CREATE TABLE run_state (
+    run_window DATETIME NOT NULL, -- Start of the run window (UTC)
+    stage VARCHAR(32) NOT NULL,
+    unit VARCHAR(64) NOT NULL DEFAULT '*',
+    status ENUM('done', 'failed') NOT NULL,
+    message VARCHAR(255), -- Error message of failed units
+    updated DATETIME NOT NULL,
+    PRIMARY KEY (run_window, stage, unit)
+);
+
+-- Last successful refresh per stage (see db_refresh.py)
+-- Stages only run when their refresh policy says they are due
+CREATE TABLE stage_refresh (
+    stage VARCHAR(32) NOT NULL,
+    last_success DATETIME NOT NULL, -- UTC
+    PRIMARY KEY (stage)
+);
+
+-- Last full 5d/3h-forecast per city (see get_weatherdata.py)
+-- Reruns within get_weatherdata.WEATHER_TTL_HOURS are served from here
+CREATE TABLE weather_cache (
+    city_id INT NOT NULL,
+    fetched DATETIME NOT NULL, -- UTC
+    forecast MEDIUMTEXT NOT NULL, -- 'list' of the API-response (JSON)
+    PRIMARY KEY (city_id)
+);
+
+-- Version per table, increased whenever new rows were written
+-- The read-API (read_api.py) drops its cached answers when it changes
+CREATE TABLE data_versions (
+    name VARCHAR(32) NOT NULL,
+    version INT NOT NULL DEFAULT 0,
+    updated DATETIME, -- UTC
+    PRIMARY KEY (name)
+);
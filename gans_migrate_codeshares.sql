@@ -0,0 +1,20 @@
+-- MIGRATION: CODESHARE ALIAS-LIST ON flights_fact
+-- Run once on an existing "gans"-database (after gans_migrate_dimensions.sql).
+USE gans;
+
+ALTER TABLE flights_fact ADD COLUMN codeshares VARCHAR(255) AFTER airline_id;
+
+CREATE OR REPLACE VIEW flights AS
+SELECT f.iata,
+       f.ftype,
+       f.fnumber,
+       f.scheduled_time,
+       f.revised_time,
+       f.terminal,
+       ac.aircraft,
+       al.airline,
+       ac.typ_config,
+       f.codeshares
+FROM flights_fact f
+LEFT JOIN aircraft_types ac ON ac.aircraft_id = f.aircraft_id
+LEFT JOIN airlines al ON al.airline_id = f.airline_id;
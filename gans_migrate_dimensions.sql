@@ -0,0 +1,37 @@
+-- MIGRATION: FLIGHTS-TABLE -> flights_fact + DIMENSION TABLES
+-- Run once on an existing "gans"-database that still has the old flights-table.
+-- Creates airlines, aircraft_types and flights_fact as in gans_database.sql first!
+USE gans;
+
+-- Fill dimension tables from existing flights
+INSERT IGNORE INTO airlines (airline)
+SELECT DISTINCT airline FROM flights WHERE airline IS NOT NULL;
+
+INSERT IGNORE INTO aircraft_types (aircraft, typ_config)
+SELECT aircraft, MAX(typ_config) FROM flights WHERE aircraft IS NOT NULL GROUP BY aircraft;
+
+-- Copy flights with integer keys
+INSERT IGNORE INTO flights_fact
+    (iata, ftype, fnumber, scheduled_time, revised_time, terminal, aircraft_id, airline_id)
+SELECT f.iata, f.ftype, f.fnumber, f.scheduled_time, f.revised_time, f.terminal,
+       ac.aircraft_id, al.airline_id
+FROM flights f
+LEFT JOIN aircraft_types ac ON ac.aircraft = f.aircraft
+LEFT JOIN airlines al ON al.airline = f.airline;
+
+-- Replace old table by compatibility view
+RENAME TABLE flights TO flights_old;
+CREATE VIEW flights AS
+SELECT f.iata,
+       f.ftype,
+       f.fnumber,
+       f.scheduled_time,
+       f.revised_time,
+       f.terminal,
+       ac.aircraft,
+       al.airline,
+       ac.typ_config
+FROM flights_fact f
+LEFT JOIN aircraft_types ac ON ac.aircraft_id = f.aircraft_id
+LEFT JOIN airlines al ON al.airline_id = f.airline_id;
+-- DROP TABLE flights_old; -- After checking the dashboard
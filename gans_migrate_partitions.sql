@@ -0,0 +1,31 @@
+-- MIGRATION: MONTHLY PARTITIONS FOR weather, flights_fact AND customerload
+-- Run once on an existing "gans"-database (after gans_migrate_dimensions.sql).
+-- Create the rollup tables weather_daily, flights_daily and customerload_daily
+-- as in gans_database.sql first.
+-- Partitioned tables can't have foreign keys -> drop them first.
+-- Check the constraint names with: SHOW CREATE TABLE <table>;
+USE gans;
+
+ALTER TABLE weather DROP FOREIGN KEY weather_ibfk_1;
+ALTER TABLE weather
+PARTITION BY RANGE COLUMNS(wtime) (
+    PARTITION p202610 VALUES LESS THAN ('2026-11-01'),
+    PARTITION pmax VALUES LESS THAN (MAXVALUE)
+);
+
+ALTER TABLE flights_fact DROP FOREIGN KEY flights_fact_ibfk_1;
+ALTER TABLE flights_fact DROP FOREIGN KEY flights_fact_ibfk_2;
+ALTER TABLE flights_fact DROP FOREIGN KEY flights_fact_ibfk_3;
+ALTER TABLE flights_fact
+PARTITION BY RANGE COLUMNS(scheduled_time) (
+    PARTITION p202610 VALUES LESS THAN ('2026-11-01'),
+    PARTITION pmax VALUES LESS THAN (MAXVALUE)
+);
+
+ALTER TABLE customerload DROP FOREIGN KEY customerload_ibfk_1;
+ALTER TABLE customerload
+PARTITION BY RANGE COLUMNS(ltime) (
+    PARTITION p202610 VALUES LESS THAN ('2026-11-01'),
+    PARTITION pmax VALUES LESS THAN (MAXVALUE)
+);
+-- Monthly partitions are added from here on by db_retention.run_retention()
@@ -0,0 +1,6 @@
+-- MIGRATION: ROW-HASH ON flights_fact
+-- Run once on an existing "gans"-database (after gans_migrate_codeshares.sql).
+-- Existing rows keep NULL and get their hash when they are fetched again.
+USE gans;
+
+ALTER TABLE flights_fact ADD COLUMN row_hash BIGINT AFTER codeshares;
@@ -6,10 +6,10 @@ Created on Mon Apr  8 08:54:56 2024
 """
 
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
 # --- Custom modules
-from get_keys import get_keys
+import app_context as ctx
+import db_schema as dbs
+import html_tables as ht
 
 
 # =============================================================================
@@ -19,20 +19,24 @@ def get_geocoords(cities):
     if(type(cities) is str):
         cities = [cities]
     # --- INITIALIZE NEW DATAFRAME
-    geocoords = pd.DataFrame({'city':[],
-                       'latitude':[],
-                       'longitude':[],
-                       'country':[]})
+    geocoords = dbs.empty_frame('cities',
+                                columns=['city','latitude','longitude','country'])
+    # Geocodes found before (kept in the application context)
+    known = ctx.get_reference('geocodes', dict)
     # Set query parameters
     for i,city in enumerate(cities):
-        params = {
-            'q':city,
-            'appid':get_keys('openweathermap')
-            }
-        # Build query URL
-        url = "http://api.openweathermap.org/geo/1.0/direct?"
-        # Query API and store response
-        response = requests.get(url,params).json()[0]
+        if city in known:
+            response = known[city]
+        else:
+            params = {
+                'q':city,
+                'appid':ctx.get_secret('openweathermap')
+                }
+            # Build query URL
+            url = "http://api.openweathermap.org/geo/1.0/direct?"
+            # Query API and store response
+            response = ctx.get_session('openweathermap').get(url,params=params).json()[0]
+            known[city] = response
         # Transform response to dataframe
         res = pd.DataFrame({
             'city':city,
@@ -43,8 +47,8 @@ def get_geocoords(cities):
         # Extrend DataFrame
         geocoords = pd.concat([geocoords,res])
                          
-    # Return response
-    return geocoords
+    # Return response (with compact dtypes)
+    return dbs.apply_schema(geocoords,'cities')
 
 
 # =============================================================================
@@ -55,17 +59,13 @@ def get_population(cities):
         cities = [cities]
     # Connect to List of cities with over 1 Mio. Inhabitants on Wikipedia
     url = "https://en.wikipedia.org/wiki/List_of_cities_with_over_one_million_inhabitants"
-    soup = BeautifulSoup(requests.get(url).content, 'html.parser')
-    # Get table from page
-    citytable = soup.find_all('table')[1].find('tbody').find_all('tr')
-    # Initialize empty DataFrame
-    citydata = {}
-    # --- GO THROUGH CITY TABLE
-    for i in range(1,len(citytable)):
-        td = citytable[i].find_all('td')
-        name = td[0].text.split("\n")[0]
-        population = int(td[2].text.split("\n")[0].replace(',',''))
-        citydata[name] = population
+    # Only the second table of the page is parsed (see html_tables.py)
+    citytable = ht.read_table(ctx.get_session('web').get(url).content,
+                              {'city':(0,'line'),'population':(2,'number')},
+                              index=1)
+    citydata = {name:int(population) for name, population
+                in zip(citytable['city'], citytable['population'])
+                if pd.notna(population)}
     # Output population of selected cities
     res = [citydata.get(key) for key in cities]
     # Output scalar value in case of scalar query
@@ -18,7 +18,7 @@ Usage:
         - scheduled_time
             (Scheduled Arrival or Departure time)
         - revised_time
-            (In case of delays. Advise: Don't use for now...')
+            (In case of delays, NaN if the API has no revised time)
         - terminal
             (Terminal where the flight arrives/departs)
         - aircraft
@@ -32,7 +32,7 @@ Usage:
     Take 82.6% of typ. config. to get an estimate for the passanger count.
     
 Notes:
-    revised_time is mostly NaN and might not work.
+    revised_time is only given by the API for some flights (mostly NaN).
 
 """
 
@@ -43,11 +43,22 @@ import time
 import requests
 import numpy as np
 import pandas as pd
-from bs4 import BeautifulSoup
 from datetime import datetime, timedelta
 # --- Custom modules
-from get_keys import get_keys
-from get_citydata import get_geocoords
+import app_context as ctx
+import db_schema as dbs
+import api_quota as quota
+import airport_index as idx
+import html_tables as ht
+
+
+# =============================================================================
+# FRAME COLUMN-NAMES THAT DIFFER FROM DATABASE COLUMN-NAMES
+# {db_column: frame_column}
+# =============================================================================
+FLIGHTS_RENAME = {'fnumber':'number',
+                  'ftype':'type',
+                  'typ_config':'typ. config.'}
 
 
 # =============================================================================
@@ -57,34 +68,19 @@ def get_aircraftinfo():
     print("Getting aircraft information...")
     # --- SCRAPE AXONAVIATION WEBSITE
     url = "http://www.axonaviation.com/commercial-aircraft/aircraft-data/aircraft-specifications"
-    soup = BeautifulSoup(requests.get(url).content, 'html.parser')
+    response = ctx.get_session('web').get(url)
     print("Aircrafttable query successful.")
-    aircrafttable = soup.find_all('table', class_='data-grid')[0].find_all('tr')
-    # --- INITIALIZE DATAFRAME
-    aircraftinfo = pd.DataFrame({
-        'name':[],
-        'max. config.':[],
-        'typ. config.':[],
-        'no. engines':[],
-        'prim. operators':[]
-    })
-    # --- GO THROUGH TABLE-INFORMATION
-    for i, model in enumerate(aircrafttable):
-        if i==0:
-            # Skip first row (=header)
-            pass
-        else:
-            # Get aircraft-info from columns
-            info = model.find_all('td')
-            aircraftinfo.loc[i,'name'] = info[0].text
-            aircraftinfo.loc[i,'max. config.'] = info[7].text
-            aircraftinfo.loc[i,'typ. config.'] = info[8].text
-            aircraftinfo.loc[i,'no. engines'] = info[9].text
-            aircraftinfo.loc[i,'prim. operators'] = info[11].text
-    # Convert number-values from string to numeric (might contain NaNs!)
-    aircraftinfo['no. engines'] = aircraftinfo['no. engines'].astype(int)
-    aircraftinfo['max. config.'] = pd.to_numeric(aircraftinfo['max. config.'],errors='coerce')
-    aircraftinfo['typ. config.'] = pd.to_numeric(aircraftinfo['typ. config.'],errors='coerce')
+    # --- ONLY THE FIRST TABLE OF CLASS data-grid IS PARSED (see html_tables.py)
+    # Number-values are converted from string (might contain NaNs!)
+    aircraftinfo = ht.read_table(response.content,
+                                 {'name':(0,'text'),
+                                  'max. config.':(7,'number'),
+                                  'typ. config.':(8,'number'),
+                                  'no. engines':(9,'number'),
+                                  'prim. operators':(11,'text')},
+                                 cls='data-grid')
+    # Apply compact dtypes
+    aircraftinfo = dbs.apply_schema(aircraftinfo,'aircraftinfo')
     
     # Drop aircraft whose names end on 'F' as they are cargo aircraft
     aircraftinfo = aircraftinfo[aircraftinfo['name'].str[-1:]!='F']
@@ -103,7 +99,8 @@ def get_aircraftinfo():
 def get_flight_capacity(flights):
     print("Getting flight capacity...")
     # --- GET REFERENCE INFORMATION ABOUT AIRCRAFTS
-    aircraftinfo = get_aircraftinfo()
+    # (scraped once per instance, see app_context.REFERENCE_TTL)
+    aircraftinfo = ctx.get_reference('aircraftinfo', get_aircraftinfo)
     
     # --- GET ALL UNIQUE AIRCRAFT FROM CURRENT FLIGHTS
     f_aircrafts = pd.DataFrame(flights['aircraft'].drop_duplicates().reset_index(drop=True))
@@ -158,48 +155,113 @@ def get_flight_capacity(flights):
 # INITIALIZE DATAFRAME TO STORE FLIGHTS
 # =============================================================================
 def init_flights_df():
-    flights = pd.DataFrame({
-        'iata':[],
-        'number':[],
-        'type':[],
-        'scheduled_time':[],
-        'revised_time':[],
-        'terminal':[],
-        'aircraft':[],
-        'airline':[],
-        'typ. config.':[]
-    })
+    # Typed according to db_schema (API column-names)
+    flights = dbs.empty_frame('flights', rename=FLIGHTS_RENAME)
     return flights
 
 
+# =============================================================================
+# APPLY COMPACT DTYPES TO FLIGHTS-DATAFRAME (API COLUMN-NAMES)
+# =============================================================================
+def apply_flights_schema(flights):
+    return dbs.apply_schema(flights, 'flights', rename=FLIGHTS_RENAME)
+
+
+# =============================================================================
+# COLLAPSE CODESHARE FLIGHTS
+# With "withCodeshared" the API lists one physical flight under every
+# flight number that is sold for it. Rows with equal CODESHARE_KEYS are one
+# movement: only the operating carrier's row is kept, the other numbers are
+# stored as comma-separated list in 'codeshares'.
+# If a group has several operators, they are kept (different flights).
+# Rows with a missing key (e.g. no aircraft or terminal) are not collapsed:
+# different flights at the same time would look equal.
+# =============================================================================
+CODESHARE_KEYS = ['iata','type','scheduled_time','aircraft','terminal']
+
+def collapse_codeshares(flights):
+    if flights.shape[0]==0:
+        return flights.drop(columns='codeshare_status')
+    # --- OPERATOR FIRST, THEN BY FLIGHT NUMBER
+    flights = flights.assign(
+        _operator=(flights['codeshare_status']=='IsOperator'))
+    flights = flights.sort_values(['_operator','number'],
+                                  ascending=[False,True],
+                                  kind='stable')
+    # Group-ID per physical flight (only rows with all keys)
+    complete = flights[CODESHARE_KEYS].notna().all(axis=1)
+    group = (flights[complete]
+             .groupby(CODESHARE_KEYS, sort=False, observed=True).ngroup())
+    # --- KEEP OPERATORS, THE FIRST ROW OF GROUPS WITHOUT OPERATOR AND
+    # --- ROWS WITHOUT GROUP
+    first = (~group.duplicated()).reindex(flights.index, fill_value=True)
+    keep = flights['_operator'] | first
+    # --- FLIGHT NUMBERS OF DROPPED ROWS -> ALIAS-LIST OF FIRST ROW
+    dropped = flights.index[~keep]
+    aliases = (flights.loc[dropped,'number'].astype(str)
+               .groupby(group[dropped]).agg(','.join))
+    flights['codeshares'] = group.map(aliases).reindex(flights.index).where(first)
+    print(f"Collapsed {int((~keep).sum())} codeshare-duplicates.")
+    # Return one row per physical flight (original order)
+    return (flights[keep]
+            .sort_index()
+            .drop(columns=['_operator','codeshare_status']))
+
+
 # =============================================================================
 # GET AIRPORTS BY LOCATION
+# Offline reference first (airport_index.py), API only for unknown locations.
+# Successful API-searches are kept in the application context.
+# Failed requests raise (the city is retried), no budget gives no airports.
 # =============================================================================
 def get_airports(latitude,longitude):
     print("Getting airports by lat/lon coordinates...")
-    radius = 75
-    limit = 1
-
-    list_for_df = []
+    airports = idx.find_airports(latitude, longitude)
+    if airports.shape[0]>0:
+        print(f"Airports found in reference: {', '.join(airports['iata'])}")
+        return airports
+    searches = ctx.get_reference('airport_searches', dict)
+    location = (round(float(latitude),4), round(float(longitude),4))
+    if location in searches:
+        print("Airports found in application context.")
+        return searches[location].copy()
+    radius = idx.RADIUS_KM
+    limit = idx.LIMIT
 
     url = "https://aerodatabox.p.rapidapi.com/airports/search/location"
 
     querystring = {"lat":latitude,"lon":longitude,"radiusKm":radius,"limit":limit,"withFlightInfoOnly":"true"}
     
     headers = {
-    	"X-RapidAPI-Key": get_keys('aeroboxdata'),
+    	"X-RapidAPI-Key": ctx.get_secret('aeroboxdata'),
     	"X-RapidAPI-Host": "aerodatabox.p.rapidapi.com"
     }
     
+    no_airports = pd.DataFrame({'iata':[],'location.lat':[],'location.lon':[]})
+    
+    # --- NO BUDGET LEFT -> NO AIRPORTS
+    if not quota.allow_call('aerodatabox'):
+        print("No AeroDataBox-budget left, skipping airport search.")
+        return no_airports
+    
+    # Space the API-calls
+    time.sleep(0.5)
     try:
-        response = requests.get(url, headers=headers, params=querystring)
-        print(response)
-    except:
-        print("Error from AeroboxData.")
-
-    list_for_df.append(pd.json_normalize(response.json()['items']))
+        response = ctx.get_session('aerodatabox').get(url, headers=headers, params=querystring)
+    except requests.RequestException as e:
+        quota.record_call('aerodatabox', 'airports/search/location', error=True)
+        raise RuntimeError(f"Error from AeroboxData ({e}).") from e
+    quota.record_call('aerodatabox', 'airports/search/location', response)
+    print(response)
+    # Quota exceeded (429) or API-error -> no 'items' in the response
+    if response.status_code!=200:
+        raise RuntimeError(f"Error from AeroboxData (HTTP {response.status_code}).")
 
-    return pd.concat(list_for_df, ignore_index=True)
+    airports = pd.json_normalize(response.json().get('items', []))
+    if airports.shape[0]==0:
+        airports = no_airports
+    searches[location] = airports.copy()
+    return airports
 
 
 # =============================================================================
@@ -209,7 +271,7 @@ def get_flights(t0,t1,IATA_code):
     print("Getting flights-information...")
     # Source:
     # https://rapidapi.com/aedbx-aedbx/api/aerodatabox/
-    API_key_aero = get_keys('aeroboxdata')
+    API_key_aero = ctx.get_secret('aeroboxdata')
 
     # --- QUERY AERODATABOX API
     url = f"https://aerodatabox.p.rapidapi.com/flights/airports/iata/{IATA_code}/{t0}/{t1}"
@@ -222,12 +284,21 @@ def get_flights(t0,t1,IATA_code):
     	"X-RapidAPI-Key": API_key_aero,
     	"X-RapidAPI-Host": "aerodatabox.p.rapidapi.com"
     }
+    # --- NO BUDGET LEFT -> NO FLIGHTS
+    if not quota.allow_call('aerodatabox'):
+        print(f"No AeroDataBox-budget left, skipping {IATA_code} at {t0}.")
+        return init_flights_df()
     print(f"Query flights for airport {IATA_code} at {t0}...")
-    response = requests.get(url, headers=headers, params=querystring)
+    response = ctx.get_session('aerodatabox').get(url, headers=headers, params=querystring)
+    quota.record_call('aerodatabox', 'flights/airports/iata', response)
     print(response)
+    # Quota exceeded -> empty result instead of failing
+    if response.status_code==429:
+        return init_flights_df()
     
-    # --- INITIALIZE DATAFRAME TO STORE FLIGHT INFO
-    flights = init_flights_df()
+    # --- COLLECT FLIGHT INFO ROW BY ROW
+    # (One list for arrivals AND departures -> no overwriting of rows)
+    rows = []
     
     if(list(response.json().keys())[0]=="message"):
         print('\n---! API-Error !---\n')
@@ -239,43 +310,54 @@ def get_flights(t0,t1,IATA_code):
         L = response.json()[flighttype]
         # --- GO THROUGH INDIVIDUAL FLIGHTS
         for i in range(len(L)):
+            row = {}
             # Store IATA_code (needed for requests with multiple airports)
-            flights.loc[i,'iata'] = IATA_code
+            row['iata'] = IATA_code
             # Type of flight (Arrival or Departure)
-            flights.loc[i,'type'] = flighttype
+            row['type'] = flighttype
             #
-            flights.loc[i,'number'] = L[i]['number']
+            row['number'] = L[i]['number']
             # Scheduled time (for arrivals) in UTC (to match with weather data)
-            flights.loc[i,'scheduled_time'] = L[i]['movement']['scheduledTime']['utc']
+            row['scheduled_time'] = L[i]['movement']['scheduledTime']['utc']
             # Revised time (for arrivals) in UTC (to match with weather data)
-            if('revised_time' in L[i]['movement'].keys()):
-                flights.loc[i,'revised_time'] = L[i]['movement']['revisedTime']['utc']
+            # Without the trailing 'Z', like scheduled_time
+            if('revisedTime' in L[i]['movement'].keys()):
+                row['revised_time'] = L[i]['movement']['revisedTime']['utc'].rstrip('Z')
             # Terminal
             if('terminal' in L[i]['movement'].keys()):
-                flights.loc[i,'terminal'] = L[i]['movement']['terminal']
+                row['terminal'] = L[i]['movement']['terminal']
             # Aircraft type
             if('aircraft' in L[i].keys()):
-                flights.loc[i,'aircraft'] = L[i]['aircraft']['model']
+                row['aircraft'] = L[i]['aircraft']['model']
             # Airline name
-            flights.loc[i,'airline'] = L[i]['airline']['name']
+            row['airline'] = L[i]['airline']['name']
+            # Codeshare-status (IsOperator, IsCodeshared, Unknown)
+            row['codeshare_status'] = L[i].get('codeshareStatus','Unknown')
+            rows.append(row)
+    
+    # --- BUILD DATAFRAME (all columns, even if no flight had them)
+    flights = pd.DataFrame(rows, columns=list(init_flights_df().columns)
+                           +['codeshare_status'])
+    
+    # Collapse codeshare-duplicates to one row per physical flight
+    flights = collapse_codeshares(flights)
     
     # Convert time-values to datetime-format
     flights['scheduled_time'] = pd.to_datetime(flights['scheduled_time'].str[:-1])
     flights['revised_time'] = pd.to_datetime(flights['revised_time'])
     
     # Return DataFrame of flights, also containing passenger capacity
-    return get_flight_capacity(flights)
+    return apply_flights_schema(get_flight_capacity(flights))
 
 
 
 # =============================================================================
-# GET FLIGHTSDATA FOR SPECIFIC TIMEFRAME - STARTING NOW
+# SPLIT TIMEFRAME INTO QUERY-WINDOWS - STARTING NOW
+# Returns list of (t0, t1) as datetime
 # =============================================================================
-def get_flights_by_iata(IATA_code,timeframe):
-    print("Getting flights per airport and timeframe...")
-    # --- INITIALIZE EMPTY DATAFRAME
-    flights = init_flights_df()
-    
+def get_time_windows(timeframe, now=None):
+    now = now or datetime.now()
+    windows = []
     # --- Max. query-duration for flights API is 12h
     timestep = 12
         
@@ -284,7 +366,7 @@ def get_flights_by_iata(IATA_code,timeframe):
     # Timeframe is 27h: step0 12h, step1 24h, step3 27h
     for i in range( int(timeframe/timestep)+1):
         # Start Time
-        t0 = datetime.now() + timedelta(hours = i*12)
+        t0 = now + timedelta(hours = i*12)
         # Timedelta
         td = min(timestep,(timeframe - i*timestep))
         
@@ -294,76 +376,33 @@ def get_flights_by_iata(IATA_code,timeframe):
         
         # End Time
         t1 = t0 + timedelta(hours = td) - timedelta(seconds=1)
+        windows.append((t0, t1))
+    return windows
+
+
+# =============================================================================
+# GET FLIGHTSDATA FOR SPECIFIC TIMEFRAME - STARTING NOW
+# plan: optional set of (IATA_code, window-index) that may be requested
+# (see api_quota.plan_flight_windows)
+# =============================================================================
+def get_flights_by_iata(IATA_code,timeframe,plan=None):
+    print("Getting flights per airport and timeframe...")
+    # --- INITIALIZE EMPTY DATAFRAME
+    flights = init_flights_df()
+    
+    # --- GO THROUGH QUERY-WINDOWS
+    for i, (t0, t1) in enumerate(get_time_windows(timeframe)):
+        # Skip windows that are not part of the plan
+        if plan is not None and (IATA_code, i) not in plan:
+            print(f"Skipping {IATA_code} window {i} (not planned).")
+            continue
         
         # Convert times to format needed by API
         t0 = t0.strftime("%Y-%m-%dT%H:%M")
         t1 = t1.strftime("%Y-%m-%dT%H:%M")
         
-        # print(td)
-        # print(t0)
-        # print(t1)
-        
         # Request and store results
         flights = pd.concat([flights, get_flights(t0, t1, IATA_code)])
     
     # Return DataFrame with all results
     return flights
-
-
-# =============================================================================
-# GET FLIGHTS BY CITY-NAME
-# =============================================================================
-def get_flights_by_city(city,timeframe):
-    print("Getting flights per city and timeframe...")
-    # Get latitude/longitude for city
-    geocoords = get_geocoords(city)
-    # Get airport list for lat/lon
-    airports = get_airports(geocoords['latitude'], geocoords['longitude'])
-    # Initialize empty DataFrame
-    flights = init_flights_df()
-    # --- GO THROUGH AIRPORT-LIST
-    # Check if any airport was found
-    if(airports.shape[0]>0):
-        print(f"Found {airports.shape[0]} airport(s) for {city}.")
-        for i,IATA_code in enumerate(airports['iata']):
-            print(f"Get flights for {IATA_code}...")
-            time.sleep(0.2)
-            try:
-                # Try to get flights-data for current IATA-code
-                flights = pd.concat([flights, get_flights_by_iata(IATA_code,timeframe)])
-                print(f"Check: {city} - {IATA_code}")
-            except:
-                # Sometimes IATA-codes don't work -> print error-msg
-                print(f"Error occured: {city} - {IATA_code}")
-    else:
-        print(f"Did not find any airports for {city}!")
-    # Append cityname-column
-    flights['city'] = city
-    # Return results
-    return flights
-
-
-# =============================================================================
-# GET MULTIPLE FLIGHTS
-# =============================================================================
-def get_flightsdata(cities,timeframe=24):
-    print("Get full flightsdata for city-list and timeframe...")
-    # --- MAKE LIST IN CASE INPUT IS SINGLE CITY
-    if(type(cities) is str):
-        cities = [cities]
-    # --- INITIALIZE EMPTY DATAFRAME
-    flights = init_flights_df()
-    # Append city-column
-    flights['city'] = []
-    # --- GO THROUGH ALL CITIES
-    for city in cities:
-        flights = pd.concat([flights, get_flights_by_city(city,timeframe)])
-    # Return results
-    return flights
-
-
-# --- TESTING SINGLE
-# get_flightsdata('Berlin',2)
-
-# -- TESTING MULTI
-# get_flightsdata(['Cologne','Munich'])
\ No newline at end of file
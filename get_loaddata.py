@@ -5,6 +5,7 @@ Created on Mon Apr  8 15:52:54 2024
 
 """
 
+import os
 import random as rnd
 import numpy as np
 import pandas as pd
@@ -12,6 +13,9 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from datetime import datetime
 from scipy.interpolate import splrep, BSpline
+from sqlalchemy import text
+from multiprocessing import get_context, shared_memory
+from concurrent.futures import ProcessPoolExecutor
 # ---
 import customplots as cp
 cp.customfont(10)
@@ -67,8 +71,7 @@ def get_customerload(flightload_city,weatherfactor_city,baseload_city):
 # =============================================================================
 # BASELOAD FROM 0...24h IN 0...100%
 # =============================================================================
-def get_baseload(xq,population,seed=rnd.random()):
-    print("Get baseload by population...")
+def baseload_points(seed):
     # Min and Max relative load
     lmin = 0.001
     lmax = 0.1
@@ -77,6 +80,7 @@ def get_baseload(xq,population,seed=rnd.random()):
     rnd.seed(seed)
     
     # Define base points
+    # (Integer array: the random shift of the hours is truncated to -1 or 0)
     x = np.array([0,
                   2,
                   8,
@@ -97,6 +101,15 @@ def get_baseload(xq,population,seed=rnd.random()):
         x[i] += rnd.uniform(-0.9,0.9)
         y[i] *= rnd.uniform(0.8,1.2)
     
+    # Return base points
+    return x, y
+
+
+def get_baseload(xq,population,seed=rnd.random()):
+    print("Get baseload by population...")
+    # Base points of the curve
+    x, y = baseload_points(seed)
+    
     # Create B-spline interpolation function
     t, c, k = splrep(x, y, s=0, k=2)
     spline = BSpline(t, c, k, extrapolate=False)    
@@ -195,13 +208,69 @@ def get_weatherfactor_per_city(weather,cities):
     return res
     
 # =============================================================================
-# GET LOAD OF CUSTOMERS FROM FLIGHT-PASSENGERS
+# 3H-BUCKETING KERNEL
+# Sums values per (key, 3h-bucket) in one pass with np.bincount.
+# codes: integer key per row (0...n_keys-1, negative = drop row)
+# Returns dense arrays sums/counts of shape (n_keys, n_buckets) and the
+# epoch-index of the first bucket.
+# Buckets are floored to multiples of 3h since 1970-01-01 00:00, which is
+# the same raster as resample('3H') (3h divides 24h).
 # =============================================================================
-def get_flightload_per_airport(flights,seed=rnd.random()):
-    print("Get flightload per airport...")
-    # Get seat configuration from flights
-    passengers = get_passengers(flights)
-    
+BUCKET_HOURS = 3
+
+def bucket_matrix(codes, n_keys, times, values, hours=BUCKET_HOURS):
+    width = np.int64(hours*3600*10**9)
+    codes = np.asarray(codes, dtype=np.int64)
+    times = np.asarray(times, dtype='datetime64[ns]')
+    values = np.nan_to_num(np.asarray(values, dtype=np.float64))
+    # Drop rows without key or without time
+    valid = (codes>=0) & ~np.isnat(times)
+    codes, times, values = codes[valid], times[valid], values[valid]
+    if codes.size==0 or n_keys==0:
+        return np.zeros((n_keys,0)), np.zeros((n_keys,0),dtype=np.int64), 0
+    # Integer bucket-index relative to first bucket
+    buckets = times.view(np.int64)//width
+    b0 = buckets.min()
+    n_buckets = int(buckets.max()-b0+1)
+    # Flat (key, bucket)-index -> single bincount for sums and counts
+    flat = codes*n_buckets + (buckets-b0)
+    size = n_keys*n_buckets
+    sums = np.bincount(flat, weights=values, minlength=size).reshape(n_keys, n_buckets)
+    counts = np.bincount(flat, minlength=size).reshape(n_keys, n_buckets)
+    return sums, counts, b0
+
+
+# =============================================================================
+# DENSE BUCKET-MATRIX TO LONG DATAFRAME
+# Like resample('3H'): per key every bucket between the first and the last
+# occupied one (empty buckets in between -> 0)
+# =============================================================================
+def bucket_frame(sums, counts, b0, labels, keycol, valcol,
+                 hours=BUCKET_HOURS, timecol='scheduled_time'):
+    width = np.int64(hours*3600*10**9)
+    occupied = counts>0
+    if occupied.size==0:
+        return pd.DataFrame({keycol:pd.Series([],dtype=object),
+                             timecol:pd.Series([],dtype='datetime64[ns]'),
+                             valcol:pd.Series([],dtype=np.float64)})
+    n_buckets = occupied.shape[1]
+    # First and last occupied bucket per key
+    first = occupied.argmax(axis=1)
+    last = n_buckets-1-occupied[:,::-1].argmax(axis=1)
+    pos = np.arange(n_buckets)
+    select = ((pos>=first[:,None]) & (pos<=last[:,None])
+              & occupied.any(axis=1)[:,None])
+    key_idx, bucket_idx = np.nonzero(select)
+    return pd.DataFrame({
+        keycol:np.asarray(labels, dtype=object)[key_idx],
+        timecol:((b0+bucket_idx)*width).astype('datetime64[ns]'),
+        valcol:sums[key_idx,bucket_idx]})
+
+
+# =============================================================================
+# SHARE OF SEATS THAT TURN INTO E-SCOOTER CUSTOMERS
+# =============================================================================
+def get_flightload_ratio(seed=rnd.random()):
     # Typical loadout for passenger planes
     # Source:
     # https://www.statista.com/statistics/658830/passenger-load-factor-of-commercial-airlines-worldwide/#:~:text=Commercial%20airlines%20worldwide%20%2D%20passenger%20load%20factor%202005%2D2023&text=Global%20airlines'%20combined%20passenger%20load,factor%20dropped%20to%2065%20percent
@@ -214,27 +283,36 @@ def get_flightload_per_airport(flights,seed=rnd.random()):
     lmin = 0.005
     lmax = 0.05
     
+    # Share of passengers per plane using an e-scooter
+    return rnd.uniform(lmin,lmax)*loadfac
+
+
+# =============================================================================
+# GET LOAD OF CUSTOMERS FROM FLIGHT-PASSENGERS
+# =============================================================================
+def get_flightload_per_airport(flights,seed=rnd.random()):
+    print("Get flightload per airport...")
+    # Get seat configuration from flights
+    passengers = get_passengers(flights)
+    
     # Amount of passengers per plane using an e-scooter
-    flightload = passengers*rnd.uniform(lmin,lmax)*loadfac
+    flightload = passengers*get_flightload_ratio(seed)
     
     # Return rounded result
     flightload = round(flightload).rename('flightload')
     
-    # Add scheduled time and IATA-code back to result
-    res = pd.concat([flights[['scheduled_time','iata']],flightload],axis=1)
-    # Try/Except for the case that flights-data is missing
-    try:
-        # Group by airport and sum up load for 3h each
-        # (Because weather forecast is based on 3h)
-        res = (res
-               .set_index('scheduled_time')
-               .groupby('iata')
-               .resample('3H')
-               .sum('flightload')
-               .reset_index()
-               )
-    except:
-        print("Error detected. Probably no flights data available.")
+    # Check for the case that flights-data is missing
+    if flights.shape[0]==0:
+        print("No flights data available.")
+        return bucket_frame(np.zeros((0,0)), np.zeros((0,0)), 0, [],
+                            'iata', 'flightload')
+    
+    # Group by airport and sum up load for 3h each
+    # (Because weather forecast is based on 3h)
+    codes, labels = pd.factorize(flights['iata'], sort=True)
+    sums, counts, b0 = bucket_matrix(codes, len(labels),
+                                     flights['scheduled_time'], flightload)
+    res = bucket_frame(sums, counts, b0, labels, 'iata', 'flightload')
     # Return results
     return res
 
@@ -244,30 +322,78 @@ def get_flightload_per_airport(flights,seed=rnd.random()):
 # =============================================================================
 def get_flightload_per_city(flightload,airports,cities):
     print("Get flightload per city...")
-    # --- MERGE CITY TABLE TO FLIGHTLOAD TO GET CITY-NAMES
-    res= (
-        flightload
-        # Get City ID from airports table
-        .merge(airports[['iata','city_id']],on='iata',how='left')
-        # Get City Name from cities table
-        .merge(cities[['city','city_id']],on='city_id',how='left')
-        # Drop IATA and city_id columns
-        .drop(columns=['iata','city_id'])
-        )
+    # --- INTEGER CODES FOR AIRPORTS (ROWS OF FLIGHTLOAD)
+    iata_codes, iata_labels = pd.factorize(flightload['iata'].astype(object))
+    # Sums per airport and 3h (flightload is already bucketed)
+    sums, counts, b0 = bucket_matrix(iata_codes, len(iata_labels),
+                                     flightload['scheduled_time'],
+                                     flightload['flightload'])
+    # --- AIRPORT -> CITY PAIRS
+    # (An airport may belong to several cities)
+    pairs = (airports[['iata','city_id']]
+             .astype({'iata':object})
+             .merge(cities[['city','city_id']],on='city_id',how='inner')
+             .drop_duplicates(['iata','city']))
+    pair_iata = pd.Index(iata_labels).get_indexer(pairs['iata'])
+    pairs = pairs[pair_iata>=0]
+    pair_iata = pair_iata[pair_iata>=0]
+    # Cities sorted by name (like groupby('city'))
+    city_codes, city_labels = pd.factorize(pairs['city'], sort=True)
     #
-    # --- GROUP EQUAL CITIES TOGETHER AND RESAMPLE BY 3h
+    # --- ADD AIRPORT-BUCKETS TO THEIR CITIES
     # (Because weatherforecast is in 3h raster)
-    res = (res
-           .set_index('scheduled_time')
-           .groupby('city')
-           .resample('3H')
-           .sum('flightload')
-           .reset_index()
-           )
+    city_sums = np.zeros((len(city_labels),sums.shape[1]))
+    city_counts = np.zeros((len(city_labels),sums.shape[1]),dtype=np.int64)
+    np.add.at(city_sums, city_codes, sums[pair_iata])
+    np.add.at(city_counts, city_codes, counts[pair_iata])
+    res = bucket_frame(city_sums, city_counts, b0, city_labels, 'city', 'flightload')
     # Return results
     return res
 
 
+# =============================================================================
+# FLIGHTLOAD PER CITY COMPUTED BY MySQL
+# Alternative to get_flightload_per_airport + get_flightload_per_city:
+# Only the aggregated (city_id, 3h-bucket)-rows are transferred.
+# Buckets are counted in hours since 1970-01-01 (independent of the
+# session time zone). Rounding per flight like the pandas path.
+# Needs the index on flights_fact(scheduled_time).
+# Used by update_load if the environment variable LOAD_PUSHDOWN=1.
+# =============================================================================
+PUSHDOWN = os.environ.get('LOAD_PUSHDOWN', '0')=='1'
+
+FLIGHTLOAD_QUERY = """
+SELECT a.city_id,
+       TIMESTAMPDIFF(HOUR, '1970-01-01', f.scheduled_time) DIV :hours AS bucket,
+       SUM(ROUND(COALESCE(ac.typ_config, 150) * :ratio)) AS flightload,
+       COUNT(*) AS flights
+FROM flights_fact f
+JOIN airports a ON a.iata = f.iata
+LEFT JOIN aircraft_types ac ON ac.aircraft_id = f.aircraft_id
+WHERE f.scheduled_time >= :t0 AND f.scheduled_time < :t1
+GROUP BY a.city_id, bucket
+"""
+
+def query_flightload_per_city(con,cities,t0,t1,seed=rnd.random()):
+    print("Get flightload per city from database...")
+    res = pd.read_sql(text(FLIGHTLOAD_QUERY), con=con,
+                      params={'hours':BUCKET_HOURS,
+                              'ratio':get_flightload_ratio(seed),
+                              't0':t0,
+                              't1':t1})
+    # Get City Name from cities table
+    res = res.merge(cities[['city','city_id']],on='city_id',how='inner')
+    # Cities sorted by name (like groupby('city'))
+    city_codes, city_labels = pd.factorize(res['city'], sort=True)
+    # Bucket-number back to time (in ns) -> same raster as bucket_matrix
+    times = (res['bucket'].to_numpy(dtype=np.int64)
+             *np.int64(BUCKET_HOURS*3600*10**9)).astype('datetime64[ns]')
+    sums, counts, b0 = bucket_matrix(city_codes, len(city_labels),
+                                     times, res['flightload'])
+    # Fill empty buckets between first and last flight per city with 0
+    return bucket_frame(sums, counts, b0, city_labels, 'city', 'flightload')
+
+
 # =============================================================================
 # EXTRACT POTENTIAL PASSENGERS FROM FLIGHTS
 # =============================================================================
@@ -284,12 +410,15 @@ def get_passengers(flights):
 # =============================================================================
 # 
 # =============================================================================
-def get_load_total(cities,population,weather,airports,flights):
+def get_load_total(cities,population,weather,airports,flights,
+                   flightload_city=None):
     print("Get total customerload (base + flights + weather)...")
-    # Get flightload per airport
-    flightload_iata = get_flightload_per_airport(flights)
-    # Get flightload per city
-    flightload_city = get_flightload_per_city(flightload_iata, airports, cities)
+    # flightload_city may come from query_flightload_per_city already
+    if flightload_city is None:
+        # Get flightload per airport
+        flightload_iata = get_flightload_per_airport(flights)
+        # Get flightload per city
+        flightload_city = get_flightload_per_city(flightload_iata, airports, cities)
     # Get weatherfactor per city (from weather-forecast)
     weatherfactor_city = get_weatherfactor_per_city(get_weatherfactor(weather),cities)
     # Get general baseload per city (0...24h)
@@ -302,9 +431,15 @@ def get_load_total(cities,population,weather,airports,flights):
 # =============================================================================
 # 
 # =============================================================================
-def format_load_total(cities,population,weather,airports,flights):
+def format_load_total(cities,population,weather,airports,flights,
+                      flightload_city=None,workers=None):
     print("Get total customerload formatted for SQL...")
-    customerload = get_load_total(cities,population,weather,airports,flights)
+    if workers:
+        customerload = get_load_total_sharded(cities,population,weather,airports,
+                                              flights,flightload_city,workers)
+    else:
+        customerload = get_load_total(cities,population,weather,airports,flights,
+                                      flightload_city)
     #
     customerload = (
         customerload
@@ -314,6 +449,291 @@ def format_load_total(cities,population,weather,airports,flights):
     #
     return customerload
 
+# =============================================================================
+# DATAFRAMES IN SHARED MEMORY
+# Numeric/datetime columns are copied once into a shared buffer, text columns
+# are stored as categorical codes (labels travel with the spec, they are small).
+# Workers attach to the buffers without copying or pickling the data, text
+# columns stay categorical on top of the shared codes. Rows are selected on the
+# shared arrays: only the selected rows are copied into a DataFrame (filtering
+# a DataFrame built on the buffers consolidates its blocks first, i.e. copies
+# every column completely).
+# =============================================================================
+def share_frame(df, buffers):
+    spec = []
+    for col in df.columns:
+        values = df[col]
+        labels = None
+        if values.dtype==object or isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype('category')
+            labels = list(values.cat.categories)
+            values = values.cat.codes.to_numpy()
+        elif pd.api.types.is_extension_array_dtype(values.dtype):
+            # Nullable integers -> float (<NA> -> NaN)
+            values = values.to_numpy(dtype=np.float64, na_value=np.nan)
+        else:
+            values = values.to_numpy()
+        shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes,1))
+        np.ndarray(values.shape, values.dtype, buffer=shm.buf)[:] = values
+        buffers.append(shm)
+        spec.append((col, shm.name, values.dtype.str, len(values),
+                     None if labels is None else list(labels)))
+    return spec
+
+
+def attach_columns(spec, buffers):
+    columns = {}
+    for col, name, dtype, n, labels in spec:
+        shm = shared_memory.SharedMemory(name=name)
+        buffers.append(shm)
+        values = np.ndarray((n,), np.dtype(dtype), buffer=shm.buf)
+        if labels is not None:
+            # Codes have the dtype of the categorical already -> no copy
+            values = pd.Categorical.from_codes(values, labels)
+        columns[col] = values
+    return columns
+
+
+def take_frame(columns, key, keep):
+    # Rows whose key is in keep (copied out of the shared buffers)
+    select = pd.Series(columns[key], copy=False).isin(keep).to_numpy()
+    return pd.DataFrame({col:values[select] for col, values in columns.items()})
+
+
+# =============================================================================
+# LOAD MODEL OF ONE PARTITION OF CITIES (RUNS IN A WORKER PROCESS)
+# =============================================================================
+# Model functions with a random seed drawn at import (seed=rnd.random())
+SEEDED = ['get_baseload','get_flightload_ratio','get_flightload_per_airport']
+
+def _init_worker(defaults):
+    # Seeds of the parent process -> same result as get_load_total
+    for name, values in defaults.items():
+        globals()[name].__defaults__ = values
+
+
+def _load_shard(specs, city_ids):
+    buffers = []
+    try:
+        frames = {name:(None if spec is None else attach_columns(spec, buffers))
+                  for name, spec in specs.items()}
+        # --- SELECT ROWS OF THE CITIES OF THIS PARTITION
+        cities = take_frame(frames['cities'], 'city_id', city_ids)
+        population = take_frame(frames['population'], 'city_id', city_ids)
+        weather = take_frame(frames['weather'], 'city_id', city_ids)
+        airports = take_frame(frames['airports'], 'city_id', city_ids)
+        flights = frames['flights']
+        if flights is not None:
+            flights = take_frame(flights, 'iata', airports['iata'])
+        flightload_city = frames['flightload_city']
+        if flightload_city is not None:
+            flightload_city = take_frame(flightload_city, 'city', cities['city'])
+        return get_load_total(cities, population, weather, airports, flights,
+                              flightload_city)
+    finally:
+        for shm in buffers:
+            shm.close()
+
+
+# =============================================================================
+# LOAD MODEL PARTITIONED BY city_id IN A PROCESS POOL
+# Same result as get_load_total (rows sorted by city and time).
+# Workers are forked from a fork-server (started once per instance with this
+# module imported), not from the Cloud Function itself: a fork of a process
+# with several threads may inherit locks that are never released. The random
+# seeds of the model are handed over to the workers. The fork-server imports
+# this module from the working directory (source folder of the function),
+# otherwise every worker imports it again.
+# Pays off with several cores only: on one core the pool is at best as fast
+# as get_load_total (see benchmarks.py load_sharded).
+# Switched on by the environment variable LOAD_WORKERS (number of processes,
+# 0 = get_load_total in the process of the function).
+# =============================================================================
+WORKERS = int(os.environ.get('LOAD_WORKERS', 0))
+
+def get_load_total_sharded(cities,population,weather,airports,flights,
+                           flightload_city=None,workers=None):
+    workers = workers or os.cpu_count()
+    # --- PARTITIONS: city_id modulo number of workers
+    city_ids = np.sort(cities['city_id'].to_numpy())
+    shards = [city_ids[i::workers] for i in range(workers)]
+    shards = [s for s in shards if len(s)>0]
+    print(f"Get total customerload in {len(shards)} partition(s)...")
+    
+    # --- INPUTS TO SHARED MEMORY (ONCE FOR ALL WORKERS)
+    buffers = []
+    try:
+        frames = {'cities':cities,'population':population,'weather':weather,
+                  'airports':airports,'flights':flights,
+                  'flightload_city':flightload_city}
+        specs = {name:(None if df is None else share_frame(df.reset_index(drop=True), buffers))
+                 for name, df in frames.items()}
+        mp_context = get_context('forkserver')
+        mp_context.set_forkserver_preload(['__main__', __name__])
+        defaults = {name:globals()[name].__defaults__ for name in SEEDED}
+        with ProcessPoolExecutor(max_workers=len(shards),
+                                 mp_context=mp_context,
+                                 initializer=_init_worker,
+                                 initargs=(defaults,)) as pool:
+            results = list(pool.map(_load_shard, [specs]*len(shards), shards))
+    finally:
+        for shm in buffers:
+            shm.close()
+            shm.unlink()
+    
+    # --- CONCAT PARTITIONS
+    results = [r for r in results if r.shape[0]>0]
+    if len(results)==0:
+        return pd.DataFrame(columns=['city','ltime','flightload','baseload',
+                                     'weatherfac','total_load'])
+    return (pd.concat(results)
+            .sort_values(['city','ltime'], kind='stable')
+            .reset_index(drop=True))
+
+
+# =============================================================================
+# MULTI-SCENARIO SIMULATION (UNCERTAINTY BANDS)
+# The random parameters of the model (share of passengers using an e-scooter,
+# shape of the baseload curve) are drawn for SCENARIOS scenarios at once.
+# Loads are evaluated as arrays (scenarios x cities x 3h-buckets), only the
+# quantiles of the total load per (city_id, ltime) are kept.
+# =============================================================================
+SCENARIOS = int(os.environ.get('LOAD_SCENARIOS', 200))
+QUANTILES = {'p10':0.1, 'p50':0.5, 'p90':0.9}
+
+# Base points of the baseload curve (see baseload_points)
+BASE_X = np.array([0,2,8,12,18,22,24])
+BASE_Y = np.array([0.001,0.01,0.1,0.1/1.5,0.1,0.01,0.001])
+
+
+def draw_scenarios(n, seed=None):
+    rng = np.random.default_rng(seed)
+    # Share of passengers (like get_flightload_ratio)
+    ratios = rng.uniform(0.005,0.05,n)*0.826
+    # Inner base points shifted/scaled (like baseload_points)
+    # Shifts of the hours are truncated to -1 or 0 like the integer base
+    # points there, so the bands describe the same distribution
+    x = np.tile(BASE_X,(n,1))
+    y = np.tile(BASE_Y,(n,1))
+    x[:,2:-2] = np.trunc(x[:,2:-2]+rng.uniform(-0.9,0.9,(n,len(BASE_X)-4)))
+    y[:,2:-2] *= rng.uniform(0.8,1.2,(n,len(BASE_X)-4))
+    return ratios, x, y
+
+
+def baseload_curves(x, y, xq):
+    # Relative baseload (0...1) per scenario and query hour
+    curves = np.empty((x.shape[0],len(xq)))
+    for s in range(x.shape[0]):
+        t, c, k = splrep(x[s], y[s], s=0, k=2)
+        curves[s] = abs(BSpline(t, c, k, extrapolate=False)(xq))
+    return curves
+
+
+# =============================================================================
+# FLIGHTS PER (CITY, 3H-BUCKET, SEATS)
+# The simulation only needs the number of flights per seat-count, so the
+# rounding per flight (like get_flightload_per_airport) stays exact.
+# =============================================================================
+def get_seat_counts(flights, airports):
+    res = (flights[['iata','scheduled_time','typ_config']]
+           .astype({'iata':object})
+           # An airport may belong to several cities
+           .merge(airports[['iata','city_id']].astype({'iata':object})
+                  .drop_duplicates(), on='iata', how='inner'))
+    res['seats'] = res['typ_config'].fillna(150)
+    res['scheduled_time'] = res['scheduled_time'].dt.floor(f"{BUCKET_HOURS}H")
+    return (res.groupby(['city_id','scheduled_time','seats']).size()
+            .rename('flights').reset_index())
+
+
+SEAT_COUNTS_QUERY = """
+SELECT a.city_id,
+       TIMESTAMPDIFF(HOUR, '1970-01-01', f.scheduled_time) DIV :hours AS bucket,
+       COALESCE(ac.typ_config, 150) AS seats,
+       COUNT(*) AS flights
+FROM flights_fact f
+JOIN airports a ON a.iata = f.iata
+LEFT JOIN aircraft_types ac ON ac.aircraft_id = f.aircraft_id
+WHERE f.scheduled_time >= :t0 AND f.scheduled_time < :t1
+GROUP BY a.city_id, bucket, seats
+"""
+
+def query_seat_counts(con, t0, t1):
+    res = pd.read_sql(text(SEAT_COUNTS_QUERY), con=con,
+                      params={'hours':BUCKET_HOURS, 't0':t0, 't1':t1})
+    res['scheduled_time'] = (res['bucket'].to_numpy(dtype=np.int64)
+                             *np.int64(BUCKET_HOURS*3600*10**9)).astype('datetime64[ns]')
+    return res.drop(columns='bucket')
+
+
+# =============================================================================
+# QUANTILES OF THE TOTAL LOAD PER (city_id, ltime)
+# Same buckets as customerload: per city every 3h-bucket between its first
+# and last flight
+# =============================================================================
+def simulate_load(cities, population, weather, seat_counts, n=SCENARIOS, seed=None):
+    print(f"Simulate customerload ({n} scenarios)...")
+    columns = ['city_id','ltime','scenarios']+list(QUANTILES.keys())
+    if seat_counts.shape[0]==0 or n<=0:
+        return pd.DataFrame(columns=columns)
+    width = np.int64(BUCKET_HOURS*3600*10**9)
+    ratios, x, y = draw_scenarios(n, seed)
+    
+    # --- FLIGHTS AS ARRAY (cities x seat-counts x buckets)
+    city_ids = np.sort(cities['city_id'].to_numpy())
+    city_codes = np.searchsorted(city_ids, seat_counts['city_id'].to_numpy())
+    city_codes[city_ids[np.minimum(city_codes,len(city_ids)-1)]
+               !=seat_counts['city_id'].to_numpy()] = -1
+    seat_codes, seats = pd.factorize(seat_counts['seats'], sort=True)
+    sums, counts, b0 = bucket_matrix(
+        np.where(city_codes>=0, city_codes*len(seats)+seat_codes, -1),
+        len(city_ids)*len(seats), seat_counts['scheduled_time'],
+        seat_counts['flights'])
+    n_flights = sums.reshape(len(city_ids), len(seats), -1)
+    n_buckets = n_flights.shape[2]
+    
+    # --- FLIGHTLOAD (scenarios x cities x buckets), rounded per flight
+    per_flight = np.round(np.asarray(seats, dtype=float)[None,:]*ratios[:,None])
+    flightload = np.einsum('ckb,sk->scb', n_flights, per_flight)
+    
+    # --- BASELOAD (scenarios x cities x buckets)
+    xq = np.linspace(0,24,9)
+    curves = baseload_curves(x, y, xq)
+    hours = ((b0+np.arange(n_buckets))*BUCKET_HOURS) % 24
+    pop = (population[population['pyear']==datetime.now().year]
+           .drop_duplicates('city_id').set_index('city_id')['population']
+           .reindex(city_ids).to_numpy(dtype=float))
+    baseload = curves[:,hours//BUCKET_HOURS][:,None,:]*pop[None,:,None]
+    
+    # --- WEATHERFACTOR (cities x buckets)
+    wf = get_weatherfactor(weather.reset_index(drop=True))
+    wf_city = np.searchsorted(city_ids, wf['city_id'].to_numpy())
+    wf_bucket = (wf['wtime'].to_numpy(dtype='datetime64[ns]').view(np.int64)//width) - b0
+    valid = ((wf_city<len(city_ids)) & (wf_bucket>=0) & (wf_bucket<n_buckets))
+    valid[valid] &= city_ids[wf_city[valid]]==wf['city_id'].to_numpy()[valid]
+    weatherfac = np.full((len(city_ids),n_buckets), np.nan)
+    weatherfac[wf_city[valid],wf_bucket[valid]] = wf['weatherfac'].to_numpy()[valid]
+    
+    # --- QUANTILES OVER THE SCENARIOS
+    total = (baseload+flightload)*weatherfac[None,:,:]
+    bands = np.quantile(total, list(QUANTILES.values()), axis=0)
+    
+    # --- ROWS BETWEEN FIRST AND LAST FLIGHT PER CITY
+    occupied = counts.reshape(len(city_ids), len(seats), -1).sum(axis=1)>0
+    pos = np.arange(n_buckets)
+    first = occupied.argmax(axis=1)
+    last = n_buckets-1-occupied[:,::-1].argmax(axis=1)
+    select = ((pos>=first[:,None]) & (pos<=last[:,None])
+              & occupied.any(axis=1)[:,None])
+    c_idx, b_idx = np.nonzero(select)
+    res = pd.DataFrame({'city_id':city_ids[c_idx],
+                        'ltime':((b0+b_idx)*width).astype('datetime64[ns]'),
+                        'scenarios':n})
+    for i, name in enumerate(QUANTILES.keys()):
+        res[name] = bands[i][c_idx,b_idx]
+    return res
+
+
 # =============================================================================
 # 
 # =============================================================================
@@ -5,90 +5,163 @@ Created on Mon Apr  8 11:37:08 2024
 
 """
 
-import requests
+import json
 import pandas as pd
 from datetime import datetime
+from sqlalchemy import text
 # ---
-from get_keys import get_keys
+import app_context as ctx
+import db_schema as dbs
 
 
 # =============================================================================
 # 
 # =============================================================================
 def init_weather_df():
-    df_weather = pd.DataFrame({
-        'city':[],
-        'time':[],
-        'weather_id':[],
-        'rain':[],
-        'rain_prob':[],
-        'windspeed':[],
-        'temp':[],
-        'temp_feel':[],
-        'temp_min':[],
-        'temp_max':[],
-        'vis':[]
-    })
+    # Typed according to db_schema ('time' instead of 'wtime' until upload)
+    df_weather = dbs.empty_frame('weather', rename={'wtime':'time'},
+                                 columns=['city','time','weather_id','rain',
+                                          'rain_prob','windspeed','temp',
+                                          'temp_feel','temp_min','temp_max',
+                                          'vis'])
+    return df_weather
+
+
+# =============================================================================
+# FORECAST CACHE
+# The full 5d/3h-forecast (40 steps) of a city is kept for WEATHER_TTL_HOURS:
+# in the application context and (with con) in the table weather_cache, so
+# reruns and cold starts within the TTL don't call the API again.
+# The TTL is a multiple of the refresh interval of the weather-stage (3h, see
+# db_refresh.POLICIES): the stage moves the stored timeframe every 3h from the
+# cache, the API is asked for a new forecast every WEATHER_TTL_HOURS only.
+# =============================================================================
+WEATHER_TTL_HOURS = 12
+FORECAST_STEPS = 40
+
+def get_cached_forecast(city_id, con=None):
+    memory = ctx.get_reference('weather_forecasts', dict)
+    if city_id not in memory and con is not None:
+        res = pd.read_sql(text("""
+            SELECT fetched, forecast FROM weather_cache WHERE city_id = :city_id
+            """), con=con, params={'city_id':int(city_id)})
+        if res.shape[0]>0:
+            memory[city_id] = (pd.Timestamp(res['fetched'].iloc[0]),
+                               json.loads(res['forecast'].iloc[0]))
+    return memory.get(city_id)
+
+
+def store_forecast(city_id, fetched, forecast, con=None):
+    ctx.get_reference('weather_forecasts', dict)[city_id] = (fetched, forecast)
+    if con is not None:
+        with con.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO weather_cache (city_id, fetched, forecast)
+                VALUES (:city_id, :fetched, :forecast)
+                ON DUPLICATE KEY UPDATE
+                    fetched = VALUES(fetched), forecast = VALUES(forecast)
+                """), {'city_id':int(city_id), 'fetched':fetched.to_pydatetime(),
+                       'forecast':json.dumps(forecast)})
+
+
+def is_fresh(entry, now, until):
+    if entry is None:
+        return False
+    fetched, forecast = entry
+    # Too old or not reaching far enough
+    return (now-fetched<pd.Timedelta(hours=WEATHER_TTL_HOURS)
+            and len(forecast)>0
+            and datetime.utcfromtimestamp(forecast[-1]['dt'])>=until)
+
+
+# =============================================================================
+# GET FULL 5D/3H-FORECAST BY COORDINATES (NO GEOCODING BY OPENWEATHERMAP)
+# =============================================================================
+def fetch_forecast(latitude, longitude):
+    params = {'lat':latitude,
+              'lon':longitude,
+              'appid':ctx.get_secret('openweathermap'),
+              'units':'metric',
+              'cnt':FORECAST_STEPS
+              }
+    url = "http://api.openweathermap.org/data/2.5/forecast?"
+    return ctx.get_session('openweathermap').get(url,params=params).json()['list']
+
+
+# =============================================================================
+# FORECAST-RESPONSE TO DATAFRAME
+# =============================================================================
+def parse_forecast(response, city):
+    # Collect weather data row by row
+    rows = []
+    
+    # --- GO THROUGH RESPONSE ELEMENTS
+    for i in range(len(response)):
+        row = {}
+        row['weather_id'] = response[i]['weather'][0]['id'] # Weather condition according to https://openweathermap.org/weather-conditions
+        row['time'] = datetime.utcfromtimestamp(response[i]['dt']) # Time of data forecasted, unix, UTC -> Convert back to UTC
+        # Rain-Key doesn't always exist
+        if ('rain' in response[i].keys()):
+            row['rain'] = response[i]['rain']['3h'] # Rain Volume for last 3 hours in [mm]
+        row['windspeed'] = response[i]['wind']['speed'] # Wind speed in [m/s]
+        row['temp'] = response[i]['main']['temp'] # Forecasted temperature in °C
+        row['temp_min'] = response[i]['main']['temp_min'] # Forecasted minimal temperature in °C
+        row['temp_max'] = response[i]['main']['temp_max'] # Forecasted maximal temperature in °C
+        row['temp_feel'] = response[i]['main']['feels_like'] # Human perception of forecasted temperature in °C
+        if ('visibility' in response[i].keys()):
+            row['vis'] = response[i]['visibility'] # Average visibility in meters
+        row['rain_prob'] = response[i]['pop'] # Probability of precipitation (0...1)
+        rows.append(row)
+    
+    # Create temporary DF from collected weather data
+    df_weather = pd.DataFrame(rows, columns=init_weather_df().columns)
+
+    # If rain-prob is 0, rain-value is NaN -> Convert to 0
+    df_weather.loc[df_weather['rain'].isna(),'rain'] = 0
+    # Convert timestring to datetime
+    df_weather['time'] = pd.to_datetime(df_weather['time'])
+    # Add city ID
+    df_weather['city'] = city
     return df_weather
 
 
 # =============================================================================
 # GET 5D/3H-WEATHERFORECAST PER CITY
+# cities: DataFrame with city_id, city, latitude, longitude (cities-table)
+# con:    optional database-connection for the shared forecast cache
 # =============================================================================
-def weather_forecast(cities,timeframe):
+def weather_forecast(cities,timeframe,con=None):
     print("Getting weather forecasts...")
-    if(type(cities) is str):
-        cities = [cities]
+    now = pd.Timestamp.utcnow().tz_localize(None)
+    # Steps of the requested timeframe (max. 5 days), starting at next slot
+    steps = int(min(1+timeframe/3,FORECAST_STEPS))
+    until = now + pd.Timedelta(hours=3*(steps-1))
     
     # Create new DataFrame to collect weather data
     df_weather_full = init_weather_df()
     
-    # GO THROUGH ALL CITY IDs
-    for city in cities:
-        print(f"Get weather for {city}...")
-        # --- API CALL
-        # Only return 5 entries (&cnt=5) to limit forecast to 12h (= (5-1)*3h)
-        # To fall in line with flights API (max. 12h)
-        params = {'q':city,
-                  'appid':get_keys('openweathermap'),
-                  'units':'metric',
-                  'cnt':int(min(1+timeframe/3,5*24/3))
-                  }
-        url = "http://api.openweathermap.org/data/2.5/forecast?"
-        response = requests.get(url,params)
-        response = response.json()['list']
+    # GO THROUGH ALL CITIES
+    for row in cities.itertuples():
+        # --- FORECAST FROM CACHE OR API
+        entry = get_cached_forecast(row.city_id, con)
+        if is_fresh(entry, now, until):
+            print(f"Weather for {row.city} from cache "
+                  f"(fetched {entry[0]:%Y-%m-%d %H:%M}).")
+            forecast = entry[1]
+        else:
+            print(f"Get weather for {row.city}...")
+            forecast = fetch_forecast(row.latitude, row.longitude)
+            store_forecast(row.city_id, now, forecast, con)
         
-        # Create temporary DF to store weather data
-        df_weather = init_weather_df()
-        
-        # --- GO THROUGH RESPONSE ELEMENTS
-        for i in range(len(response)):
-            df_weather.loc[i,'weather_id'] = response[i]['weather'][0]['id'] # Weather condition according to https://openweathermap.org/weather-conditions
-            df_weather.loc[i,'time'] = datetime.utcfromtimestamp(response[i]['dt']) # Time of data forecasted, unix, UTC -> Convert back to UTC
-            # Rain-Key doesn't always exist
-            if ('rain' in response[i].keys()):
-                df_weather.loc[i,'rain'] = response[i]['rain']['3h'] # Rain Volume for last 3 hours in [mm]
-            df_weather.loc[i,'windspeed'] = response[i]['wind']['speed'] # Wind speed in [m/s]
-            df_weather.loc[i,'temp'] = response[i]['main']['temp'] # Forecasted temperature in °C
-            df_weather.loc[i,'temp_min'] = response[i]['main']['temp_min'] # Forecasted minimal temperature in °C
-            df_weather.loc[i,'temp_max'] = response[i]['main']['temp_max'] # Forecasted maximal temperature in °C
-            df_weather.loc[i,'temp_feel'] = response[i]['main']['feels_like'] # Human perception of forecasted temperature in °C
-            if ('visibility' in response[i].keys()):
-                df_weather.loc[i,'vis'] = response[i]['visibility'] # Average visibility in meters
-            df_weather.loc[i,'rain_prob'] = response[i]['pop'] # Probability of precipitation (0...1)
-
-        # If rain-prob is 0, rain-value is NaN -> Convert to 0
-        df_weather.loc[df_weather['rain'].isna(),'rain'] = 0
-        # Convert timestring to datetime
-        df_weather['time'] = pd.to_datetime(df_weather['time'])
-        # Add city ID
-        df_weather['city'] = city
+        # Only upcoming steps of the requested timeframe
+        df_weather = parse_forecast(forecast, row.city)
+        df_weather = df_weather[df_weather['time']>now.floor('3H')].head(steps)
         
         # Add current forecast to forecast-collection
         df_weather_full = pd.concat([df_weather_full,df_weather])
-               
-        # Make integer from float ID
-        df_weather_full['weather_id'] = df_weather_full['weather_id'].astype(int)
+    
+    # Apply compact dtypes (weather_id -> integer, measurements -> float32)
+    df_weather_full = dbs.apply_schema(df_weather_full,'weather',rename={'wtime':'time'})
     
     # OUTPUT FORECAST-COLLECTION
     return df_weather_full.reset_index(drop=True)
@@ -103,4 +176,4 @@ def weather_forecast(cities,timeframe):
 #         'Madrid',
 #         'Los Angeles',
 #         'Shanghai']
-# weather_forecast(cities,4)
+# weather_forecast(pd.read_sql('cities', con=ctx.get_engine()),4)
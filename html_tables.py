@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Fast extraction of a single HTML-table for the scrapers (population,
+aircraft specifications).
+
+Usage:
+    read_table(html, columns, index=0, cls=None, skip_rows=1)
+        -> DataFrame with one column per entry of columns
+           {name: (position of the <td>, kind)}, kind is one of
+               'text':   text of the cell as it is
+               'line':   first line of the text
+               'number': first line as float (thousands-separators removed,
+                         NaN if it is no number)
+           index: number of the table on the page (counted over all tables)
+           cls:   count only tables with this class (e.g. 'data-grid')
+           skip_rows: header rows to skip
+
+    get_rows(html, index=0, cls=None)
+        -> Texts of the <td>-cells per row of the table (list of lists)
+
+Notes:
+    The page is not turned into a tree: a streaming parser (html.parser of
+    the standard library, like BeautifulSoup(..., 'html.parser')) only
+    collects the cells of the target table and stops when it is closed.
+    Cell texts are the same as .text of the BeautifulSoup-cells (incl. the
+    text of nested tags), only <td>-cells count (like find_all('td')).
+
+"""
+
+import pandas as pd
+from html.parser import HTMLParser
+from bs4.dammit import UnicodeDammit
+
+
+# =============================================================================
+# STREAMING PARSER FOR ONE TABLE
+# =============================================================================
+class _Done(Exception):
+    pass
+
+
+class _TableParser(HTMLParser):
+    def __init__(self, index, cls):
+        super().__init__(convert_charrefs=True)
+        self.index, self.cls = index, cls
+        # Tables seen (that match cls), depth of open tables
+        self.seen, self.depth = 0, 0
+        # Depth of the target table once it is open
+        self.target = None
+        self.rows, self.row, self.cell = [], None, None
+
+    def handle_starttag(self, tag, attrs):
+        if tag=='table':
+            self.depth += 1
+            if self.target is None:
+                classes = (dict(attrs).get('class') or '').split()
+                if self.cls is None or self.cls in classes:
+                    if self.seen==self.index:
+                        self.target = self.depth
+                    self.seen += 1
+            return
+        # Only rows/cells of the target table itself (not of nested tables)
+        if self.target is None or self.depth!=self.target:
+            return
+        if tag=='tr':
+            self.row = []
+            self.rows.append(self.row)
+        elif tag=='td' and self.row is not None:
+            self.cell = []
+            self.row.append(self.cell)
+        elif tag=='th':
+            # Header cells end the text of a preceding <td>
+            self.cell = None
+
+    def handle_endtag(self, tag):
+        if tag=='table':
+            if self.target is not None and self.depth==self.target:
+                raise _Done()
+            self.depth = max(self.depth-1, 0)
+        elif self.target is not None and self.depth==self.target:
+            if tag=='td':
+                self.cell = None
+            elif tag=='tr':
+                self.row, self.cell = None, None
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.cell.append(data)
+
+
+def get_rows(html, index=0, cls=None):
+    if isinstance(html, bytes):
+        # Same encoding detection as BeautifulSoup
+        html = UnicodeDammit(html, is_html=True).unicode_markup
+    parser = _TableParser(index, cls)
+    try:
+        parser.feed(html)
+        parser.close()
+    except _Done:
+        pass
+    if parser.target is None:
+        raise ValueError(f"Table {index}{'' if cls is None else ' of class '+cls} "
+                         "not found.")
+    return [[''.join(cell) for cell in row] for row in parser.rows]
+
+
+# =============================================================================
+# TABLE AS DATAFRAME WITH TYPED COLUMNS
+# =============================================================================
+def to_column(values, kind):
+    s = pd.Series(values, dtype=object)
+    if kind=='text':
+        return s
+    s = s.str.split('\n').str[0]
+    if kind=='line':
+        return s
+    return pd.to_numeric(s.str.replace(',', '', regex=False).str.strip(),
+                         errors='coerce')
+
+
+def read_table(html, columns, index=0, cls=None, skip_rows=1):
+    rows = get_rows(html, index, cls)[skip_rows:]
+    # Rows without enough cells (e.g. spacer rows) are dropped
+    needed = max(pos for pos, kind in columns.values())
+    rows = [row for row in rows if len(row)>needed]
+    return pd.DataFrame({name:to_column([row[pos] for row in rows], kind)
+                         for name, (pos, kind) in columns.items()})
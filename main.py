@@ -7,14 +7,26 @@ Created on Mon Apr  8 18:57:14 2024
 
 import numpy as np
 import pandas as pd
-import time
 from datetime import datetime
 # ---
 import get_flightsdata as fd
 import get_weatherdata as wd
 import get_citydata as cd
 import get_loaddata as ld
-from get_keys import get_keys
+import db_schema as dbs
+import db_dimensions as dim
+import db_retention as ret
+import db_rollups as rollups
+import db_changes as chg
+import api_quota as quota
+import db_checkpoints as ckpt
+import db_refresh as refresh
+import db_leases as lease
+import app_context as ctx
+import run_memory as mem
+import run_profile as prof
+import run_tables as tbl
+import read_api as api
 # ---
 import functions_framework
 # ---
@@ -22,6 +34,13 @@ import sqlalchemy
 import pymysql
 
 
+# =============================================================================
+# APPLICATION CONTEXT
+# Cached dimension-keys are dropped together with the reference data
+# =============================================================================
+ctx.on_invalidate('reference', dim.clear_cache)
+
+
 # =============================================================================
 # DEFINE CITIES OF INTEREST
 # =============================================================================
@@ -40,15 +59,80 @@ cities=[#'Berlin',
 # =============================================================================
 @functions_framework.http
 def update_database(request):
+    # Optional reset of the warm instance, e.g. ?invalidate=secrets
+    if request is not None and request.args.get('invalidate'):
+        part = request.args.get('invalidate')
+        ctx.invalidate(None if part=='all' else part)
     con = connect_to_sql();
     # simpletest(con);
-    update_cities();
-    update_population();
-    update_airports();
-    update_weather(48); # Timeframe possible
-    update_flights(48); # Timeframe possible
-    update_load();
+    # Single-flight: skip if the previous invocation is still running
+    # (see db_leases.py)
+    if not lease.acquire(con, 'run', lease.RUN_WAIT_SECONDS):
+        return 'Database update skipped: previous update is still running.'
+    try:
+        return run_update(request, con)
+    finally:
+        lease.release('run')
+
+
+def run_update(request, con):
+    # Budget and exhaustion of the APIs are per run (see api_quota.py)
+    quota.reset()
+    # Checkpoints of this run window (resume after timeouts/errors)
+    window = ckpt.start_run(con);
+    # Reference tables are read once per run (see run_tables.py)
+    tbl.start_run()
+    # Optional profiling, e.g. ?profile=load,flights (see run_profile.py)
+    prof.configure(request.args.get('profile') if request is not None else None)
+    stages = [('cities',update_cities,[]),
+              ('population',update_population,[]),
+              ('airports',update_airports,[48]), # Timeframe of flights to reserve budget for
+              ('weather',update_weather,[48]), # Timeframe possible
+              ('flights',update_flights,[48]), # Timeframe possible
+              ('load',update_load,[]), # LOAD_PUSHDOWN, LOAD_WORKERS
+              ('retention',update_retention,[])]
+    # Only stages that are due by their refresh policy (see db_refresh.py),
+    # e.g. ?force=population to run a stage anyway
+    new_cities = np.setdiff1d(cities, tbl.get(con, "cities")['city']).size>0
+    force = request.args.get('force') if request is not None else None
+    # Policies are evaluated for the start of the run window, not the time a
+    # stage finished: an hourly run then finds a 1h-stage due every hour
+    due = refresh.get_due(con, [stage for stage, func, args in stages],
+                          new_cities, force.split(',') if force else None,
+                          now=window)
+    # Peak memory of each stage is printed (run_memory.tracked)
+    failed = []
+    for stage, func, args in stages:
+        if stage not in due:
+            continue
+        # Stage leased by another process (e.g. backfill) -> stays due
+        if not lease.acquire(con, stage, lease.STAGE_WAIT_SECONDS):
+            print(f">>>>>Skipping {stage} (leased by another process).")
+            continue
+        try:
+            status = ckpt.run_stage(con, stage,
+                                    mem.tracked(stage, prof.profiled(stage, func)),
+                                    *args)
+        finally:
+            lease.release(stage)
+        # Stages done before in this run window keep their refresh time
+        if status=='done':
+            refresh.mark_success(con, stage, window)
+        elif status=='failed':
+            failed.append(stage)
+    if len(failed)>0:
+        # Non-2xx lets the scheduler retry, done units are skipped then
+        return (f"Database update incomplete, failed: {', '.join(failed)}.", 500)
     return 'Database update successful.'
+
+
+# =============================================================================
+# READ-API: CUSTOMERLOAD BY CITY AND TIME RANGE (CACHED, SEE read_api.py)
+# =============================================================================
+@functions_framework.http
+def get_load(request):
+    return api.handle(connect_to_sql(), request.args,
+                      request.headers.get('If-None-Match'))
     
 
 # =============================================================================
@@ -56,27 +140,8 @@ def update_database(request):
 # =============================================================================
 
 def connect_to_sql():
-  print("Connecting to SQL...")
-  connection_name = get_keys('mysql_gcp_con')
-  # db_user = "root"
-  db_user = get_keys('mysql_gcp_user')
-  db_password = get_keys('mysql_gcp')
-  schema_name = "gans"
-
-  driver_name = 'mysql+pymysql'
-  query_string = {"unix_socket": f"/cloudsql/{connection_name}"}
-
-  db = sqlalchemy.create_engine(
-      sqlalchemy.engine.url.URL(
-          drivername = driver_name,
-          username = db_user,
-          password = db_password,
-          database = schema_name,
-          query = query_string,
-      )
-  )
-
-  return db
+  # Engine (and its connection pool) is created once per instance
+  return ctx.get_engine()
 
 # =============================================================================
 # SIMPLETEST
@@ -151,7 +216,7 @@ def drop_duplicates_custom(df,cols):
 def update_cities():
     print(">>>>>Updating Cities...")
     # --- GET CITIES FROM DATABASE
-    cities_db = pd.read_sql("cities", con=connect_to_sql())
+    cities_db = tbl.get(connect_to_sql(), "cities")
     
     # --- COMPARE CITYLIST WITH DATABASE -> FIND POTENTIAL NEWCOMERS
     cities_add = np.setdiff1d(cities,cities_db['city'])
@@ -162,10 +227,7 @@ def update_cities():
     print("Writing Cities to database...")
     # --- ADD NEWCOMERS TO DATABASE
     # "city_id" will be set automatically in MySQL
-    cities_add.to_sql('cities',
-                    if_exists='append',
-                    con=connect_to_sql(),
-                    index=False);
+    tbl.append(connect_to_sql(), 'cities', cities_add)
     print(">>>>>Cities updated.")
 
 # =============================================================================
@@ -175,8 +237,8 @@ def update_cities():
 def update_population():
     print(">>>>>Updating Population...")
     # --- GET CURRENT CITIES AND POPULATION FROM DATABASE
-    cities_db = pd.read_sql("cities", con=connect_to_sql())
-    population_db = pd.read_sql("population", con=connect_to_sql())
+    cities_db = tbl.get(connect_to_sql(), "cities")
+    population_db = tbl.get(connect_to_sql(), "population")
     
     # --- MAKEW NEW DATAFRAME WITH POPULATION-DATA FROM CITIES-LIST
     population_add = pd.DataFrame({'city_id':cities_db['city_id'],
@@ -187,10 +249,7 @@ def update_population():
     population_add = append_by_condition(population_add,population_db,['city_id','pyear'])
           
     # --- ADD NEWCOMERS TO DATABASE
-    population_add.to_sql('population',
-                    if_exists='append',
-                    con=connect_to_sql(),
-                    index=False);
+    tbl.append(connect_to_sql(), 'population', population_add)
     print(">>>>>Population updated.")
 
 # =============================================================================
@@ -201,130 +260,231 @@ def update_population():
 def update_weather(timeframe=12):
     print(">>>>>Updating Weather...")
     # --- GET CURRENT CITIES AND WEATHER FROM DATABASE
-    cities_db = pd.read_sql("cities", con=connect_to_sql())
-    weather_db = pd.read_sql("weather", con=connect_to_sql())
-    
-    # --- GET WEATHER-FORECAST
-    weather_add = wd.weather_forecast(cities_db['city'], timeframe)
+    cities_db = tbl.get(connect_to_sql(), "cities")
+    weather_db = dbs.read_table("weather", con=connect_to_sql())
     
-    # Add city_id to weatherforecast
-    weather_add = weather_add.merge(cities_db[['city','city_id']],how='left',on='city')
-    
-    # Rename time-column to match with database
-    weather_add = weather_add.rename(columns={'time':'wtime'})
-    
-    # Add Newcomers where no match already exists in database
-    weather_add = append_by_condition(weather_add,weather_db,['city_id','wtime'])
-    # Drop 'city'-column to match with database
-    weather_add = weather_add.drop(columns='city')
-    
-    # --- ADD NEWCOMERS TO DATABASE
-    weather_add.to_sql('weather',
-                    if_exists='append',
-                    con=connect_to_sql(),
-                    index=False);
+    # --- GO THROUGH ALL CITIES (ONE CHECKPOINT PER CITY)
+    failed = 0
+    for city in cities_db['city']:
+        if ckpt.is_done('weather', city):
+            continue
+        try:
+            # --- GET WEATHER-FORECAST (BY COORDINATES, CACHED FOR A FEW HOURS)
+            weather_add = wd.weather_forecast(cities_db[cities_db['city']==city],
+                                              timeframe, connect_to_sql())
+            
+            # Add city_id to weatherforecast
+            weather_add = weather_add.merge(cities_db[['city','city_id']],how='left',on='city')
+            
+            # Rename time-column to match with database
+            weather_add = weather_add.rename(columns={'time':'wtime'})
+            
+            # Add Newcomers where no match already exists in database
+            weather_add = append_by_condition(weather_add,weather_db,['city_id','wtime'])
+            # Drop 'city'-column to match with database
+            weather_add = weather_add.drop(columns='city')
+            
+            # --- ADD NEWCOMERS TO DATABASE
+            weather_add.to_sql('weather',
+                            if_exists='append',
+                            con=connect_to_sql(),
+                            index=False);
+            ckpt.mark(connect_to_sql(), 'weather', city)
+        except Exception as e:
+            print(f"Error occured: weather for {city} ({e})")
+            ckpt.mark(connect_to_sql(), 'weather', city, 'failed', e)
+            failed += 1
+    if failed>0:
+        raise RuntimeError(f"Weather failed for {failed} city(s).")
     print(">>>>>Weather updated.")
 
 # =============================================================================
 # AIRPORTS
 # city_id, iata, latitude, longitude
 # =============================================================================
-def update_airports():
+def update_airports(timeframe=12):
     print(">>>>>Updating Airports...")
     # --- GET CURRENT CITIES AND AIRPORTS FROM DATABASE
-    cities_db = pd.read_sql("cities", con=connect_to_sql())
-    airports_db = pd.read_sql("airports", con=connect_to_sql())
-    
-    # --- INITIALIZE NEW AIRPORTS-DATAFRAME
-    airports_add = pd.DataFrame()
-    # --- GO THROUGH ALL CITIES
-    for row in cities_db.itertuples():
-        print(f"Get airports for {row[2]}...")
-        time.sleep(0.5)
-        # Get airports by latitude and longitude
-        res = fd.get_airports(row[4],row[5])
-        # Get cityname
-        res['municipalityName'] = row[2]
-        # Add airports to list
-        airports_add = pd.concat([airports_add,res]).reset_index(drop=True)
+    cities_db = tbl.get(connect_to_sql(), "cities")
+    airports_db = tbl.get(connect_to_sql(), "airports")
     
-    # --- PROCESS DATAFRAME
-    # Only keep needed columns
-    airports_add = airports_add[['iata','location.lat','location.lon','municipalityName']]
-    # Change column-name to merge with city-table
-    airports_add = airports_add.rename(columns={'municipalityName':'city',
-                                                'location.lat':'latitude',
-                                                'location.lon':'longitude'
-                                                })
-    # Merge with city-table to get city-ID
-    airports_add = airports_add.merge(cities_db[['city','city_id']],how='left',on='city')
-    
-    # Add Newcomers where no match already exists in database
-    airports_add = append_by_condition(airports_add,airports_db,['city_id','iata'])
-    # Drop 'city'-column
-    airports_add = airports_add.drop(columns='city')
+    # --- AERODATABOX-BUDGET OF THIS RUN
+    # Airports are searched in the offline reference (airport_index.py), the
+    # API only for cities outside of it. Cities without airports may always
+    # use the API, known cities only the budget left after the flight-requests
+    budget = quota.get_run_budget(connect_to_sql(), 'aerodatabox')
+    known = cities_db['city_id'].isin(airports_db['city_id'])
+    reserve = airports_db['iata'].nunique()*len(fd.get_time_windows(timeframe))
+    quota.set_budget('aerodatabox', max(budget-reserve, (~known).sum()))
+    # Cities without airports first
+    cities_search = pd.concat([cities_db[~known],cities_db[known]])
     
-    # --- ADD NEWCOMERS TO DATABASE
-    airports_add.to_sql('airports',
-                    if_exists='append',
-                    con=connect_to_sql(),
-                    index=False);
+    # --- GO THROUGH ALL CITIES (ONE CHECKPOINT PER CITY)
+    failed = 0
+    try:
+        for row in cities_search.itertuples():
+            if ckpt.is_done('airports', row[2]):
+                continue
+            print(f"Get airports for {row[2]}...")
+            try:
+                # Get airports by latitude and longitude
+                airports_add = fd.get_airports(row[4],row[5])
+                # Get cityname
+                airports_add['municipalityName'] = row[2]
+                
+                # --- PROCESS DATAFRAME
+                # Only keep needed columns
+                airports_add = airports_add[['iata','location.lat','location.lon','municipalityName']]
+                # Change column-name to merge with city-table
+                airports_add = airports_add.rename(columns={'municipalityName':'city',
+                                                            'location.lat':'latitude',
+                                                            'location.lon':'longitude'
+                                                            })
+                # Merge with city-table to get city-ID
+                airports_add = airports_add.merge(cities_db[['city','city_id']],how='left',on='city')
+                
+                # Add Newcomers where no match already exists in database
+                airports_add = append_by_condition(airports_add,airports_db,['city_id','iata'])
+                # Drop 'city'-column
+                airports_add = airports_add.drop(columns='city')
+                
+                # --- ADD NEWCOMERS TO DATABASE
+                tbl.append(connect_to_sql(), 'airports', airports_add)
+                ckpt.mark(connect_to_sql(), 'airports', row[2])
+            except Exception as e:
+                print(f"Error occured: airports for {row[2]} ({e})")
+                ckpt.mark(connect_to_sql(), 'airports', row[2], 'failed', e)
+                failed += 1
+    finally:
+        # Write used calls to ledger (also after errors)
+        quota.flush_ledger(connect_to_sql())
+    if failed>0:
+        raise RuntimeError(f"Airport search failed for {failed} city(s).")
     print(">>>>>Airports updated.")
     
 # =============================================================================
 # FLIGHTS
-# iata, ftype, fnumber, scheduled_time, revised_time, terminal, aircraft,
-# airline, typ_config
+# iata, ftype, fnumber, scheduled_time, revised_time, terminal, aircraft_id,
+# airline_id
+# (stored in flights_fact, the view "flights" adds aircraft, airline and
+# typ_config from the dimension tables)
 # =============================================================================
 def update_flights(timeframe=12):
     print(">>>>>Updating Flights...")
-    # --- GET CURRENT CITIES AND FLIGHTS FROM DATABASE
-    cities_db = pd.read_sql("cities", con=connect_to_sql())
-    flights_db = pd.read_sql("flights", con=connect_to_sql())
-       
-    # Get flight-forecast and adjust colum-names
-    flights_add = (fd.get_flightsdata(cities_db['city'],timeframe)
-                   .rename(columns={'number':'fnumber',
-                                    'type':'ftype',
-                                    'typ. config.':'typ_config'})
-                   )
-    
-    # Add Newcomers where no match already exists in database
-    flights_add = append_by_condition(flights_add,flights_db,['iata','fnumber','scheduled_time'])
-    # Drop city column
-    flights_add = flights_add.drop(columns='city')
+    # --- GET CURRENT CITIES AND AIRPORTS FROM DATABASE
+    # (Stored flights are compared by row-hash, see db_changes)
+    cities_db = tbl.get(connect_to_sql(), "cities")
+    airports_db = tbl.get(connect_to_sql(), "airports")
     
-    # Drop duplicates to be sure!
-    flights_add = flights_add.drop_duplicates()
+    # --- DISTINCT AIRPORTS AND THE CITIES THEY SERVE
+    # (Airports found by update_airports, no geocoding/airport-search here.
+    # Flights are stored once per airport, cities are linked via the
+    # airports-table.)
+    served = (airports_db[['iata','city_id']].astype({'iata':object})
+              .merge(cities_db[['city_id','city']].astype({'city':object}),
+                     on='city_id',how='inner')
+              .groupby('iata')['city'].apply(list))
     
-    # Drop duplicates of specific column combination to be super sure!
-    flights_add = drop_duplicates_custom(
-        flights_add, ['iata','fnumber','scheduled_time'])
+    # --- PLAN AERODATABOX-REQUESTS WITHIN THE BUDGET OF THIS RUN
+    coverage = quota.get_flight_coverage(connect_to_sql())
+    budget = quota.get_run_budget(connect_to_sql(), 'aerodatabox')
+    quota.set_budget('aerodatabox', budget)
+    # Busy airports (flights in the last 7 days) first
+    airports_plan = (pd.DataFrame({'iata':served.index})
+                     .merge(coverage[['iata','recent']],on='iata',how='left')
+                     .rename(columns={'recent':'priority'})
+                     .fillna({'priority':0}))
+    # Each (iata, window) at most once per run
+    plan = quota.plan_flight_windows(airports_plan, coverage,
+                                     fd.get_time_windows(timeframe), budget)
     
-    # --- ADD NEWCOMERS TO DATABASE
-    flights_add.to_sql('flights',
-                    if_exists='append',
-                    con=connect_to_sql(),
-                    index=False);
+    # --- GO THROUGH ALL AIRPORTS (ONE CHECKPOINT PER AIRPORT)
+    failed = 0
+    for IATA_code, cities_served in served.items():
+        if ckpt.is_done('flights', IATA_code):
+            continue
+        print(f"Get flights for {IATA_code} ({', '.join(cities_served)})...")
+        try:
+            # Get flight-forecast and adjust colum-names
+            try:
+                flights_add = (fd.get_flights_by_iata(IATA_code,timeframe,plan)
+                               .rename(columns={'number':'fnumber',
+                                                'type':'ftype',
+                                                'typ. config.':'typ_config'})
+                               )
+            finally:
+                # Write used calls to ledger (also after errors)
+                quota.flush_ledger(connect_to_sql())
+            
+            # Drop duplicates to be sure!
+            flights_add = flights_add.drop_duplicates()
+            
+            # Drop duplicates of specific column combination to be super sure!
+            flights_add = drop_duplicates_custom(
+                flights_add, ['iata','fnumber','scheduled_time'])
+            
+            # Replace airline/aircraft-names by keys of the dimension tables
+            flights_add = dim.encode_flights(flights_add, con=connect_to_sql())
+            
+            # --- ADD NEWCOMERS, UPDATE CHANGED FLIGHTS (BY ROW-HASH)
+            flights_add = chg.write_changes(connect_to_sql(), 'flights_fact', flights_add)
+            
+            # --- UPDATE SUMMARY TABLES FOR NEW/CHANGED FLIGHTS ONLY
+            rollups.refresh_affected(connect_to_sql(), 'flights_fact', flights_add)
+            ckpt.mark(connect_to_sql(), 'flights', IATA_code)
+        except Exception as e:
+            print(f"Error occured: flights for {IATA_code} ({e})")
+            ckpt.mark(connect_to_sql(), 'flights', IATA_code, 'failed', e)
+            failed += 1
+    if failed>0:
+        raise RuntimeError(f"Flights failed for {failed} airport(s).")
     print(">>>>>Flights updated.")
 
 # =============================================================================
-# 
+# LOAD
+# pushdown: aggregate flightload in MySQL (only timeframe from now on)
+#           (default: get_loaddata.PUSHDOWN, environment variable LOAD_PUSHDOWN)
+#           Streaming reads only the flights of each chunk (no pushdown)
+# workers:  evaluate the load model in worker processes (partitioned by city_id)
+#           (default: get_loaddata.WORKERS, environment variable LOAD_WORKERS)
+# streaming: memory-bounded mode (default: run_memory.STREAMING)
 # =============================================================================
-def update_load():
+def update_load(pushdown=None, timeframe=48, workers=None, streaming=None):
+    pushdown = ld.PUSHDOWN if pushdown is None else pushdown
+    workers = ld.WORKERS if workers is None else workers
+    if mem.STREAMING if streaming is None else streaming:
+        return update_load_streamed(timeframe, workers)
     print(">>>>>Updating Load...")
     # --> Needs flights data to work!
     # --- GET CURRENT VALUES FROM DATABASE
-    cities = pd.read_sql("cities", con=connect_to_sql())
-    population = pd.read_sql("population", con=connect_to_sql())
-    weather = pd.read_sql("weather", con=connect_to_sql())
-    airports = pd.read_sql("airports", con=connect_to_sql())
-    flights = pd.read_sql("flights", con=connect_to_sql())
-    customerload_db = pd.read_sql("customerload", con=connect_to_sql())
+    cities = tbl.get(connect_to_sql(), "cities")
+    population = tbl.get(connect_to_sql(), "population")
+    weather = dbs.read_table("weather", con=connect_to_sql())
+    airports = tbl.get(connect_to_sql(), "airports")
+    customerload_db = dbs.read_table("customerload", con=connect_to_sql())
+    
+    # Timeframe starting at the current 3h-slot
+    t0 = pd.Timestamp.utcnow().tz_localize(None).floor('3H')
+    t1 = t0 + pd.Timedelta(hours=timeframe)
+    if pushdown:
+        # --- LET MySQL AGGREGATE FLIGHTLOAD PER CITY AND 3h
+        # Only for the requested timeframe
+        flights = None
+        flightload_city = ld.query_flightload_per_city(
+            connect_to_sql(), cities, t0, t1)
+        seat_counts = ld.query_seat_counts(connect_to_sql(), t0, t1)
+    else:
+        # --- DOWNLOAD ALL FLIGHTS AND AGGREGATE IN PANDAS
+        flights = dbs.read_table("flights", con=connect_to_sql())
+        flightload_city = None
+        seat_counts = ld.get_seat_counts(
+            flights[(flights['scheduled_time']>=t0) & (flights['scheduled_time']<t1)],
+            airports)
     
     # --- GET CURRENT LOAD-FORECAST
     customerload_add = (
-        ld.format_load_total(cities, population, weather, airports, flights)
+        ld.format_load_total(cities, population, weather, airports, flights,
+                             flightload_city, workers)
         )
 
     # Add Newcomers where no match already exists in database
@@ -335,12 +495,116 @@ def update_load():
         )
     
     # --- ADD NEWCOMERS TO DATABASE
-    customerload_add.to_sql('customerload',
-                    if_exists='append',
-                    con=connect_to_sql(),
-                    index=False);
+    chg.append(connect_to_sql(), 'customerload', customerload_add)
+    # --- UNCERTAINTY BANDS OF THE TIMEFRAME
+    update_load_bands(cities, population, weather, seat_counts)
+    
+    # --- UPDATE SUMMARY TABLES FOR NEW LOAD-VALUES ONLY
+    rollups.refresh_affected(connect_to_sql(), 'customerload', customerload_add)
+    # --- INVALIDATE CACHES OF THE READ-API
+    if customerload_add.shape[0]>0:
+        api.bump_version(connect_to_sql())
     print(">>>>>Load updated.")
 
 
+# =============================================================================
+# LOAD: UNCERTAINTY BANDS
+# Quantiles of the total load over ld.SCENARIOS scenarios of the random model
+# parameters (LOAD_SCENARIOS=0 switches them off). Refreshed on every run.
+# =============================================================================
+def update_load_bands(cities, population, weather, seat_counts):
+    if ld.SCENARIOS<=0:
+        return
+    bands = ld.simulate_load(cities, population, weather, seat_counts)
+    chg.upsert(connect_to_sql(), 'customerload_bands', bands,
+               ['scenarios']+list(ld.QUANTILES.keys()))
+    # Bands are served by the read-API as well
+    if bands.shape[0]>0:
+        api.bump_version(connect_to_sql())
 
 
+# =============================================================================
+# LOAD (MEMORY-BOUNDED)
+# Cities are processed in chunks: each chunk is read (only its cities and the
+# timeframe from the current 3h-slot on), computed and written before the next
+# one is read. Chunk sizes follow run_memory.MEMORY_CEILING_MB (smaller after a
+# chunk above it, MemoryError if a single city does not fit). Memory still held
+# above the ceiling before a chunk stops the stage (MemoryError).
+# =============================================================================
+def update_load_streamed(timeframe=48, workers=None):
+    print(">>>>>Updating Load (memory-bounded)...")
+    # --- SMALL TABLES ARE READ COMPLETELY
+    cities = tbl.get(connect_to_sql(), "cities")
+    population = tbl.get(connect_to_sql(), "population")
+    airports = tbl.get(connect_to_sql(), "airports")
+    
+    t0 = pd.Timestamp.utcnow().tz_localize(None).floor('3H')
+    t1 = t0 + pd.Timedelta(hours=timeframe)
+    
+    # --- GO THROUGH CITY-CHUNKS
+    n, i = mem.FIRST_CHUNK, 0
+    while i<cities.shape[0]:
+        mem.check_ceiling('load')
+        chunk = cities.iloc[i:i+n]
+        base = mem.rss_mb()
+        rows, peak = mem.measure(update_load_chunk, chunk, population, airports,
+                                 t0, t1, workers)
+        print(f"Load of cities {i+1}-{i+chunk.shape[0]} of {cities.shape[0]}: "
+              f"{rows} new rows, peak {peak:.0f} MB.")
+        i += chunk.shape[0]
+        n = mem.chunk_size(chunk.shape[0], peak, base)
+    print(">>>>>Load updated.")
+
+
+def update_load_chunk(cities, population, airports, t0, t1, workers=None):
+    airports = airports[airports['city_id'].isin(cities['city_id'])]
+    population = population[population['city_id'].isin(cities['city_id'])]
+    params = {'t0':t0.to_pydatetime(), 't1':t1.to_pydatetime(),
+              'city_ids':[int(c) for c in cities['city_id']],
+              'iata':list(airports['iata'].astype(object).unique())}
+    
+    # --- READ ONLY THIS CHUNK (SERVER-SIDE CURSOR, TYPED CHUNK BY CHUNK)
+    flights = dbs.read_query(sqlalchemy.text("""
+        SELECT iata, scheduled_time, typ_config FROM flights
+        WHERE iata IN :iata AND scheduled_time >= :t0 AND scheduled_time < :t1
+        """).bindparams(sqlalchemy.bindparam('iata', expanding=True)),
+        connect_to_sql(), 'flights', params, chunksize=mem.CHUNK_ROWS)
+    if flights.shape[0]==0:
+        return 0
+    weather = dbs.read_query(sqlalchemy.text("""
+        SELECT * FROM weather
+        WHERE city_id IN :city_ids AND wtime >= :t0 AND wtime < :t1
+        """).bindparams(sqlalchemy.bindparam('city_ids', expanding=True)),
+        connect_to_sql(), 'weather', params, chunksize=mem.CHUNK_ROWS)
+    
+    # --- LOAD-FORECAST OF THE CHUNK
+    customerload_add = ld.format_load_total(cities, population, weather,
+                                            airports, flights, None, workers)
+    # Drop stored values, stored keys are compared chunk by chunk
+    for customerload_db in dbs.iter_query(sqlalchemy.text("""
+            SELECT city_id, ltime FROM customerload
+            WHERE city_id IN :city_ids AND ltime >= :t0
+            """).bindparams(sqlalchemy.bindparam('city_ids', expanding=True)),
+            connect_to_sql(), 'customerload', params, chunksize=mem.CHUNK_ROWS):
+        customerload_add = append_by_condition(customerload_add, customerload_db,
+                                               ['city_id','ltime'])
+    
+    # --- WRITE BEFORE THE NEXT CHUNK IS READ
+    chg.append(connect_to_sql(), 'customerload', customerload_add)
+    update_load_bands(cities, population, weather,
+                      ld.get_seat_counts(flights, airports))
+    rollups.refresh_affected(connect_to_sql(), 'customerload', customerload_add)
+    if customerload_add.shape[0]>0:
+        api.bump_version(connect_to_sql())
+    return customerload_add.shape[0]
+
+
+# =============================================================================
+# RETENTION
+# Monthly partitions, daily rollups of expired rows, partition drops
+# Retention per table in db_retention.RETENTION (override: {table: months})
+# =============================================================================
+def update_retention(retention=None):
+    print(">>>>>Updating Retention...")
+    ret.run_retention(connect_to_sql(), retention)
+    print(">>>>>Retention updated.")
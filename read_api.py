@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Cached read-API for customerload forecasts (endpoint get_load in main.py).
+
+Usage:
+    GET ...?city=Cologne,Paris&t0=2026-10-21&t1=2026-10-23&include=weather,flights
+        city:    comma-separated city names (default: all)
+        t0, t1:  time range [t0, t1) (default: current 3h-slot + 48h)
+        include: additional columns (weather, flights, bands)
+    -> JSON-list of rows city, ltime, flightload, baseload, weatherfac
+       (+ temp, rain, rain_prob, windspeed / flights, seats, passengers /
+        p10, p50, p90 of the total load)
+
+    handle(con, args, if_none_match)
+        -> (body, status, headers) with ETag and Cache-Control.
+           Answers 304 if the client already has the current version.
+    bump_version(con)
+        -> Marks customerload as changed (called by update_load after writes).
+
+Notes:
+    Results are kept in an LRU-cache (CACHE_SIZE queries) per instance.
+    The cache is tied to the version of customerload in data_versions.
+    The version is checked at most every VERSION_CHECK_SECONDS, so new load
+    values show up on all instances shortly after update_load committed.
+
+"""
+
+import json
+import time
+import hashlib
+import pandas as pd
+from collections import OrderedDict
+from sqlalchemy import text, bindparam
+
+
+# Max. cached queries per instance
+CACHE_SIZE = 256
+# Cache-Control max-age for clients/CDN in seconds
+MAX_AGE = 300
+# Seconds between checks of data_versions
+VERSION_CHECK_SECONDS = 30
+# Default range in hours (from the current 3h-slot on)
+DEFAULT_HOURS = 48
+# Optional parts of the answer
+INCLUDES = ['weather','flights','bands']
+
+# --- INSTANCE STATE
+# {query-key: JSON-body} of the current version, oldest first
+_cache = OrderedDict()
+# Last known version of customerload and time of the check
+_version = {'value':None, 'checked':0.0}
+
+
+# =============================================================================
+# DATA VERSION (CHANGES WHENEVER update_load WROTE NEW ROWS)
+# =============================================================================
+def bump_version(con, name='customerload'):
+    with con.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO data_versions (name, version, updated)
+            VALUES (:name, 1, UTC_TIMESTAMP())
+            ON DUPLICATE KEY UPDATE version = version + 1, updated = VALUES(updated)
+            """), {'name':name})
+    # Same instance -> no need to wait for the next check
+    clear()
+
+
+def current_version(con, name='customerload'):
+    if time.monotonic()-_version['checked']>VERSION_CHECK_SECONDS:
+        res = pd.read_sql(text("SELECT version FROM data_versions WHERE name = :name"),
+                          con=con, params={'name':name})
+        version = int(res['version'].iloc[0]) if res.shape[0]>0 else 0
+        if version!=_version['value']:
+            # Older versions are never served again
+            _cache.clear()
+        _version['value'] = version
+        _version['checked'] = time.monotonic()
+    return _version['value']
+
+
+def clear():
+    _cache.clear()
+    _version['checked'] = 0.0
+
+
+# =============================================================================
+# REQUEST PARAMETERS
+# Returns (cities, t0, t1, include), cities None = all
+# =============================================================================
+def parse_args(args):
+    cities = args.get('city')
+    cities = sorted(set(c.strip() for c in cities.split(',') if c.strip())) if cities else None
+    t0 = args.get('t0')
+    t0 = pd.Timestamp(t0) if t0 else pd.Timestamp.utcnow().tz_localize(None).floor('3H')
+    t1 = args.get('t1')
+    t1 = pd.Timestamp(t1) if t1 else t0 + pd.Timedelta(hours=DEFAULT_HOURS)
+    include = args.get('include')
+    include = sorted(set(include.split(',')) & set(INCLUDES)) if include else []
+    if t1<=t0:
+        raise ValueError("t1 must be after t0.")
+    return cities, t0, t1, include
+
+
+# =============================================================================
+# QUERY CUSTOMERLOAD (+ WEATHER AND FLIGHT SUMMARIES)
+# =============================================================================
+def query_load(con, cities, t0, t1, include):
+    columns = ["c.city","l.ltime","l.flightload","l.baseload","l.weatherfac"]
+    joins = []
+    if 'weather' in include:
+        columns += ["w.temp","w.rain","w.rain_prob","w.windspeed"]
+        joins.append("LEFT JOIN weather w ON w.city_id = l.city_id AND w.wtime = l.ltime")
+    if 'bands' in include:
+        columns += ["b.p10","b.p50","b.p90"]
+        joins.append("LEFT JOIN customerload_bands b ON b.city_id = l.city_id AND b.ltime = l.ltime")
+    if 'flights' in include:
+        # passengers_hourly summed up to the 3h-slots of customerload
+        columns += ["p.flights","p.seats","p.passengers"]
+        joins.append("""LEFT JOIN (
+                SELECT city_id,
+                       TIMESTAMPADD(HOUR, -(HOUR(phour) % 3), phour) AS slot,
+                       SUM(flights) AS flights, SUM(seats) AS seats,
+                       SUM(passengers) AS passengers
+                FROM passengers_hourly
+                WHERE phour >= :t0 AND phour < :t1
+                GROUP BY city_id, slot
+            ) p ON p.city_id = l.city_id AND p.slot = l.ltime""")
+    query = f"""
+        SELECT {', '.join(columns)}
+        FROM customerload l
+        JOIN cities c ON c.city_id = l.city_id
+        {' '.join(joins)}
+        WHERE l.ltime >= :t0 AND l.ltime < :t1
+        {'AND c.city IN :cities' if cities else ''}
+        ORDER BY c.city, l.ltime
+        """
+    params = {'t0':t0.to_pydatetime(), 't1':t1.to_pydatetime()}
+    query = text(query)
+    if cities:
+        query = query.bindparams(bindparam('cities', expanding=True))
+        params['cities'] = cities
+    return pd.read_sql(query, con=con, params=params, parse_dates=['ltime'])
+
+
+# =============================================================================
+# ANSWER A REQUEST (FROM CACHE IF POSSIBLE)
+# =============================================================================
+def handle(con, args, if_none_match=None):
+    try:
+        cities, t0, t1, include = parse_args(args)
+    except ValueError as e:
+        return json.dumps({'error':str(e)}), 400, {'Content-Type':'application/json'}
+    key = json.dumps([cities, str(t0), str(t1), include])
+    version = current_version(con)
+    etag = '"' + hashlib.sha1(f"{version}:{key}".encode()).hexdigest()[:20] + '"'
+    headers = {'ETag':etag,
+               'Cache-Control':f"public, max-age={MAX_AGE}"}
+    # --- CLIENT HAS CURRENT VERSION
+    if if_none_match==etag:
+        return '', 304, headers
+    # --- LRU-CACHE
+    if key in _cache:
+        _cache.move_to_end(key)
+        body = _cache[key]
+    else:
+        res = query_load(con, cities, t0, t1, include)
+        body = res.to_json(orient='records', date_format='iso')
+        _cache[key] = body
+        if len(_cache)>CACHE_SIZE:
+            _cache.popitem(last=False)
+    headers['Content-Type'] = 'application/json'
+    return body, 200, headers
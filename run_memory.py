@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Memory ceiling and peak memory per pipeline stage.
+
+Usage:
+    tracked(stage, func)
+        -> Wraps a stage-function, prints its peak memory (RSS) when done.
+    chunk_size(n_done, peak_mb, base_mb)
+        -> Number of cities for the next chunk of a streamed stage, so the
+           peak stays below MEMORY_CEILING_MB. A chunk above the ceiling halves
+           the next one, MemoryError if a single city is above it.
+    check_ceiling(stage)
+        -> MemoryError if the process is above the ceiling. Called before
+           every chunk of a streamed stage.
+
+    The memory-bounded mode of update_load is switched on by the environment
+    variable MEMORY_STREAMING=1, the ceiling by MEMORY_CEILING_MB (default:
+    80% of the 512 MB of the Cloud Function). Memory is bounded by the
+    number of cities per chunk: the flights and weather of a chunk are held
+    completely, stored load-keys are streamed.
+
+Notes:
+    Peak memory is sampled every SAMPLE_SECONDS in a background thread
+    (resident set size from /proc, max-RSS of the process as fallback).
+
+"""
+
+import os
+import time
+import resource
+import threading
+
+
+# Streamed (memory-bounded) mode of large stages
+STREAMING = os.environ.get('MEMORY_STREAMING', '0')=='1'
+# Ceiling in MB
+MEMORY_CEILING_MB = int(os.environ.get('MEMORY_CEILING_MB', 410))
+# Rows per fetch of the server-side cursor
+CHUNK_ROWS = 50000
+# Cities of the first chunk (next chunks are sized by the measured memory)
+FIRST_CHUNK = 8
+# Sampling interval of the peak-monitor
+SAMPLE_SECONDS = 0.05
+
+# --- PEAKS OF THE LAST RUN {stage: MB}
+peaks = {}
+
+
+# =============================================================================
+# CURRENT MEMORY OF THE PROCESS (RSS IN MB)
+# =============================================================================
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages*os.sysconf('SC_PAGE_SIZE')/2**20
+    except (OSError, ValueError):
+        # Max-RSS in kB (Linux) -> not current, but an upper bound
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/2**10
+
+
+# =============================================================================
+# RUN A FUNCTION AND SAMPLE ITS PEAK MEMORY
+# Returns (result, peak in MB)
+# =============================================================================
+def measure(func, *args, **kwargs):
+    peak = [rss_mb()]
+    stop = threading.Event()
+    def sample():
+        while not stop.wait(SAMPLE_SECONDS):
+            peak[0] = max(peak[0], rss_mb())
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        res = func(*args, **kwargs)
+    finally:
+        stop.set()
+        sampler.join()
+        peak[0] = max(peak[0], rss_mb())
+    return res, peak[0]
+
+
+# =============================================================================
+# WRAP A STAGE: PRINT (AND KEEP) ITS PEAK MEMORY
+# =============================================================================
+def tracked(stage, func):
+    def run(*args, **kwargs):
+        base = rss_mb()
+        t = time.perf_counter()
+        res, peak = measure(func, *args, **kwargs)
+        peaks[stage] = peak
+        print(f"[memory] {stage}: peak {peak:.0f} MB (start {base:.0f} MB, "
+              f"ceiling {MEMORY_CEILING_MB} MB), {time.perf_counter()-t:.1f} s")
+        return res
+    return run
+
+
+# =============================================================================
+# STOP IF ABOVE CEILING
+# (Fails the stage before the Cloud Function is killed at its memory limit)
+# =============================================================================
+def check_ceiling(stage, ceiling_mb=None):
+    ceiling_mb = ceiling_mb or MEMORY_CEILING_MB
+    current = rss_mb()
+    if current>ceiling_mb:
+        raise MemoryError(f"{stage}: {current:.0f} MB above ceiling of "
+                          f"{ceiling_mb} MB.")
+    return current
+
+
+# =============================================================================
+# CITIES FOR THE NEXT CHUNK
+# n_done:  cities of the last chunk
+# peak_mb: peak memory of the last chunk
+# base_mb: memory before the last chunk
+# =============================================================================
+def chunk_size(n_done, peak_mb, base_mb, ceiling_mb=None):
+    ceiling_mb = ceiling_mb or MEMORY_CEILING_MB
+    if peak_mb>ceiling_mb:
+        if n_done<=1:
+            raise MemoryError(f"Peak of {peak_mb:.0f} MB for a single city is "
+                              f"above the ceiling of {ceiling_mb} MB.")
+        print(f"---! Peak of {peak_mb:.0f} MB above ceiling of {ceiling_mb} MB, "
+              f"halving the chunk !---")
+        return max(1, n_done//2)
+    per_city = max(peak_mb-base_mb, 1)/max(n_done, 1)
+    # Keep 20% headroom below the ceiling
+    free = 0.8*ceiling_mb - base_mb
+    return max(1, int(free/per_city))
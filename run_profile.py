@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+On-demand profiling of pipeline stages (cProfile and tracemalloc).
+
+Usage:
+    ...update_database?profile=load,flights   -> profile these stages
+    ...update_database?profile=all            -> profile all stages
+    Environment variable PROFILE (same values) switches it on for every run.
+
+    configure(stages)
+        -> Sets the profiled stages of this run (request parameter, PROFILE
+           otherwise). Call once at the beginning of update_database.
+    profiled(stage, func)
+        -> Wraps a stage-function in cProfile and tracemalloc if the stage is
+           profiled, returns func unchanged otherwise.
+    read_profile(path)
+        -> pstats.Stats of a written profile, e.g.
+           read_profile('profile_20261022T1200_load.prof.gz')
+               .sort_stats('cumulative').print_stats(30)
+
+    Per stage and run two files are written to PROFILE_DIR:
+        profile_<run>_<stage>.prof.gz    compressed cProfile statistics
+        profile_<run>_<stage>.alloc.txt  peak traced memory, TOP_N allocations
+                                         (by line) and TOP_N functions (by
+                                         cumulative time)
+
+Notes:
+    Without profiling nothing is wrapped, so there is no overhead.
+    cProfile only sees the thread of the stage, work in thread or process
+    pools (backfill, sharded load model) shows up as waiting time.
+    tracemalloc roughly doubles the runtime of allocation-heavy code, so
+    profiled runs are slower than usual.
+
+"""
+
+import io
+import os
+import gzip
+import time
+import pstats
+import marshal
+import cProfile
+import tempfile
+import tracemalloc
+
+
+# Stages to profile in every run ('all' or comma-separated stages)
+PROFILE = os.environ.get('PROFILE', '')
+# Directory of the profiles (local path, e.g. a mounted bucket)
+PROFILE_DIR = os.environ.get('PROFILE_DIR',
+                             os.path.join(tempfile.gettempdir(), 'profiles'))
+# Lines of the reports
+TOP_N = 25
+# Frames per allocation traceback
+FRAMES = 1
+
+# --- IN-RUN STATE
+# Profiled stages (None = all) and name of the run
+_run = {'stages':set(), 'name':None}
+
+
+# =============================================================================
+# PROFILED STAGES OF THIS RUN
+# =============================================================================
+def configure(stages=None):
+    stages = stages or PROFILE
+    _run['name'] = time.strftime('%Y%m%dT%H%M%S', time.gmtime())
+    if stages in ('1','all'):
+        _run['stages'] = None
+    else:
+        _run['stages'] = set(s.strip() for s in stages.split(',') if s.strip())
+    if _run['stages'] is None or len(_run['stages'])>0:
+        print(f"[profile] Profiling {stages} -> {PROFILE_DIR}")
+
+
+def is_profiled(stage):
+    return _run['stages'] is None or stage in _run['stages']
+
+
+# =============================================================================
+# WRAP A STAGE
+# =============================================================================
+def profiled(stage, func):
+    if not is_profiled(stage):
+        return func
+    def run(*args, **kwargs):
+        profile = cProfile.Profile()
+        started = tracemalloc.is_tracing()
+        if not started:
+            tracemalloc.start(FRAMES)
+        try:
+            profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                peak = tracemalloc.get_traced_memory()[1]
+                snapshot = tracemalloc.take_snapshot()
+        finally:
+            if not started:
+                tracemalloc.stop()
+            try:
+                write_reports(stage, profile, snapshot, peak)
+            except OSError as e:
+                print(f"---! Profile of {stage} not written: {e} !---")
+    return run
+
+
+# =============================================================================
+# WRITE PROFILE AND REPORT
+# =============================================================================
+def write_reports(stage, profile, snapshot, peak):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"profile_{_run['name']}_{stage}")
+    profile.create_stats()
+    with gzip.open(path+'.prof.gz', 'wb') as f:
+        f.write(marshal.dumps(profile.stats))
+
+    # --- TOP-N ALLOCATIONS AND FUNCTIONS
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap*>')])
+    allocations = snapshot.statistics('lineno')
+    total = sum(a.size for a in allocations)
+    out = io.StringIO()
+    out.write(f"Stage {stage}, run {_run['name']}, "
+              f"peak traced memory {peak/2**20:.1f} MB\n\n")
+    out.write(f"Top {TOP_N} allocations still held at the end of the stage "
+              f"(total {total/2**20:.1f} MB):\n")
+    for a in allocations[:TOP_N]:
+        out.write(f"{a.size/2**20:10.2f} MB {a.count:10d} blocks  "
+                  f"{a.traceback[0].filename}:{a.traceback[0].lineno}\n")
+    out.write(f"\nTop {TOP_N} functions (cumulative time):\n")
+    pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(TOP_N)
+    with open(path+'.alloc.txt', 'w') as f:
+        f.write(out.getvalue())
+
+    # --- SHORT SUMMARY FOR THE LOG
+    summary = io.StringIO()
+    pstats.Stats(profile, stream=summary).sort_stats('cumulative').print_stats(5)
+    print(f"[profile] {stage}: {path}.prof.gz, peak {peak/2**20:.1f} MB, "
+          f"{total/2**20:.1f} MB held\n"
+          + summary.getvalue().strip())
+
+
+# =============================================================================
+# READ A WRITTEN PROFILE
+# =============================================================================
+def read_profile(path):
+    stats = pstats.Stats()
+    with gzip.open(path, 'rb') as f:
+        stats.stats = marshal.loads(f.read())
+    stats.get_top_level_stats()
+    return stats
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Reference tables (cities, population, airports) read once per pipeline run.
+
+Usage:
+    start_run()
+        -> Starts a run, reference tables are read on first use from now on.
+           Call once at the beginning of update_database.
+    get(con, table)
+        -> Reference table with schema-dtypes (db_schema.read_table). Read
+           from the database once per run, the same frame is returned to
+           all later stages (don't modify it in place).
+    append(con, table, rows)
+        -> Writes new rows to the database and adds them to the frame of the
+           run (write-through), so later stages see them without reading the
+           table again. Keys set by MySQL (city_id) are read back for the new
+           rows only.
+
+Notes:
+    Outside of a run (backfill, notebooks) get() always reads the table and
+    append() only writes.
+
+"""
+
+import pandas as pd
+from sqlalchemy import text, bindparam
+# ---
+import db_schema as dbs
+
+
+# Tables kept per run
+TABLES = ['cities','population','airports']
+# Keys generated by MySQL {table: (generated key, natural key)}
+GENERATED = {'cities':('city_id','city')}
+
+# --- IN-RUN STATE
+_run = {'active':False}
+# {table: DataFrame}
+_tables = {}
+
+
+# =============================================================================
+# START A RUN (DROPS THE TABLES OF THE LAST RUN)
+# =============================================================================
+def start_run():
+    _tables.clear()
+    _run['active'] = True
+
+
+# =============================================================================
+# READ ONCE PER RUN
+# =============================================================================
+def get(con, table):
+    if not _run['active'] or table not in TABLES:
+        return dbs.read_table(table, con=con)
+    if table not in _tables:
+        _tables[table] = dbs.read_table(table, con=con)
+    else:
+        print(f"{table}: {_tables[table].shape[0]} rows from run memo.")
+    return _tables[table]
+
+
+# =============================================================================
+# WRITE-THROUGH
+# =============================================================================
+def append(con, table, rows):
+    rows.to_sql(table,
+                if_exists='append',
+                con=con,
+                index=False)
+    if not _run['active'] or table not in _tables or rows.shape[0]==0:
+        return rows
+    if table in GENERATED:
+        # Read new rows back to get their generated keys
+        key, natural = GENERATED[table]
+        query = (text(f"SELECT * FROM {table} WHERE {natural} IN :values")
+                 .bindparams(bindparam('values', expanding=True)))
+        rows = pd.read_sql(query, con=con, params={
+            'values':list(pd.unique(rows[natural].astype(object)))})
+    # Dynamic categories of both frames differ -> cast again after concat
+    _tables[table] = dbs.apply_schema(
+        pd.concat([_tables[table], rows], ignore_index=True), table)
+    return rows
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the usage-ledger and budget of metered APIs (api_quota.py).
+
+"""
+
+import pytest
+# ---
+import api_quota as quota
+import app_context as ctx
+import get_flightsdata as fd
+import db_checkpoints as ckpt
+import db_refresh as refresh
+import db_leases as lease
+import run_tables as tbl
+import main
+
+
+class Response:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self.payload = payload or {}
+
+    def json(self):
+        return self.payload
+
+
+class Session:
+    # AeroDataBox answering every request with "quota exceeded"
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        return Response(429, {'message':'Too many requests'})
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    quota.reset()
+    quota._pending.clear()
+    yield
+    quota.reset()
+    quota._pending.clear()
+
+
+# =============================================================================
+# BUDGET AND EXHAUSTION
+# =============================================================================
+def test_429_stops_calls_of_the_run():
+    quota.record_call('aerodatabox', 'flights/airports/iata', Response(429))
+    assert not quota.allow_call('aerodatabox')
+    assert quota._pending[('aerodatabox','flights/airports/iata')]==[1, 1]
+
+
+def test_budget_is_spent_by_calls():
+    quota.set_budget('aerodatabox', 1)
+    assert quota.allow_call('aerodatabox')
+    quota.record_call('aerodatabox', 'flights/airports/iata', Response(200))
+    assert not quota.allow_call('aerodatabox')
+
+
+def test_reset_keeps_unflushed_calls():
+    quota.set_budget('aerodatabox', 0)
+    quota.record_call('aerodatabox', 'flights/airports/iata', Response(429))
+    quota.reset()
+    assert quota.allow_call('aerodatabox')
+    assert quota._pending[('aerodatabox','flights/airports/iata')]==[1, 1]
+
+
+# =============================================================================
+# WARM INSTANCE: NEXT RUN AFTER A 429 CALLS THE API AGAIN
+# =============================================================================
+def test_next_run_after_429_calls_api_again(monkeypatch):
+    session = Session()
+    monkeypatch.setattr(ctx, 'get_session', lambda name: session)
+    monkeypatch.setattr(ctx, 'get_secret', lambda name: 'key')
+    # --- RUN WITHOUT DATABASE: ONLY THE FLIGHTS-STAGE IS DUE
+    monkeypatch.setattr(ckpt, 'start_run', lambda con: None)
+    monkeypatch.setattr(ckpt, 'run_stage',
+                        lambda con, stage, func, *args: func(*args) or 'done')
+    monkeypatch.setattr(tbl, 'get', lambda con, table: {'city':main.cities})
+    monkeypatch.setattr(refresh, 'get_due', lambda con, stages, *args, **kwargs: ['flights'])
+    monkeypatch.setattr(refresh, 'mark_success', lambda con, stage, now=None: None)
+    monkeypatch.setattr(lease, 'acquire', lambda con, name, wait=0: True)
+    monkeypatch.setattr(lease, 'release', lambda name: None)
+
+    def update_flights(timeframe=12):
+        # Two requests per run, the second one is skipped after the 429
+        for iata in ['CGN','DUS']:
+            fd.get_flights('2026-10-19T00:00', '2026-10-19T12:00', iata)
+    monkeypatch.setattr(main, 'update_flights', update_flights)
+
+    main.run_update(None, con=None)
+    assert session.calls==1
+    main.run_update(None, con=None)
+    assert session.calls==2
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the LOAD DATA LOCAL INFILE bulk path (db_bulk.py), without MySQL.
+
+"""
+
+import io
+import time
+import pytest
+import numpy as np
+import pandas as pd
+import pymysql
+from sqlalchemy.exc import DBAPIError
+# ---
+import db_bulk as bulk
+import db_changes as chg
+
+
+class Connection:
+    # MySQL with local_infile=OFF: every LOAD DATA LOCAL is refused
+    def __init__(self, log):
+        self.log = log
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def begin(self):
+        return self
+
+    def execute(self, statement, params=None):
+        sql = ' '.join(str(statement).split())
+        self.log.append(sql)
+        if sql.startswith('LOAD DATA'):
+            raise DBAPIError(sql, params, pymysql.err.OperationalError(
+                3948, 'Loading local data is disabled'))
+
+
+class Engine:
+    def __init__(self):
+        self.log = []
+
+    def connect(self):
+        return Connection(self.log)
+
+    def begin(self):
+        return Connection(self.log)
+
+
+@pytest.fixture(autouse=True)
+def clean_state(monkeypatch):
+    monkeypatch.setitem(bulk._refused, 'at', None)
+    monkeypatch.setattr(bulk, 'BULK_MIN_ROWS', 2)
+
+
+def rows():
+    return pd.DataFrame({'city_id':[1,2],
+                         'ltime':pd.to_datetime(['2026-10-19 09:00','2026-10-19 12:00']),
+                         'baseload':[10,20]})
+
+
+# =============================================================================
+# TSV IN THE DEFAULT FORMAT OF LOAD DATA
+# =============================================================================
+def test_tsv_escapes_text_and_writes_null():
+    f = io.StringIO()
+    bulk.to_tsv(pd.DataFrame({'name':['a\tb', 'c\\d\ne', None],
+                              'value':[1.5, np.nan, 3.0],
+                              'time':pd.to_datetime(['2026-10-19 09:00', None,
+                                                     '2026-10-19 12:30'])}), f)
+    assert f.getvalue()==('a\\tb\t1.5\t2026-10-19 09:00:00\n'
+                          'c\\\\d\\ne\t\\N\t\\N\n'
+                          '\\N\t3.0\t2026-10-19 12:30:00\n')
+
+
+# =============================================================================
+# REFUSED LOAD DATA LOCAL
+# =============================================================================
+def test_refusal_falls_back_to_inserts():
+    engine = Engine()
+    assert chg.upsert(engine, 'customerload', rows(), ['baseload'])==2
+    writes = [sql.split()[0] for sql in engine.log
+              if sql.startswith(('LOAD', 'INSERT INTO customerload'))]
+    assert writes==['LOAD','INSERT']
+
+
+def test_refusal_switches_bulk_path_off_until_retry(monkeypatch):
+    engine = Engine()
+    assert bulk.load_data(engine, 'customerload', rows()) is None
+    assert not bulk.use_bulk(rows())
+    # Later writes go to multi-row INSERTs directly
+    engine.log.clear()
+    chg.upsert(engine, 'customerload', rows(), ['baseload'])
+    assert not any(sql.startswith('LOAD DATA') for sql in engine.log)
+    # Tried again after RETRY_SECONDS
+    now = time.time()+bulk.RETRY_SECONDS+1
+    monkeypatch.setattr(bulk.time, 'time', lambda: now)
+    assert bulk.use_bulk(rows())
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the row-hash change detection (db_changes.py) on SQLite, with flights
+parsed from AeroDataBox-responses (no API-calls).
+
+"""
+
+import re
+import time
+import pytest
+import pandas as pd
+import sqlalchemy
+# ---
+import app_context as ctx
+import get_flightsdata as fd
+import db_dimensions as dim
+import db_changes as chg
+
+
+class Response:
+    status_code = 200
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+
+class Session:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def get(self, url, **kwargs):
+        return Response(self.payload)
+
+
+def departure(number, revised=None, terminal='1'):
+    movement = {'scheduledTime':{'utc':'2026-10-19 10:00Z'}, 'terminal':terminal}
+    if revised is not None:
+        movement['revisedTime'] = {'utc':revised}
+    return {'number':number, 'movement':movement,
+            'aircraft':{'model':'Airbus A320'},
+            'airline':{'name':'Eurowings'},
+            'codeshareStatus':'IsOperator'}
+
+
+@pytest.fixture
+def engine():
+    engine = sqlalchemy.create_engine('sqlite://')
+    # MySQL-upsert -> SQLite-replace (rows are written completely)
+    @sqlalchemy.event.listens_for(engine, 'before_cursor_execute', retval=True)
+    def upsert(conn, cursor, statement, params, context, executemany):
+        if 'ON DUPLICATE KEY' in statement:
+            statement = (re.sub(r'ON DUPLICATE KEY UPDATE.*', '', statement, flags=re.S)
+                         .replace('INSERT INTO', 'INSERT OR REPLACE INTO'))
+        return statement, params
+    with engine.begin() as conn:
+        conn.exec_driver_sql("""CREATE TABLE airlines (
+            airline_id INTEGER PRIMARY KEY AUTOINCREMENT, airline TEXT UNIQUE)""")
+        conn.exec_driver_sql("""CREATE TABLE aircraft_types (
+            aircraft_id INTEGER PRIMARY KEY AUTOINCREMENT, aircraft TEXT UNIQUE,
+            typ_config INT)""")
+        conn.exec_driver_sql("""CREATE TABLE flights_fact (
+            iata TEXT, ftype TEXT, fnumber TEXT, scheduled_time DATETIME,
+            revised_time DATETIME, terminal TEXT, aircraft_id INT, airline_id INT,
+            codeshares TEXT, row_hash BIGINT,
+            PRIMARY KEY (iata, fnumber, scheduled_time))""")
+    dim.clear_cache()
+    yield engine
+    dim.clear_cache()
+
+
+@pytest.fixture
+def fetch(monkeypatch):
+    # Flights of CGN as the ingest gets them (get_flights -> flights_fact-rows)
+    monkeypatch.setattr(ctx, 'get_secret', lambda name: 'key')
+    monkeypatch.setitem(ctx._reference, 'aircraftinfo', (time.time(), pd.DataFrame(
+        {'name':['Airbus A320'], 'typ. config.':[174.0]})))
+    def fetch(con, departures):
+        monkeypatch.setattr(ctx, 'get_session', lambda name: Session(
+            {'departures':departures, 'arrivals':[]}))
+        flights = (fd.get_flights('2026-10-19T00:00', '2026-10-19T12:00', 'CGN')
+                   .rename(columns={'number':'fnumber',
+                                    'type':'ftype',
+                                    'typ. config.':'typ_config'}))
+        return dim.encode_flights(flights, con=con)
+    return fetch
+
+
+# =============================================================================
+# REVISED TIME FROM THE API
+# =============================================================================
+def test_revised_time_is_parsed(engine, fetch):
+    flights = fetch(engine, [departure('EW 1', revised='2026-10-19 10:25Z'),
+                             departure('EW 2')])
+    assert flights['revised_time'].tolist()[0]==pd.Timestamp('2026-10-19 10:25')
+    assert pd.isna(flights['revised_time'].tolist()[1])
+
+
+# =============================================================================
+# ONLY NEW AND CHANGED ROWS ARE WRITTEN
+# =============================================================================
+def test_unchanged_rows_are_not_written(engine, fetch):
+    departures = [departure('EW 1', revised='2026-10-19 10:25Z'), departure('EW 2')]
+    assert chg.write_changes(engine, 'flights_fact', fetch(engine, departures)).shape[0]==2
+    assert chg.write_changes(engine, 'flights_fact', fetch(engine, departures)).shape[0]==0
+
+
+def test_changed_revised_time_is_updated(engine, fetch):
+    chg.write_changes(engine, 'flights_fact', fetch(engine, [
+        departure('EW 1', revised='2026-10-19 10:25Z'), departure('EW 2')]))
+    # Only the revised time of EW 1 changes
+    written = chg.write_changes(engine, 'flights_fact', fetch(engine, [
+        departure('EW 1', revised='2026-10-19 11:05Z'), departure('EW 2')]))
+    assert written['fnumber'].astype(str).tolist()==['EW 1']
+    assert written['revised_time'].iloc[0]==pd.Timestamp('2026-10-19 11:05')
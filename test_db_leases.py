@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the run leases (db_leases.py), without MySQL.
+
+"""
+
+import threading
+import pytest
+# ---
+import db_leases as lease
+
+
+class Server:
+    # Named locks of MySQL: GET_LOCK is re-entrant per connection (session)
+    # only, another connection waits and gets 0
+    def __init__(self):
+        self.locks = {}
+        self.ids = 0
+        self.mutex = threading.Lock()
+
+    def connect(self):
+        self.ids += 1
+        return Connection(self, self.ids)
+
+
+class Result:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+class Connection:
+    def __init__(self, server, cid):
+        self.server = server
+        self.id = cid
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+    def execute(self, statement, params):
+        sql = str(statement)
+        locks = self.server.locks
+        with self.server.mutex:
+            if sql.startswith("SELECT GET_LOCK"):
+                if locks.get(params['name'], (self.id,))[0]!=self.id:
+                    return Result(0)
+                depth = locks.get(params['name'], (self.id, 0))[1]
+                locks[params['name']] = (self.id, depth+1)
+                return Result(1)
+            if sql.startswith("SELECT RELEASE_LOCK"):
+                cid, depth = locks[params['name']]
+                if depth>1:
+                    locks[params['name']] = (cid, depth-1)
+                else:
+                    del locks[params['name']]
+                return Result(1)
+            if sql.startswith("SELECT IS_USED_LOCK"):
+                return Result(locks.get(params['name'], (None,))[0])
+        raise NotImplementedError(sql)
+
+    def close(self):
+        # Closing the session frees its locks
+        with self.server.mutex:
+            for name in [n for n, (cid, _) in self.server.locks.items() if cid==self.id]:
+                del self.server.locks[name]
+
+
+@pytest.fixture
+def server():
+    lease._held.clear()
+    yield Server()
+    lease._held.clear()
+
+
+def in_thread(func, *args):
+    out = []
+    thread = threading.Thread(target=lambda: out.append(func(*args)))
+    thread.start()
+    thread.join()
+    return out[0]
+
+
+def test_second_request_does_not_get_run_lease(server):
+    assert lease.acquire(server, 'run')
+    # Concurrent request of the same instance
+    assert not in_thread(lease.acquire, server, 'run')
+    lease.release('run')
+    assert in_thread(lease.acquire, server, 'run')
+
+
+def test_other_thread_cannot_release_lease(server):
+    assert lease.acquire(server, 'run')
+    in_thread(lease.release, 'run')
+    assert lease.holder(server, 'run') is not None
+    assert not in_thread(lease.acquire, server, 'run')
+    lease.release('run')
+    assert lease.holder(server, 'run') is None
+
+
+def test_lease_is_reentrant_within_thread(server):
+    assert lease.acquire(server, 'run')
+    assert lease.acquire(server, 'run')
+    lease.release('run')
+    assert not in_thread(lease.acquire, server, 'run')
+    lease.release('run')
+    assert lease.holder(server, 'run') is None
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the refresh policies (db_refresh.py) over a day of hourly runs of
+main.run_update, on SQLite and a simulated clock.
+
+"""
+
+import re
+import types
+import pytest
+import pandas as pd
+import sqlalchemy
+# ---
+import main
+import db_checkpoints as ckpt
+import db_refresh as refresh
+import db_leases as lease
+import run_tables as tbl
+
+# Scheduler fires a few seconds after the full hour
+START = pd.Timestamp('2026-10-19 00:00:20')
+# Realistic durations of the stages
+DURATIONS = {'cities':pd.Timedelta(seconds=5),
+             'population':pd.Timedelta(seconds=20),
+             'airports':pd.Timedelta(minutes=1),
+             'weather':pd.Timedelta(seconds=90),
+             'flights':pd.Timedelta(minutes=6),
+             'load':pd.Timedelta(minutes=4),
+             'retention':pd.Timedelta(minutes=2)}
+
+
+@pytest.fixture
+def engine():
+    engine = sqlalchemy.create_engine('sqlite://')
+    # MySQL-upsert -> SQLite-replace (rows are written completely)
+    @sqlalchemy.event.listens_for(engine, 'before_cursor_execute', retval=True)
+    def upsert(conn, cursor, statement, params, context, executemany):
+        if 'ON DUPLICATE KEY' in statement:
+            statement = (re.sub(r'ON DUPLICATE KEY UPDATE.*', '', statement, flags=re.S)
+                         .replace('INSERT INTO', 'INSERT OR REPLACE INTO'))
+        return statement, params
+    with engine.begin() as conn:
+        conn.exec_driver_sql("""CREATE TABLE stage_refresh (
+            stage TEXT PRIMARY KEY, last_success DATETIME NOT NULL)""")
+    return engine
+
+
+@pytest.fixture
+def schedule(monkeypatch):
+    clock = {'now':START}
+    runs = []
+
+    def start_run(con):
+        window = ckpt.get_run_window(clock['now'])
+        if window!=ckpt._window:
+            ckpt._state.clear()
+        ckpt._window = window
+        return window
+
+    def mark(con, stage, unit=ckpt.STAGE, status='done', message=None):
+        ckpt._state[(stage, str(unit))] = status
+
+    def stage(name):
+        def func(*args):
+            runs[-1].append(name)
+            clock['now'] += DURATIONS[name]
+        return func
+
+    monkeypatch.setattr(ckpt, 'start_run', start_run)
+    monkeypatch.setattr(ckpt, 'mark', mark)
+    monkeypatch.setattr(ckpt, '_window', None)
+    monkeypatch.setattr(ckpt, '_state', {})
+    monkeypatch.setattr(tbl, 'get', lambda con, table: {'city':main.cities})
+    monkeypatch.setattr(lease, 'acquire', lambda con, name, wait=0: True)
+    monkeypatch.setattr(lease, 'release', lambda name: None)
+    for name in DURATIONS:
+        monkeypatch.setattr(main, f"update_{name}", stage(name))
+    return clock, runs
+
+
+def test_hourly_runs_keep_stages_on_their_ttl(engine, schedule):
+    clock, runs = schedule
+    for hour in range(24):
+        # Some jitter of the scheduler
+        clock['now'] = START+pd.Timedelta(hours=hour, seconds=(hour*7)%40)
+        runs.append([])
+        main.run_update(None, engine)
+    count = {name:sum(name in run for run in runs) for name in DURATIONS}
+    assert count['flights']==24
+    assert count['weather']==8
+    assert count['load']==24
+    assert count['retention']==1
+    assert count['airports']==1
+
+
+def test_stage_done_in_window_keeps_refresh_time(engine, schedule, monkeypatch):
+    clock, runs = schedule
+    runs.append([])
+    main.run_update(None, engine)
+    stamped = refresh.get_last_success(engine)
+    # Rerun within the window (e.g. after a timeout) with the stage forced
+    marked = []
+    monkeypatch.setattr(refresh, 'mark_success',
+                        lambda con, stage, now=None: marked.append(stage))
+    runs.append([])
+    main.run_update(types.SimpleNamespace(args={'force':'flights'}), engine)
+    assert runs[-1]==[]
+    assert marked==[]
+    assert refresh.get_last_success(engine)==stamped
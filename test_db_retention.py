@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the retention (db_retention.py): only the rows of expired partitions
+are rolled up, without MySQL.
+
+"""
+
+import pytest
+import pandas as pd
+# ---
+import db_retention as ret
+import db_rollups as rollups
+
+NOW = pd.Timestamp('2026-10-19 03:00')
+
+
+class Connection:
+    def __init__(self, log):
+        self.log = log
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, statement, params=None):
+        self.log.append(str(statement))
+
+
+class Engine:
+    def __init__(self):
+        self.log = []
+
+    def begin(self):
+        return Connection(self.log)
+
+
+@pytest.fixture
+def rolled(monkeypatch):
+    calls = []
+    monkeypatch.setattr(rollups, 'refresh_all',
+                        lambda con, source, t1, t0=None: calls.append((t0, t1)))
+    return calls
+
+
+def partitions(monkeypatch, uppers):
+    uppers = pd.to_datetime(uppers)
+    parts = pd.DataFrame({'name':['pmax' if pd.isna(u) else
+                                  ret.partition_name(u-pd.DateOffset(months=1))
+                                  for u in uppers],
+                          'upper':uppers})
+    monkeypatch.setattr(ret, 'get_partitions', lambda con, table: parts)
+
+
+def test_nothing_expired_scans_nothing(monkeypatch, rolled):
+    partitions(monkeypatch, ['2026-08-01','2026-09-01','2026-10-01','2026-11-01',None])
+    con = Engine()
+    assert ret.expire_table(con, 'weather', 3, NOW)==[]
+    assert rolled==[]
+    assert con.log==[]
+
+
+def test_rollup_is_bounded_by_expired_partitions(monkeypatch, rolled):
+    partitions(monkeypatch, ['2026-06-01','2026-07-01','2026-08-01','2026-09-01',None])
+    con = Engine()
+    names = ret.expire_table(con, 'weather', 3, NOW)
+    assert names==['p202605','p202606']
+    assert rolled==[(None, pd.Timestamp('2026-07-01'))]
+    assert con.log==["ALTER TABLE weather DROP PARTITION p202605, p202606"]
+
+
+def test_unpartitioned_table_rolls_up_last_month(monkeypatch, rolled):
+    monkeypatch.setattr(ret, 'get_partitions',
+                        lambda con, table: pd.DataFrame(columns=['name','upper']))
+    assert ret.expire_table(Engine(), 'weather', 3, NOW)==[]
+    assert rolled==[(pd.Timestamp('2026-06-01'), pd.Timestamp('2026-07-01'))]
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the flight ingest (get_flightsdata.py), without API-calls.
+
+"""
+
+import time
+import pytest
+import requests
+import numpy as np
+import pandas as pd
+# ---
+import get_flightsdata as fd
+import app_context as ctx
+import api_quota as quota
+
+
+def make_rows(rows):
+    columns = list(fd.init_flights_df().columns)+['codeshare_status']
+    return pd.DataFrame(rows, columns=columns)
+
+
+def flight(number, status, **kwargs):
+    row = {'iata':'CGN', 'type':'departures', 'number':number,
+           'scheduled_time':'2026-10-19 08:00Z', 'aircraft':'Airbus A320',
+           'terminal':'1', 'airline':'Airline', 'codeshare_status':status}
+    row.update(kwargs)
+    return row
+
+
+# =============================================================================
+# CODESHARES
+# =============================================================================
+def test_codeshares_collapse_to_operator():
+    flights = fd.collapse_codeshares(make_rows([
+        flight('XX 2', 'IsCodeshared'),
+        flight('EW 1', 'IsOperator'),
+        flight('YY 3', 'IsCodeshared')]))
+    assert list(flights['number'])==['EW 1']
+    assert flights['codeshares'].iloc[0]=='XX 2,YY 3'
+
+
+def test_codeshares_with_missing_keys_are_kept():
+    # Without aircraft/terminal equal rows may be different flights
+    flights = fd.collapse_codeshares(make_rows([
+        flight('EW 1', 'Unknown', aircraft=np.nan),
+        flight('LH 7', 'Unknown', aircraft=np.nan),
+        flight('FR 5', 'Unknown', terminal=np.nan, aircraft=np.nan)]))
+    assert sorted(flights['number'])==['EW 1','FR 5','LH 7']
+    assert flights['codeshares'].isna().all()
+
+
+# =============================================================================
+# AIRPORT SEARCH BY API (LOCATION NOT IN THE OFFLINE REFERENCE)
+# =============================================================================
+class Response:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+
+class Session:
+    def __init__(self, answer):
+        self.answer = answer
+
+    def get(self, url, **kwargs):
+        if isinstance(self.answer, Exception):
+            raise self.answer
+        return self.answer
+
+
+@pytest.fixture
+def search(monkeypatch):
+    monkeypatch.setattr(ctx, 'get_secret', lambda name: 'key')
+    monkeypatch.setattr(fd.time, 'sleep', lambda seconds: None)
+    monkeypatch.setitem(ctx._reference, 'airport_searches', (time.time(), {}))
+    quota.reset()
+    quota._pending.clear()
+    def search(answer):
+        monkeypatch.setattr(ctx, 'get_session', lambda name: Session(answer))
+        # Middle of the Atlantic: no airport in the reference
+        return fd.get_airports(0.0, -30.0)
+    yield search
+    quota.reset()
+    quota._pending.clear()
+
+
+def test_airport_search_network_error_is_counted(search):
+    with pytest.raises(RuntimeError):
+        search(requests.ConnectionError('connection reset'))
+    assert quota._pending[('aerodatabox','airports/search/location')]==[1, 1]
+
+
+def test_airport_search_quota_exceeded(search):
+    with pytest.raises(RuntimeError):
+        search(Response(429, {'message':'Too many requests'}))
+    assert not quota.allow_call('aerodatabox')
+
+
+def test_airport_search_without_airports(search):
+    airports = search(Response(200, {'items':[]}))
+    assert airports.shape[0]==0
+    assert {'iata','location.lat','location.lon'}<=set(airports.columns)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the load simulation (get_loaddata.py) against the existing model.
+
+"""
+
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pytest
+# ---
+import get_loaddata as ld
+
+
+@pytest.fixture
+def inputs():
+    cities = pd.DataFrame({'city_id':[1,2], 'city':['Berlin','Hamburg']})
+    population = pd.DataFrame({'city_id':[1,2],
+                               'pyear':datetime.now().year,
+                               'population':[3_700_000,1_900_000]})
+    airports = pd.DataFrame({'iata':['BER','HAM'], 'city_id':[1,2]})
+    flights = pd.DataFrame({
+        'iata':['BER','BER','BER','HAM','HAM','BER'],
+        'scheduled_time':pd.to_datetime(['2024-05-01 06:10','2024-05-01 07:40',
+                                         '2024-05-01 13:05','2024-05-01 09:30',
+                                         '2024-05-01 13:15','2024-05-01 19:55']),
+        'typ_config':[180,np.nan,220,150,np.nan,96]})
+    wtime = pd.date_range('2024-05-01', periods=8, freq='3H')
+    # No forecast for Hamburg after 12:00 -> NaN load
+    weather = pd.DataFrame({
+        'wtime':np.concatenate([wtime,wtime[:4]]),
+        'city_id':[1]*8+[2]*4,
+        'rain':np.linspace(0,6,12),
+        'rain_prob':np.linspace(0,1,12),
+        'temp_feel':np.linspace(2,25,12),
+        'windspeed':np.linspace(1,10,12)})
+    return cities, population, weather, airports, flights
+
+
+def test_single_scenario_matches_load_total(inputs, monkeypatch):
+    cities, population, weather, airports, flights = inputs
+    seed = 7
+    # Same parameters for both models
+    for name in ld.SEEDED:
+        monkeypatch.setattr(getattr(ld, name), '__defaults__', (seed,))
+    x, y = ld.baseload_points(seed)
+    ratio = ld.get_flightload_ratio(seed)
+    monkeypatch.setattr(ld, 'draw_scenarios',
+                        lambda n, seed=None: (np.array([ratio]), x[None], y[None]))
+
+    expected = (ld.get_load_total(cities, population, weather, airports,
+                                  flights.copy())
+                .merge(cities, on='city', how='left'))
+    bands = ld.simulate_load(cities, population, weather,
+                             ld.get_seat_counts(flights, airports), n=1)
+
+    res = expected.merge(bands, on=['city_id','ltime'], how='outer',
+                         validate='1:1', indicator=True)
+    assert (res['_merge']=='both').all()
+    assert res['total_load'].isna().any()
+    for name in ld.QUANTILES:
+        np.testing.assert_allclose(res[name], res['total_load'], rtol=1e-9)
+
+
+def test_scenarios_shift_hours_like_baseload_points():
+    _, x, _ = ld.draw_scenarios(500, seed=1)
+    points = np.array([ld.baseload_points(seed)[0] for seed in range(500)])
+    shifts = np.unique(x-ld.BASE_X)
+    assert set(shifts)=={-1,0}
+    assert set(np.unique(points-ld.BASE_X))==set(shifts)
+
+
+def test_sharded_load_matches_load_total(inputs):
+    cities, population, weather, airports, flights = inputs
+    expected = ld.get_load_total(cities, population, weather, airports,
+                                 flights.copy())
+    res = ld.get_load_total_sharded(cities, population, weather, airports,
+                                    flights.copy(), workers=2)
+    pd.testing.assert_frame_equal(res, expected, check_dtype=False)
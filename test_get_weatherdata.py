@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the weather forecast cache (get_weatherdata.py), without API-calls.
+
+"""
+
+import pandas as pd
+# ---
+import get_weatherdata as wd
+import db_refresh as refresh
+
+
+def forecast(fetched):
+    # 5d/3h-forecast as returned by the API (unix times)
+    times = pd.date_range(fetched.ceil('3H'), periods=wd.FORECAST_STEPS, freq='3H')
+    return [{'dt':int(t.timestamp())} for t in times]
+
+
+def test_cache_outlives_refresh_of_weather_stage():
+    assert wd.WEATHER_TTL_HOURS>refresh.POLICIES['weather']['ttl_hours']
+
+
+def test_scheduled_runs_are_served_from_cache():
+    # Weather-stage is due every 3h, the API is asked every WEATHER_TTL_HOURS
+    t0 = pd.Timestamp('2026-10-19 00:00')
+    interval = pd.Timedelta(hours=refresh.POLICIES['weather']['ttl_hours'])
+    entry, calls = None, 0
+    for now in pd.date_range(t0, t0+pd.Timedelta(hours=23), freq=interval):
+        if not wd.is_fresh(entry, now, now+pd.Timedelta(hours=48)):
+            entry = (now, forecast(now))
+            calls += 1
+    assert calls==24//wd.WEATHER_TTL_HOURS
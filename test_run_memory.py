@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the memory ceiling of streamed stages (run_memory.py).
+
+"""
+
+import pytest
+import pandas as pd
+# ---
+import main
+import run_memory as mem
+
+
+def test_chunk_size_follows_measured_memory():
+    # 10 MB per city, 328 MB usable below 80% of the ceiling
+    assert mem.chunk_size(4, 140, 100, ceiling_mb=410)==22
+
+
+def test_chunk_above_ceiling_is_halved():
+    assert mem.chunk_size(8, 450, 100, ceiling_mb=410)==4
+
+
+def test_single_city_above_ceiling_fails():
+    with pytest.raises(MemoryError):
+        mem.chunk_size(1, 450, 100, ceiling_mb=410)
+
+
+def test_check_ceiling_fails_above_ceiling():
+    assert mem.check_ceiling('load', ceiling_mb=10**6)>0
+    with pytest.raises(MemoryError):
+        mem.check_ceiling('load', ceiling_mb=1)
+
+
+def test_streamed_load_stops_above_ceiling(monkeypatch):
+    cities = pd.DataFrame({'city_id':range(12), 'city':[f"City {i}" for i in range(12)]})
+    monkeypatch.setattr(main, 'connect_to_sql', lambda: None)
+    monkeypatch.setattr(main.tbl, 'get', lambda con, table: cities)
+    # Memory is not given back after the first chunk
+    rss = [100]
+    def update_load_chunk(chunk, *args):
+        rss[0] = 500
+        return 0
+    monkeypatch.setattr(main, 'update_load_chunk', update_load_chunk)
+    monkeypatch.setattr(mem, 'rss_mb', lambda: rss[0])
+    monkeypatch.setattr(mem, 'MEMORY_CEILING_MB', 410)
+    with pytest.raises(MemoryError):
+        main.update_load_streamed()